@@ -0,0 +1,204 @@
+# benchmark.py - Benchmark de los endpoints de analytics
+#
+# Ejecuta cada vista de analytics/urls.py contra datasets sintéticos de tamaño
+# creciente (presets de receipts.datasets) y mide latencia (p50/p95/max),
+# número de queries y pico de memoria (tracemalloc). Con varios presets estima
+# el exponente de escalado de cada endpoint (pendiente log-log de la latencia
+# frente al número de productos): ~0 constante, ~1 lineal, >1 superlineal.
+#
+# Los resultados se comparan con una baseline JSON (presupuesto): las queries
+# no pueden crecer y la latencia/memoria tienen una tolerancia relativa. Las
+# queries se cuentan en todas las bases de datos (shards, réplica), y además
+# de la baseline hay un techo fijo por petición (QUERY_BUDGET) y no pueden
+# crecer con el tamaño del dataset: un N+1 no se acepta aunque esté en la
+# baseline.
+
+import json
+import math
+import statistics
+import time
+import tracemalloc
+from contextlib import ExitStack
+from pathlib import Path
+
+from django.db import connections, reset_queries
+from django.test import Client
+from django.test.utils import CaptureQueriesContext
+
+from receipts.datasets import PRESETS, generate_preset, ensure_users, clear
+
+BASELINE_PATH = Path(__file__).resolve().parent / 'benchmark_baseline.json'
+
+# (nombre, método, ruta, parámetros GET o cuerpo JSON)
+ENDPOINTS = [
+    ('spending_trend', 'GET', '/api/analytics/spending-trend/', {'period': 'monthly'}),
+    ('compare_prices', 'GET', '/api/analytics/compare-prices/', {'product_name': 'Leche'}),
+    ('top_products', 'GET', '/api/analytics/top-products/', {}),
+    ('price_changes', 'GET', '/api/analytics/price-changes/', {'product_name': 'Leche Entera'}),
+    ('cheapest_basket', 'POST', '/api/analytics/cheapest-basket/', {'products': [
+        {'name': 'Leche Entera', 'quantity': 2},
+        {'name': 'Pan de Molde', 'quantity': 1},
+        {'name': 'Aceite de Oliva', 'quantity': 1},
+        {'name': 'Huevos', 'quantity': 1},
+        {'name': 'Tomate Frito', 'quantity': 3},
+    ]}),
+    ('supermarket_ranking', 'GET', '/api/analytics/supermarket-ranking/', {}),
+    ('dashboard_overview', 'GET', '/api/analytics/dashboard-overview/', {}),
+    ('monthly_comparison', 'GET', '/api/analytics/monthly-comparison/', {}),
+    ('price_trends', 'GET', '/api/analytics/price-trends/', {}),
+    ('supermarket_savings', 'GET', '/api/analytics/supermarket-savings/', {}),
+]
+
+# Tolerancias del presupuesto frente a la baseline
+LATENCY_TOLERANCE = 1.0  # hasta 2x el p50 (el ruido entre máquinas es grande)
+LATENCY_SLACK_MS = 5.0  # margen absoluto para endpoints muy rápidos
+MEMORY_TOLERANCE = 0.25
+# Queries por petición a partir de las cuales un endpoint se marca como
+# sospechoso de N+1, esté o no en la baseline
+QUERY_BUDGET = 15
+
+
+def _request(client, method, path, params):
+    if method == 'GET':
+        return client.get(path, params)
+    return client.post(path, json.dumps(params), content_type='application/json')
+
+
+def _percentile(values, p):
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(p * len(ordered)))]
+
+
+def measure_endpoint(client, method, path, params, iterations):
+    """Mide un endpoint: latencias, queries y pico de memoria"""
+    # Calentamiento (caches de Django, compilación de queries...)
+    response = _request(client, method, path, params)
+    if response.status_code >= 400:
+        raise RuntimeError(f'{method} {path} devolvió {response.status_code}: {response.content[:200]!r}')
+
+    # queries_log es un deque acotado: vaciarlo para que el conteo sea exacto
+    reset_queries()
+    with ExitStack() as stack:
+        captured = {alias: stack.enter_context(CaptureQueriesContext(connections[alias])) for alias in connections}
+        _request(client, method, path, params)
+    queries_by_alias = {alias: len(queries) for alias, queries in captured.items() if len(queries)}
+
+    tracemalloc.start()
+    _request(client, method, path, params)
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    latencies = []
+    for _ in range(iterations):
+        start = time.perf_counter()
+        _request(client, method, path, params)
+        latencies.append((time.perf_counter() - start) * 1000)
+
+    return {
+        'p50_ms': round(statistics.median(latencies), 3),
+        'p95_ms': round(_percentile(latencies, 0.95), 3),
+        'max_ms': round(max(latencies), 3),
+        'queries': sum(queries_by_alias.values()),
+        'queries_by_alias': queries_by_alias,
+        'peak_kb': round(peak / 1024, 1),
+    }
+
+
+def run(presets, iterations=5, client=None, log=print):
+    """Ejecuta todos los endpoints sobre cada preset y devuelve los resultados
+
+    Cada preset se genera desde cero (los datasets son deterministas) para un
+    único usuario, con cuya sesión se hacen las peticiones.
+    """
+    client = client or Client()
+    owner = ensure_users(1, prefix='benchmark')[0]
+    client.force_login(owner)
+    results = {}
+    for preset in presets:
+        clear()
+        start = time.perf_counter()
+        counts = generate_preset(preset, owners=[owner])
+        log(f"Preset '{preset}': {counts['receipts']} recibos, {counts['products']} productos "
+            f"(generado en {time.perf_counter() - start:.1f}s)")
+
+        endpoints = {}
+        for name, method, path, params in ENDPOINTS:
+            endpoints[name] = measure_endpoint(client, method, path, params, iterations)
+            stats = endpoints[name]
+            log(f"  {name:<22} p50={stats['p50_ms']:>9.2f}ms p95={stats['p95_ms']:>9.2f}ms "
+                f"queries={stats['queries']:>5} peak={stats['peak_kb']:>9.1f}KB")
+        results[preset] = {'products': counts['products'], 'receipts': counts['receipts'], 'endpoints': endpoints}
+    return results
+
+
+def scaling(results):
+    """Exponente de escalado por endpoint entre el preset menor y el mayor"""
+    presets = sorted(results, key=lambda p: results[p]['products'])
+    if len(presets) < 2:
+        return {}
+    low, high = results[presets[0]], results[presets[-1]]
+    size_ratio = math.log(high['products'] / low['products'])
+
+    curves = {}
+    for name in high['endpoints']:
+        low_ms = max(low['endpoints'][name]['p50_ms'], 0.001)
+        high_ms = max(high['endpoints'][name]['p50_ms'], 0.001)
+        exponent = math.log(high_ms / low_ms) / size_ratio
+        curves[name] = {
+            'latency_exponent': round(exponent, 2),
+            'queries': [results[p]['endpoints'][name]['queries'] for p in presets],
+            'class': 'constante' if exponent < 0.3 else 'sublineal' if exponent < 0.8
+            else 'lineal' if exponent < 1.2 else 'superlineal',
+        }
+    return curves
+
+
+def check_queries(results, budget=QUERY_BUDGET):
+    """Endpoints sospechosos de N+1: por encima del techo o con queries que crecen con el dataset"""
+    violations = []
+    presets = sorted(results, key=lambda p: results[p]['products'])
+    for name in results[presets[0]]['endpoints'] if presets else ():
+        queries = [results[p]['endpoints'][name]['queries'] for p in presets]
+        if max(queries) > budget:
+            violations.append(f"{name}: {max(queries)} queries > {budget} por petición")
+        elif queries[-1] > queries[0]:
+            violations.append(f"{name}: las queries crecen con el tamaño del dataset {queries}")
+    return violations
+
+
+def check_budget(results, baseline, latency_tolerance=LATENCY_TOLERANCE):
+    """Compara con la baseline y devuelve la lista de presupuestos excedidos
+
+    Las queries son deterministas y no admiten tolerancia; la latencia sí.
+    """
+    violations = []
+    for preset, data in results.items():
+        budget = baseline.get(preset, {}).get('endpoints', {})
+        for name, stats in data['endpoints'].items():
+            if name not in budget:
+                continue
+            expected = budget[name]
+            if stats['queries'] > expected['queries']:
+                violations.append(f"{preset}/{name}: {stats['queries']} queries > {expected['queries']}")
+            latency_limit = expected['p50_ms'] * (1 + latency_tolerance) + LATENCY_SLACK_MS
+            if stats['p50_ms'] > latency_limit:
+                violations.append(f"{preset}/{name}: p50 {stats['p50_ms']}ms > {latency_limit:.2f}ms")
+            memory_limit = expected['peak_kb'] * (1 + MEMORY_TOLERANCE)
+            if stats['peak_kb'] > memory_limit:
+                violations.append(f"{preset}/{name}: pico {stats['peak_kb']}KB > {memory_limit:.1f}KB")
+    return violations
+
+
+def load_baseline(path=BASELINE_PATH):
+    path = Path(path)
+    if not path.exists():
+        return {}
+    return json.loads(path.read_text())
+
+
+def save_baseline(results, path=BASELINE_PATH):
+    Path(path).write_text(json.dumps(results, indent=2, sort_keys=True) + '\n')
+
+
+def available_presets():
+    return list(PRESETS)
@@ -0,0 +1,221 @@
+# columnar.py - Snapshot columnar de los recibos de cada usuario en arrays NumPy
+#
+# Los productos del usuario se cargan una vez en arrays contiguos (una columna
+# por campo, con el recibo desnormalizado: fecha y supermercado). Producto y
+# supermercado son los ids enteros de las dimensiones de catalog (entidad de
+# producto y Supermarket), así que los nombres con errores de OCR del mismo
+# producto ya llegan agrupados.
+# Así los group-by, min/max/media y "último por grupo" de las vistas de
+# analytics son operaciones vectorizadas en lugar de bucles sobre filas del ORM.
+#
+# Frescura: cada petición lee las filas nuevas de ReceiptChange (una consulta
+# indexada) y recarga solo los recibos afectados; un reinicio o demasiados
+# cambios recargan el snapshot entero. Se lee de donde lee el resto de
+# analytics (read_db_for: la réplica, o la principal/el shard tras una
+# escritura reciente del usuario); cambiar de alias reconstruye el snapshot. Los precios son los céntimos de
+# Product.price_cents (int64), así que las sumas son exactas.
+#
+# Los snapshots viven en memoria del proceso (LRU de ANALYTICS_SNAPSHOT_MAX_USERS).
+
+import threading
+import time
+from collections import OrderedDict
+from datetime import date
+
+import numpy as np
+from django.conf import settings
+from django.db.models import Max, Q
+
+from backendgrocerylyzer import metrics
+from backendgrocerylyzer.db.sharding import read_db_for
+from catalog.products import entity_names
+from catalog.supermarkets import canonical_name
+from receipts.changes import CHANGE_RETENTION_SECONDS
+from receipts.models import Product, ReceiptChange
+
+# Con más recibos cambiados que esta fracción, recargar entero sale más barato
+RELOAD_FRACTION = 0.2
+# Reconstruir aunque no haya cambios, antes de que se borren del registro
+# (receipts.changes.prune_changes) cambios que el snapshot aún no ha aplicado
+MAX_AGE_SECONDS = CHANGE_RETENTION_SECONDS // 2
+
+
+class ColumnarSnapshot:
+    """Productos de un usuario como columnas NumPy, ordenados por id (inmutable)"""
+
+    def __init__(self, alias, seq, names, columns, built_at=None):
+        self.alias = alias
+        self.seq = seq
+        self.names = names  # id de entidad -> nombre de producto
+        self.id = columns['id']
+        self.receipt_id = columns['receipt_id']
+        self.name = columns['name']  # id de ProductEntity
+        self.price = columns['price']  # céntimos
+        self.quantity = columns['quantity']
+        self.weighed = columns['weighed']  # A peso: el precio es el importe de la línea
+        self.date = columns['date']  # ordinal de la fecha del recibo
+        self.market = columns['market']  # id de Supermarket
+        self.built_at = built_at or time.monotonic()
+
+    def __len__(self):
+        return len(self.id)
+
+    @staticmethod
+    def encode(rows):
+        """Convierte filas (id, receipt_id, entidad, precio, cantidad, fecha, supermercado, a peso) en columnas"""
+        count = len(rows)
+        columns = {
+            'id': np.fromiter((r[0] for r in rows), dtype=np.int64, count=count),
+            'receipt_id': np.fromiter((r[1] for r in rows), dtype=np.int64, count=count),
+            'name': np.fromiter((r[2] for r in rows), dtype=np.int64, count=count),
+            'price': np.fromiter((r[3] for r in rows), dtype=np.int64, count=count),
+            'quantity': np.fromiter((r[4] for r in rows), dtype=np.int32, count=count),
+            'date': np.fromiter((r[5].toordinal() for r in rows), dtype=np.int32, count=count),
+            'market': np.fromiter((r[6] for r in rows), dtype=np.int32, count=count),
+            'weighed': np.fromiter((r[7] for r in rows), dtype=np.bool_, count=count),
+        }
+        return columns
+
+    def replace_receipts(self, receipt_ids, rows, seq):
+        """Nuevo snapshot sin los productos de ``receipt_ids`` y con ``rows`` añadidas"""
+        keep = ~np.isin(self.receipt_id, np.fromiter(receipt_ids, dtype=np.int64, count=len(receipt_ids)))
+        added = self.encode(rows)
+        names = {**self.names, **entity_names({r[2] for r in rows})}
+        columns = {}
+        for field, values in added.items():
+            columns[field] = np.concatenate([getattr(self, field)[keep], values])
+        order = np.argsort(columns['id'], kind='stable')
+        columns = {field: values[order] for field, values in columns.items()}
+        return ColumnarSnapshot(self.alias, seq, names, columns, self.built_at)
+
+    # Consultas
+
+    def rows_matching(self, text, weighed=True):
+        """Índices (en orden de id) de los productos cuyo nombre contiene ``text`` (sin mayúsculas)
+
+        Con ``weighed=False`` se excluyen los productos a peso (para comparar precios unitarios).
+        """
+        text = text.lower()
+        entities = [entity_id for entity_id, name in self.names.items() if text in name.lower()]
+        if not entities:
+            return np.empty(0, dtype=np.int64)
+        matches = np.isin(self.name, entities)
+        if not weighed:
+            matches &= ~self.weighed
+        return np.flatnonzero(matches)
+
+    def market_name(self, supermarket_id):
+        return canonical_name(int(supermarket_id))
+
+    def present_markets(self):
+        """Ids de los supermercados con productos, ordenados por nombre"""
+        return sorted(np.unique(self.market).tolist(), key=canonical_name)
+
+
+def group_by(keys):
+    """Agrupa por ``keys``: (orden, claves únicas, inicio de cada grupo en el orden)
+
+    El orden es estable: dentro de cada grupo se conserva el orden original.
+    """
+    order = np.argsort(keys, kind='stable')
+    unique, starts = np.unique(keys[order], return_index=True)
+    return order, unique, starts
+
+
+def latest_per_group(keys, dates, ids):
+    """Índice de la fila más reciente de cada grupo: (claves únicas, índices)
+
+    Con varias filas de la misma fecha gana la de mayor id (la última registrada).
+    """
+    if not len(keys):
+        return keys, np.empty(0, dtype=np.int64)
+    order = np.lexsort((ids, dates, keys))
+    sorted_keys = keys[order]
+    last = np.flatnonzero(np.append(sorted_keys[1:] != sorted_keys[:-1], True))
+    return sorted_keys[last], order[last]
+
+
+def format_date(ordinal):
+    return date.fromordinal(int(ordinal)).strftime('%Y-%m-%d')
+
+
+_lock = threading.Lock()
+_user_locks = {}
+_snapshots = OrderedDict()
+
+
+def _user_lock(user_id):
+    with _lock:
+        return _user_locks.setdefault(user_id, threading.Lock())
+
+
+def _product_rows(alias, user_id, receipt_ids=None):
+    products = Product.objects.using(alias).filter(receipt__owner_id=user_id)
+    if receipt_ids is not None:
+        products = products.filter(receipt_id__in=receipt_ids)
+    return list(products.order_by('id').values_list(
+        'id', 'receipt_id', 'entity_id', 'price_cents', 'quantity', 'receipt__date', 'receipt__supermarket_id',
+        'weighed',
+    ))
+
+
+def _changes(alias, user_id):
+    return ReceiptChange.objects.using(alias).filter(Q(user_id=user_id) | Q(user_id__isnull=True))
+
+
+def _build(alias, user_id):
+    start = time.perf_counter()
+    # El número de secuencia se lee antes que los datos: lo que cambie mientras
+    # se carga se volverá a aplicar en el siguiente refresco
+    seq = _changes(alias, user_id).aggregate(seq=Max('id'))['seq'] or 0
+    rows = _product_rows(alias, user_id)
+    names = entity_names({r[2] for r in rows})
+    snapshot = ColumnarSnapshot(alias, seq, names, ColumnarSnapshot.encode(rows))
+    metrics.observe('analytics.snapshot.build_ms', (time.perf_counter() - start) * 1000)
+    return snapshot
+
+
+def _refresh(snapshot, user_id):
+    changes = list(_changes(snapshot.alias, user_id).filter(id__gt=snapshot.seq).values_list('id', 'receipt_id'))
+    if not changes:
+        return snapshot
+    seq = max(change_id for change_id, _ in changes)
+    receipt_ids = {receipt_id for _, receipt_id in changes}
+    if None in receipt_ids or len(receipt_ids) > RELOAD_FRACTION * max(1, len(np.unique(snapshot.receipt_id))):
+        return _build(snapshot.alias, user_id)
+
+    start = time.perf_counter()
+    rows = _product_rows(snapshot.alias, user_id, receipt_ids)
+    refreshed = snapshot.replace_receipts(receipt_ids, rows, seq)
+    metrics.observe('analytics.snapshot.refresh_ms', (time.perf_counter() - start) * 1000)
+    return refreshed
+
+
+def snapshot_for(user):
+    """Snapshot columnar actualizado de los productos de ``user``"""
+    alias = read_db_for(user)
+    with _user_lock(user.pk):
+        with _lock:
+            snapshot = _snapshots.get(user.pk)
+        if (
+            snapshot is None
+            or snapshot.alias != alias
+            or time.monotonic() - snapshot.built_at > MAX_AGE_SECONDS
+        ):
+            snapshot = _build(alias, user.pk)
+        else:
+            snapshot = _refresh(snapshot, user.pk)
+
+        with _lock:
+            _snapshots[user.pk] = snapshot
+            _snapshots.move_to_end(user.pk)
+            while len(_snapshots) > settings.ANALYTICS_SNAPSHOT_MAX_USERS:
+                evicted, _ = _snapshots.popitem(last=False)
+                _user_locks.pop(evicted, None)
+    return snapshot
+
+
+def reset():
+    """Descarta todos los snapshots del proceso"""
+    with _lock:
+        _snapshots.clear()
@@ -0,0 +1,74 @@
+from django.core.management.base import BaseCommand, CommandError
+from django.test.runner import DiscoverRunner
+from django.test.utils import setup_test_environment, teardown_test_environment
+from analytics import benchmark
+import json
+
+class Command(BaseCommand):
+    help = 'Benchmark de los endpoints de analytics con curvas de escalado y presupuesto de queries/latencia'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--presets', nargs='+', default=['tiny', 'small'], choices=benchmark.available_presets(),
+            help='Presets de receipts.datasets a medir (de menor a mayor)'
+        )
+        parser.add_argument('--iterations', type=int, default=5, help='Repeticiones medidas por endpoint')
+        parser.add_argument('--baseline', default=str(benchmark.BASELINE_PATH), help='Fichero JSON de baseline')
+        parser.add_argument('--update-baseline', action='store_true', help='Guardar los resultados como nueva baseline')
+        parser.add_argument(
+            '--latency-tolerance', type=float, default=benchmark.LATENCY_TOLERANCE,
+            help='Margen relativo permitido sobre el p50 de la baseline (1.0 = hasta el doble)'
+        )
+        parser.add_argument('--output', help='Guardar también los resultados completos en este JSON')
+
+    def handle(self, *args, **options):
+        # Base de datos de test aislada: nunca se tocan los datos reales
+        setup_test_environment()
+        runner = DiscoverRunner(verbosity=0, interactive=False)
+        old_config = runner.setup_databases()
+        try:
+            results = benchmark.run(options['presets'], options['iterations'], log=self.stdout.write)
+        finally:
+            runner.teardown_databases(old_config)
+            teardown_test_environment()
+
+        curves = benchmark.scaling(results)
+        if curves:
+            self.stdout.write('\nEscalado de latencia (exponente log-log respecto a nº de productos):')
+            for name, curve in sorted(curves.items(), key=lambda item: -item[1]['latency_exponent']):
+                self.stdout.write(
+                    f"  {name:<22} {curve['latency_exponent']:>5}  {curve['class']:<12} queries={curve['queries']}"
+                )
+
+        if options['output']:
+            with open(options['output'], 'w') as f:
+                json.dump({'results': results, 'scaling': curves}, f, indent=2)
+
+        # Un N+1 no puede quedar aceptado en la baseline
+        flagged = benchmark.check_queries(results)
+        for violation in flagged:
+            self.stderr.write(f'  ✗ {violation}')
+
+        if options['update_baseline']:
+            if flagged:
+                raise CommandError(f'{len(flagged)} endpoints por encima del presupuesto de queries: no se guarda la baseline')
+            baseline = benchmark.load_baseline(options['baseline'])
+            baseline.update(results)
+            benchmark.save_baseline(baseline, options['baseline'])
+            self.stdout.write(self.style.SUCCESS(f"Baseline actualizada en {options['baseline']}"))
+            return
+
+        baseline = benchmark.load_baseline(options['baseline'])
+        if not baseline:
+            self.stdout.write(self.style.WARNING('No hay baseline: ejecuta con --update-baseline para crearla'))
+            if flagged:
+                raise CommandError(f'{len(flagged)} endpoints por encima del presupuesto de queries')
+            return
+
+        violations = flagged + benchmark.check_budget(results, baseline, options['latency_tolerance'])
+        if violations:
+            for violation in violations[len(flagged):]:
+                self.stderr.write(f'  ✗ {violation}')
+            raise CommandError(f'{len(violations)} presupuestos excedidos respecto a la baseline')
+
+        self.stdout.write(self.style.SUCCESS('✅ Todos los endpoints dentro del presupuesto'))
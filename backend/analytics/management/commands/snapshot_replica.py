@@ -0,0 +1,24 @@
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from backendgrocerylyzer.db import replica
+import time
+
+class Command(BaseCommand):
+    help = 'Copiar la base de datos principal sobre la réplica de lectura de analytics'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--interval', type=int, default=0,
+            help=f'Repetir cada N segundos (0 = una sola copia; sugerido {settings.ANALYTICS_REPLICA_SNAPSHOT_INTERVAL})'
+        )
+
+    def handle(self, *args, **options):
+        if not settings.ANALYTICS_REPLICA_ALIAS:
+            raise CommandError('No hay réplica configurada (definir GROCERYLYZER_ANALYTICS_REPLICA=<ruta>)')
+
+        while True:
+            duration_ms = replica.snapshot()
+            self.stdout.write(f'Réplica actualizada en {duration_ms:.0f}ms')
+            if not options['interval']:
+                return
+            time.sleep(options['interval'])
@@ -1,3 +1,51 @@
-from django.test import TestCase
+import json
+from datetime import date
+from unittest import mock
+
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.core.cache.backends.filebased import FileBasedCache
+from django.test import TestCase, override_settings
+from django.urls import reverse
+
+from backendgrocerylyzer.db import replica
+from receipts.models import Product, Receipt
+
+
+@override_settings(ANALYTICS_REPLICA_ALIAS='replica')
+class RecentWriteTests(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user('ryw', password='x')
+        self.key = replica._recent_write_key(self.user.pk)
+        self.addCleanup(replica._ryw_cache().delete, self.key)
+
+    def test_mark_is_visible_from_other_workers(self):
+        replica.mark_recent_write(self.user)
+        # Otro worker: su propia instancia de la caché sobre los mismos ficheros
+        location = settings.CACHES[settings.ANALYTICS_REPLICA_RYW_CACHE]['LOCATION']
+        self.assertTrue(FileBasedCache(location, {}).get(self.key))
+
+    def test_mark_pins_reads_to_primary(self):
+        with mock.patch.object(replica, 'replica_available', return_value=True):
+            self.assertEqual(replica.read_alias_for(self.user), 'replica')
+            replica.mark_recent_write(self.user)
+            self.assertIsNone(replica.read_alias_for(self.user))
+
+
+class CheapestBasketTests(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user('basket', password='x')
+        self.client.force_login(self.user)
+        receipt = Receipt.objects.create(owner=self.user, supermarket_name='Dia', date=date(2025, 6, 1), total_cents=0)
+        for name, cents in (('Pan', 10), ('Sal', 20), ('Agua', 70)):
+            Product.objects.create(name=name, price_cents=cents, quantity=1, receipt=receipt)
+
+    def test_totals_are_exact(self):
+        products = [{'name': 'pan', 'quantity': 3}, {'name': 'sal', 'quantity': 1}, {'name': 'agua', 'quantity': 1}]
+        response = self.client.post(reverse('api_cheapest_basket'), json.dumps({'products': products}),
+                                    content_type='application/json')
+        basket = response.json()['cheapest_complete_basket']
+        # En euros de coma flotante, 0.1 * 3 + 0.2 + 0.7 = 1.2000000000000002
+        self.assertEqual(basket['total_cost'], 1.2)
+        self.assertEqual([item['total_price'] for item in basket['products_detail']], [0.3, 0.2, 0.7])
 
-# Create your tests here.
@@ -6,10 +6,19 @@ from django.db.models import Sum, Avg, Count, Max, Min, Q
 from django.db.models.functions import TruncMonth, TruncWeek, TruncYear, TruncDay
 from datetime import datetime, timedelta
 from receipts.models import Receipt, Product
+from users.decorators import api_login_required
+from backendgrocerylyzer.db.replica import analytics_read
+from backendgrocerylyzer.money import to_euros
+from catalog.products import entity_name, entity_names
+from catalog.supermarkets import canonical_name
+from .columnar import snapshot_for, group_by, latest_per_group, format_date
 from collections import defaultdict
 import json
+import numpy as np
 
 @require_http_methods(["GET"])
+@api_login_required
+@analytics_read
 def get_spending_trend(request):
     """API endpoint para obtener tendencias de gasto por período"""
     period = request.GET.get('period', 'monthly')  # monthly, weekly, yearly
@@ -17,28 +26,28 @@ def get_spending_trend(request):
     try:
         if period == 'monthly':
             # Agrupar por mes
-            trends = Receipt.objects.annotate(
+            trends = Receipt.objects.for_user(request.user).annotate(
                 period=TruncMonth('date')
             ).values('period').annotate(
-                total_spending=Sum('total_amount'),
+                total_spending=Sum('total_cents'),
                 receipt_count=Count('id')
             ).order_by('period')
             
         elif period == 'weekly':
             # Agrupar por semana
-            trends = Receipt.objects.annotate(
+            trends = Receipt.objects.for_user(request.user).annotate(
                 period=TruncWeek('date')
             ).values('period').annotate(
-                total_spending=Sum('total_amount'),
+                total_spending=Sum('total_cents'),
                 receipt_count=Count('id')
             ).order_by('period')
             
         elif period == 'yearly':
             # Agrupar por año
-            trends = Receipt.objects.annotate(
+            trends = Receipt.objects.for_user(request.user).annotate(
                 period=TruncYear('date')
             ).values('period').annotate(
-                total_spending=Sum('total_amount'),
+                total_spending=Sum('total_cents'),
                 receipt_count=Count('id')
             ).order_by('period')
         else:
@@ -51,9 +60,9 @@ def get_spending_trend(request):
         for trend in trends:
             trends_data.append({
                 'period': trend['period'].strftime('%Y-%m-%d'),
-                'total_spending': float(trend['total_spending']),
+                'total_spending': to_euros(trend['total_spending']),
                 'receipt_count': trend['receipt_count'],
-                'avg_per_receipt': float(trend['total_spending'] / trend['receipt_count']) if trend['receipt_count'] > 0 else 0
+                'avg_per_receipt': to_euros(trend['total_spending']) / trend['receipt_count'] if trend['receipt_count'] > 0 else 0
             })
         
         return JsonResponse({
@@ -62,7 +71,7 @@ def get_spending_trend(request):
             'trends': trends_data,
             'highest_spending_period': {
                 'period': max_spending_period['period'].strftime('%Y-%m-%d'),
-                'amount': float(max_spending_period['total_spending'])
+                'amount': to_euros(max_spending_period['total_spending'])
             } if max_spending_period else None,
             'total_periods': len(trends_data)
         })
@@ -70,171 +79,179 @@ def get_spending_trend(request):
     except Exception as e:
         return JsonResponse({'error': f'Error interno: {str(e)}'}, status=500)
 @require_http_methods(["GET"])
+@api_login_required
+@analytics_read
 def compare_supermarket_prices(request):
     """API endpoint para comparar precios de un producto entre supermercados"""
     product_name = request.GET.get('product_name')
-    
+
     if not product_name:
         return JsonResponse({'error': 'Parámetro product_name es requerido'}, status=400)
-    
+
     try:
         # Buscar productos que contengan el nombre (case insensitive)
-        products = Product.objects.filter(
-            name__icontains=product_name
-        ).select_related('receipt')
-        
-        if not products:
+        snapshot = snapshot_for(request.user)
+        rows = snapshot.rows_matching(product_name, weighed=False)
+
+        if not len(rows):
             return JsonResponse({
                 'success': True,
                 'product_name': product_name,
                 'message': 'No se encontraron productos con ese nombre',
                 'comparisons': []
             })
-        
-        # Agrupar por supermercado
-        supermarket_data = defaultdict(list)
-        for product in products:
-            supermarket_data[product.receipt.supermarket_name].append({
-                'price': float(product.price),
-                'date': product.receipt.date.strftime('%Y-%m-%d'),
-                'receipt_id': product.receipt.id,
-                'quantity': product.quantity
-            })
-        
+
+        # Agrupar por supermercado (cada grupo conserva el orden de los productos)
+        order, markets, starts = group_by(snapshot.market[rows])
+        grouped = rows[order]
+        prices = snapshot.price[grouped]
+        counts = np.diff(np.append(starts, len(grouped)))
+        min_prices = np.minimum.reduceat(prices, starts)
+        max_prices = np.maximum.reduceat(prices, starts)
+        sum_prices = np.add.reduceat(prices, starts)
+        last_seen = np.maximum.reduceat(snapshot.date[grouped], starts)
+
         # Calcular estadísticas por supermercado
+        price_list = (prices / 100).tolist()
+        dates = [format_date(ordinal) for ordinal in snapshot.date[grouped].tolist()]
+        receipt_ids = snapshot.receipt_id[grouped].tolist()
+        quantities = snapshot.quantity[grouped].tolist()
         comparisons = []
-        for supermarket, prices_data in supermarket_data.items():
-            prices = [item['price'] for item in prices_data]
-            
+        # Empates de precio medio: primero el supermercado que aparece antes
+        for g in np.lexsort((order[starts], sum_prices / counts)).tolist():
+            start, end = int(starts[g]), int(starts[g] + counts[g])
             comparisons.append({
-                'supermarket': supermarket,
-                'min_price': min(prices),
-                'max_price': max(prices),
-                'avg_price': sum(prices) / len(prices),
-                'occurrences': len(prices),
-                'last_seen': max(prices_data, key=lambda x: x['date'])['date'],
-                'price_history': prices_data
+                'supermarket': snapshot.market_name(markets[g]),
+                'min_price': to_euros(min_prices[g]),
+                'max_price': to_euros(max_prices[g]),
+                'avg_price': to_euros(sum_prices[g]) / int(counts[g]),
+                'occurrences': int(counts[g]),
+                'last_seen': format_date(last_seen[g]),
+                'price_history': [
+                    {'price': price_list[i], 'date': dates[i], 'receipt_id': receipt_ids[i], 'quantity': quantities[i]}
+                    for i in range(start, end)
+                ]
             })
-        
-        # Ordenar por precio promedio
-        comparisons.sort(key=lambda x: x['avg_price'])
-        
+
         return JsonResponse({
             'success': True,
             'product_name': product_name,
-            'total_occurrences': len(products),
+            'total_occurrences': len(rows),
             'supermarkets_found': len(comparisons),
             'cheapest_supermarket': comparisons[0]['supermarket'] if comparisons else None,
             'comparisons': comparisons
         })
-        
+
     except Exception as e:
         return JsonResponse({'error': f'Error interno: {str(e)}'}, status=500)
 @require_http_methods(["GET"])
+@api_login_required
+@analytics_read
 def get_top_three_products(request):
     """API endpoint para obtener los top 3 productos por gasto total"""
-    
+
     try:
         # Agrupar productos por nombre y calcular gasto total
-        products_spending = Product.objects.values('name').annotate(
-            total_spent=Sum('price'),  # Suma de todos los precios unitarios
-            total_quantity=Sum('quantity'),  # Cantidad total comprada
-            occurrences=Count('id'),  # Número de veces comprado
-            avg_price=Avg('price')  # Precio promedio
-        ).order_by('-total_spent')[:3]
-        
+        snapshot = snapshot_for(request.user)
+        order, names, starts = group_by(snapshot.name)
+
         top_products = []
-        for i, product in enumerate(products_spending, 1):
-            # Obtener información adicional del producto
-            product_instances = Product.objects.filter(name=product['name']).select_related('receipt')
-            
-            # Supermercados donde se ha comprado
-            supermarkets = list(set([p.receipt.supermarket_name for p in product_instances]))
-            
-            # Última compra
-            last_purchase = max(product_instances, key=lambda x: x.receipt.date)
-            
-            top_products.append({
-                'rank': i,
-                'name': product['name'],
-                'total_spent': float(product['total_spent']),
-                'total_quantity': product['total_quantity'],
-                'occurrences': product['occurrences'],
-                'avg_price': float(product['avg_price']),
-                'supermarkets': supermarkets,
-                'last_purchase': {
-                    'date': last_purchase.receipt.date.strftime('%Y-%m-%d'),
-                    'supermarket': last_purchase.receipt.supermarket_name,
-                    'price': float(last_purchase.price)
-                }
-            })
-        
+        if len(order):
+            prices = snapshot.price[order]
+            total_spent = np.add.reduceat(prices, starts)  # Suma de todos los precios unitarios
+            total_quantity = np.add.reduceat(snapshot.quantity[order].astype(np.int64), starts)
+            occurrences = np.diff(np.append(starts, len(order)))
+
+            for i, g in enumerate(np.lexsort((order[starts], -total_spent))[:3].tolist(), 1):
+                rows = order[starts[g]:starts[g] + occurrences[g]]
+
+                # Supermercados donde se ha comprado
+                supermarkets = [snapshot.market_name(code) for code in np.unique(snapshot.market[rows]).tolist()]
+
+                # Última compra (la primera con la fecha más reciente)
+                last_purchase = rows[np.argmax(snapshot.date[rows])]
+
+                top_products.append({
+                    'rank': i,
+                    'name': snapshot.names[int(names[g])],
+                    'total_spent': to_euros(total_spent[g]),
+                    'total_quantity': int(total_quantity[g]),
+                    'occurrences': int(occurrences[g]),
+                    'avg_price': to_euros(total_spent[g]) / int(occurrences[g]),
+                    'supermarkets': sorted(supermarkets),
+                    'last_purchase': {
+                        'date': format_date(snapshot.date[last_purchase]),
+                        'supermarket': snapshot.market_name(snapshot.market[last_purchase]),
+                        'price': to_euros(snapshot.price[last_purchase])
+                    }
+                })
+
         return JsonResponse({
             'success': True,
             'top_products': top_products,
-            'total_products_analyzed': Product.objects.values('name').distinct().count()
+            'total_products_analyzed': len(names)
         })
-        
+
     except Exception as e:
         return JsonResponse({'error': f'Error interno: {str(e)}'}, status=500)
 @require_http_methods(["GET"])
+@api_login_required
+@analytics_read
 def get_price_changes(request):
     """API endpoint para obtener cambios de precio de un producto a lo largo del tiempo"""
     product_name = request.GET.get('product_name')
-    
+
     if not product_name:
         return JsonResponse({'error': 'Parámetro product_name es requerido'}, status=400)
-    
+
     try:
-        # Buscar productos que contengan el nombre
-        products = Product.objects.filter(
-            name__icontains=product_name
-        ).select_related('receipt').order_by('receipt__date')
-        
-        if not products:
+        # Buscar productos que contengan el nombre, por fecha del recibo
+        snapshot = snapshot_for(request.user)
+        rows = snapshot.rows_matching(product_name, weighed=False)
+
+        if not len(rows):
             return JsonResponse({
                 'success': True,
                 'product_name': product_name,
                 'message': 'No se encontraron productos con ese nombre',
                 'price_history': []
             })
-        
+
+        rows = rows[np.lexsort((snapshot.id[rows], snapshot.date[rows]))]
+        cents = snapshot.price[rows]
+        prices = cents / 100
+
+        # Cambio respecto a la compra anterior (no hay para la primera)
+        changes = np.diff(prices)
+        percentages = changes / prices[:-1] * 100
+
         # Crear historial de precios
         price_history = []
-        previous_price = None
-        
-        for product in products:
-            current_price = float(product.price)
-            price_change = None
-            price_change_percentage = None
-            
-            if previous_price is not None:
-                price_change = current_price - previous_price
-                price_change_percentage = ((current_price - previous_price) / previous_price) * 100
-            
+        for i, (ordinal, price, market, quantity, receipt_id) in enumerate(zip(
+            snapshot.date[rows].tolist(), prices.tolist(), snapshot.market[rows].tolist(),
+            snapshot.quantity[rows].tolist(), snapshot.receipt_id[rows].tolist(),
+        )):
+            price_change = float(changes[i - 1]) if i else None
+            price_change_percentage = float(percentages[i - 1]) if i else None
             price_history.append({
-                'date': product.receipt.date.strftime('%Y-%m-%d'),
-                'price': current_price,
-                'supermarket': product.receipt.supermarket_name,
-                'quantity': product.quantity,
-                'receipt_id': product.receipt.id,
+                'date': format_date(ordinal),
+                'price': price,
+                'supermarket': snapshot.market_name(market),
+                'quantity': quantity,
+                'receipt_id': receipt_id,
                 'price_change': price_change,
                 'price_change_percentage': round(price_change_percentage, 2) if price_change_percentage else None
             })
-            
-            previous_price = current_price
-        
+
         # Calcular estadísticas
-        prices = [item['price'] for item in price_history]
-        min_price = min(prices)
-        max_price = max(prices)
-        avg_price = sum(prices) / len(prices)
-        
+        min_price = to_euros(cents.min())
+        max_price = to_euros(cents.max())
+        avg_price = to_euros(cents.sum()) / len(cents)
+
         # Encontrar mayor incremento y decremento
-        changes = [item for item in price_history if item['price_change'] is not None]
-        biggest_increase = max(changes, key=lambda x: x['price_change']) if changes else None
-        biggest_decrease = min(changes, key=lambda x: x['price_change']) if changes else None
-        
+        biggest_increase = price_history[int(np.argmax(changes)) + 1] if len(changes) else None
+        biggest_decrease = price_history[int(np.argmin(changes)) + 1] if len(changes) else None
+
         return JsonResponse({
             'success': True,
             'product_name': product_name,
@@ -249,14 +266,16 @@ def get_price_changes(request):
             'biggest_decrease': biggest_decrease,
             'price_history': price_history
         })
-        
+
     except Exception as e:
         return JsonResponse({'error': f'Error interno: {str(e)}'}, status=500)
 @csrf_exempt
 @require_http_methods(["POST"])
+@api_login_required
+@analytics_read
 def get_cheapest_basket(request):
     """API endpoint para encontrar la cesta más barata de productos entre supermercados"""
-    
+
     try:
         # Parsear JSON del body
         try:
@@ -264,77 +283,76 @@ def get_cheapest_basket(request):
             product_cart = data.get('products', [])
         except json.JSONDecodeError:
             return JsonResponse({'error': 'JSON inválido'}, status=400)
-        
+
         if not product_cart:
             return JsonResponse({'error': 'Lista de productos vacía'}, status=400)
-        
+
+        snapshot = snapshot_for(request.user)
+        # Todos los supermercados del usuario (también recibos sin productos)
+        supermarkets = sorted(
+            Receipt.objects.for_user(request.user).order_by().values_list('supermarket_id', flat=True).distinct(),
+            key=canonical_name,
+        )
+
         # product_cart debería ser una lista de {"name": "producto", "quantity": 1}
+        # Totales en céntimos enteros; a euros solo al construir la respuesta
         supermarket_totals = defaultdict(lambda: {'total': 0, 'products_found': [], 'products_missing': []})
-        
+
         for cart_item in product_cart:
             product_name = cart_item.get('name')
             desired_quantity = cart_item.get('quantity', 1)
-            
+
             if not product_name:
                 continue
-            
-            # Buscar el producto en cada supermercado (precio más reciente)
-            supermarket_prices = {}
-            
-            # Obtener el precio más reciente de cada supermercado para este producto
-            supermarkets = Receipt.objects.values_list('supermarket_name', flat=True).distinct()
-            
-            for supermarket in supermarkets:
-                latest_product = Product.objects.filter(
-                    name__icontains=product_name,
-                    receipt__supermarket_name=supermarket
-                ).select_related('receipt').order_by('-receipt__date').first()
-                
-                if latest_product:
-                    supermarket_prices[supermarket] = float(latest_product.price)
-            
+
+            # Precio más reciente de este producto en cada supermercado
+            rows = snapshot.rows_matching(product_name, weighed=False)
+            markets, latest = latest_per_group(snapshot.market[rows], snapshot.date[rows], snapshot.id[rows])
+            supermarket_prices = dict(zip(markets.tolist(), snapshot.price[rows[latest]].tolist()))
+
             # Añadir a cada supermercado
             for supermarket in supermarkets:
                 if supermarket in supermarket_prices:
                     price = supermarket_prices[supermarket]
-                    total_price = price * desired_quantity
-                    
+                    # Cantidades no enteras (p. ej. 1.5) se redondean al céntimo
+                    total_price = round(price * desired_quantity)
+
                     supermarket_totals[supermarket]['total'] += total_price
                     supermarket_totals[supermarket]['products_found'].append({
                         'name': product_name,
-                        'unit_price': price,
+                        'unit_price': to_euros(price),
                         'quantity': desired_quantity,
-                        'total_price': total_price
+                        'total_price': to_euros(total_price)
                     })
                 else:
                     supermarket_totals[supermarket]['products_missing'].append({
                         'name': product_name,
                         'quantity': desired_quantity
                     })
-        
+
         # Convertir a lista y filtrar solo supermercados que tienen todos los productos
         complete_baskets = []
         partial_baskets = []
-        
+
         for supermarket, data in supermarket_totals.items():
             basket_info = {
-                'supermarket': supermarket,
-                'total_cost': round(data['total'], 2),
+                'supermarket': canonical_name(supermarket),
+                'total_cost': to_euros(data['total']),
                 'products_found': len(data['products_found']),
                 'products_missing': len(data['products_missing']),
                 'products_detail': data['products_found'],
                 'missing_products': data['products_missing']
             }
-            
+
             if len(data['products_missing']) == 0:
                 complete_baskets.append(basket_info)
             else:
                 partial_baskets.append(basket_info)
-        
+
         # Ordenar por precio total
         complete_baskets.sort(key=lambda x: x['total_cost'])
         partial_baskets.sort(key=lambda x: x['total_cost'])
-        
+
         return JsonResponse({
             'success': True,
             'requested_products': len(product_cart),
@@ -343,55 +361,60 @@ def get_cheapest_basket(request):
             'partial_baskets': partial_baskets,
             'message': 'Cestas completas encontradas' if complete_baskets else 'No se encontraron cestas completas'
         })
-        
+
     except Exception as e:
         return JsonResponse({'error': f'Error interno: {str(e)}'}, status=500)
 @require_http_methods(["GET"])
+@api_login_required
+@analytics_read
 def get_supermarket_ranking(request):
     """API endpoint para obtener ranking de supermercados basado en precios"""
     
     try:
         # Calcular estadísticas por supermercado
-        supermarket_stats = Receipt.objects.values('supermarket_name').annotate(
+        supermarket_stats = Receipt.objects.for_user(request.user).values('supermarket_id').annotate(
             total_receipts=Count('id'),
-            total_spent=Sum('total_amount'),
-            avg_receipt_amount=Avg('total_amount'),
+            total_spent=Sum('total_cents'),
+            avg_receipt_amount=Avg('total_cents'),
             total_products=Sum('products__quantity'),
-            unique_products=Count('products__name', distinct=True)
+            unique_products=Count('products__entity_id', distinct=True)
         ).order_by('avg_receipt_amount')
         
-        # Calcular precio promedio por producto en cada supermercado
+        # Precio medio, última visita y productos más comunes de todos los
+        # supermercados a la vez (un número fijo de queries, no unas por supermercado)
+        products = Product.objects.for_user(request.user)
+        avg_prices = dict(products.values_list('receipt__supermarket_id').annotate(avg_price=Avg('price_cents')))
+        last_visits = dict(
+            Receipt.objects.for_user(request.user).values_list('supermarket_id').annotate(last=Max('date'))
+        )
+        top_entities = defaultdict(list)
+        counts = products.values_list('receipt__supermarket_id', 'entity_id').annotate(count=Count('id'))
+        for supermarket_id, entity_id, count in sorted(counts, key=lambda row: -row[2]):
+            if len(top_entities[supermarket_id]) < 3:
+                top_entities[supermarket_id].append(entity_id)
+        names = entity_names({entity_id for entities in top_entities.values() for entity_id in entities})
+        
         supermarket_rankings = []
         
         for i, supermarket in enumerate(supermarket_stats, 1):
-            # Calcular precio promedio por producto
-            products = Product.objects.filter(receipt__supermarket_name=supermarket['supermarket_name'])
+            # Solo supermercados con productos
+            avg_product_price = avg_prices.get(supermarket['supermarket_id'])
             
-            if products.exists():
-                avg_product_price = products.aggregate(avg_price=Avg('price'))['avg_price']
-                
-                # Obtener fecha del último recibo
-                last_receipt = Receipt.objects.filter(
-                    supermarket_name=supermarket['supermarket_name']
-                ).order_by('-date').first()
-                
-                # Productos más comunes en este supermercado
-                top_products = products.values('name').annotate(
-                    count=Count('id')
-                ).order_by('-count')[:3]
+            if avg_product_price is not None:
+                last_visit = last_visits.get(supermarket['supermarket_id'])
                 
                 supermarket_rankings.append({
                     'rank': i,
-                    'supermarket': supermarket['supermarket_name'],
-                    'score': round(float(avg_product_price), 2),
-                    'avg_receipt_amount': round(float(supermarket['avg_receipt_amount']), 2),
+                    'supermarket': canonical_name(supermarket['supermarket_id']),
+                    'score': round(to_euros(avg_product_price), 2),
+                    'avg_receipt_amount': round(to_euros(supermarket['avg_receipt_amount']), 2),
                     'total_receipts': supermarket['total_receipts'],
-                    'total_spent': round(float(supermarket['total_spent']), 2),
+                    'total_spent': round(to_euros(supermarket['total_spent']), 2),
                     'total_products_bought': supermarket['total_products'] or 0,
                     'unique_products': supermarket['unique_products'],
-                    'avg_product_price': round(float(avg_product_price), 2),
-                    'last_visit': last_receipt.date.strftime('%Y-%m-%d') if last_receipt else None,
-                    'top_products': [p['name'] for p in top_products]
+                    'avg_product_price': round(to_euros(avg_product_price), 2),
+                    'last_visit': last_visit.strftime('%Y-%m-%d') if last_visit else None,
+                    'top_products': [names[entity_id] for entity_id in top_entities[supermarket['supermarket_id']]]
                 })
         
         # Obtener supermercado más y menos caro
@@ -399,12 +422,14 @@ def get_supermarket_ranking(request):
         most_expensive = supermarket_rankings[-1] if supermarket_rankings else None
         
         # Calcular estadísticas generales
-        all_receipts = Receipt.objects.all()
+        overall = Receipt.objects.for_user(request.user).aggregate(
+            count=Count('id'), total=Sum('total_cents'), avg=Avg('total_cents')
+        )
         general_stats = {
             'total_supermarkets': len(supermarket_rankings),
-            'total_receipts': all_receipts.count(),
-            'total_spent_overall': float(all_receipts.aggregate(total=Sum('total_amount'))['total'] or 0),
-            'avg_receipt_overall': float(all_receipts.aggregate(avg=Avg('total_amount'))['avg'] or 0)
+            'total_receipts': overall['count'],
+            'total_spent_overall': to_euros(overall['total']),
+            'avg_receipt_overall': to_euros(overall['avg'])
         }
         
         return JsonResponse({
@@ -419,6 +444,8 @@ def get_supermarket_ranking(request):
         return JsonResponse({'error': f'Error interno: {str(e)}'}, status=500)
 
 @require_http_methods(["GET"])
+@api_login_required
+@analytics_read
 def get_dashboard_overview(request):
     """API endpoint para obtener datos generales del dashboard"""
     
@@ -429,8 +456,8 @@ def get_dashboard_overview(request):
     
     try:
         # Base queryset
-        receipts_query = Receipt.objects.all()
-        products_query = Product.objects.all()
+        receipts_query = Receipt.objects.for_user(request.user)
+        products_query = Product.objects.for_user(request.user)
         
         # Aplicar filtros de fecha
         if year:
@@ -447,13 +474,13 @@ def get_dashboard_overview(request):
             products_query = products_query.filter(receipt__date__week=week)
         
         # Estadísticas básicas
-        total_spent = receipts_query.aggregate(total=Sum('total_amount'))['total'] or 0
+        total_spent = receipts_query.aggregate(total=Sum('total_cents'))['total'] or 0
         total_receipts = receipts_query.count()
         total_products = products_query.aggregate(total=Sum('quantity'))['total'] or 0
-        avg_receipt = receipts_query.aggregate(avg=Avg('total_amount'))['avg'] or 0
+        avg_receipt = receipts_query.aggregate(avg=Avg('total_cents'))['avg'] or 0
         
         # Supermercados únicos
-        unique_supermarkets = receipts_query.values('supermarket_name').distinct().count()
+        unique_supermarkets = receipts_query.values('supermarket_id').distinct().count()
         
         # Periodo de análisis
         if receipts_query.exists():
@@ -466,17 +493,17 @@ def get_dashboard_overview(request):
             days_analyzed = 0
         
         # Gasto por supermercado
-        supermarket_spending = receipts_query.values('supermarket_name').annotate(
-            total=Sum('total_amount'),
+        supermarket_spending = receipts_query.values('supermarket_id').annotate(
+            total=Sum('total_cents'),
             receipts_count=Count('id'),
-            avg_receipt=Avg('total_amount')
+            avg_receipt=Avg('total_cents')
         ).order_by('-total')
         
         # Top 3 productos más comprados (por gasto)
-        top_products = products_query.values('name').annotate(
-            total_spent=Sum('price'),
+        top_products = products_query.values('entity_id').annotate(
+            total_spent=Sum('price_cents'),
             total_quantity=Sum('quantity'),
-            avg_price=Avg('price')
+            avg_price=Avg('price_cents')
         ).order_by('-total_spent')[:3]
         
         return JsonResponse({
@@ -487,10 +514,10 @@ def get_dashboard_overview(request):
                 'week': week
             },
             'overview': {
-                'total_spent': float(total_spent),
+                'total_spent': to_euros(total_spent),
                 'total_receipts': total_receipts,
                 'total_products': total_products,
-                'avg_receipt': round(float(avg_receipt), 2),
+                'avg_receipt': round(to_euros(avg_receipt), 2),
                 'unique_supermarkets': unique_supermarkets,
                 'days_analyzed': days_analyzed,
                 'first_receipt': first_receipt.strftime('%Y-%m-%d') if first_receipt else None,
@@ -498,19 +525,19 @@ def get_dashboard_overview(request):
             },
             'supermarket_spending': [
                 {
-                    'name': item['supermarket_name'],
-                    'total': float(item['total']),
+                    'name': canonical_name(item['supermarket_id']),
+                    'total': to_euros(item['total']),
                     'receipts': item['receipts_count'],
-                    'avg_receipt': round(float(item['avg_receipt']), 2)
+                    'avg_receipt': round(to_euros(item['avg_receipt']), 2)
                 }
                 for item in supermarket_spending
             ],
             'top_products': [
                 {
-                    'name': item['name'],
-                    'total_spent': float(item['total_spent']),
+                    'name': entity_name(item['entity_id']),
+                    'total_spent': to_euros(item['total_spent']),
                     'total_quantity': item['total_quantity'],
-                    'avg_price': round(float(item['avg_price']), 2)
+                    'avg_price': round(to_euros(item['avg_price']), 2)
                 }
                 for item in top_products
             ]
@@ -520,6 +547,8 @@ def get_dashboard_overview(request):
         return JsonResponse({'error': f'Error interno: {str(e)}'}, status=500)
 
 @require_http_methods(["GET"])
+@api_login_required
+@analytics_read
 def get_monthly_comparison(request):
     """API endpoint para comparación mensual con datos para gráfico de barras"""
     
@@ -527,7 +556,7 @@ def get_monthly_comparison(request):
     
     try:
         # Base queryset
-        query = Receipt.objects.all()
+        query = Receipt.objects.for_user(request.user)
         
         if year:
             query = query.filter(date__year=year)
@@ -536,9 +565,9 @@ def get_monthly_comparison(request):
         monthly_data = query.annotate(
             month=TruncMonth('date')
         ).values('month').annotate(
-            total_spent=Sum('total_amount'),
+            total_spent=Sum('total_cents'),
             receipt_count=Count('id'),
-            avg_receipt=Avg('total_amount')
+            avg_receipt=Avg('total_cents')
         ).order_by('month')
         
         # Formatear datos para el frontend
@@ -547,9 +576,9 @@ def get_monthly_comparison(request):
             months_data.append({
                 'month': data['month'].strftime('%Y-%m'),
                 'month_name': data['month'].strftime('%B %Y'),
-                'total_spent': float(data['total_spent']),
+                'total_spent': to_euros(data['total_spent']),
                 'receipt_count': data['receipt_count'],
-                'avg_receipt': round(float(data['avg_receipt']), 2)
+                'avg_receipt': round(to_euros(data['avg_receipt']), 2)
             })
         
         # Encontrar mejor y peor mes
@@ -575,6 +604,8 @@ def get_monthly_comparison(request):
         return JsonResponse({'error': f'Error interno: {str(e)}'}, status=500)
 
 @require_http_methods(["GET"])
+@api_login_required
+@analytics_read
 def get_price_trends(request):
     """API endpoint para obtener tendencias de precio de los productos más comprados"""
     
@@ -583,7 +614,7 @@ def get_price_trends(request):
     
     try:
         # Base queryset
-        products_query = Product.objects.select_related('receipt')
+        products_query = Product.objects.for_user(request.user).select_related('receipt')
         
         # Aplicar filtros
         if year:
@@ -592,28 +623,28 @@ def get_price_trends(request):
             products_query = products_query.filter(receipt__date__month=month)
         
         # Obtener top 3 productos por gasto total
-        top_products = products_query.values('name').annotate(
-            total_spent=Sum('price')
+        top_products = products_query.values('entity_id').annotate(
+            total_spent=Sum('price_cents')
         ).order_by('-total_spent')[:3]
         
         trends_data = []
         
         for product_data in top_products:
-            product_name = product_data['name']
+            product_name = entity_name(product_data['entity_id'])
             
             # Obtener historial de precios para este producto
             price_history = products_query.filter(
-                name=product_name
+                entity_id=product_data['entity_id']
             ).order_by('receipt__date').values(
-                'receipt__date', 'price', 'receipt__supermarket_name'
+                'receipt__date', 'price_cents', 'receipt__supermarket_id'
             )
             
             history_list = []
             for item in price_history:
                 history_list.append({
                     'date': item['receipt__date'].strftime('%Y-%m-%d'),
-                    'price': float(item['price']),
-                    'supermarket': item['receipt__supermarket_name']
+                    'price': to_euros(item['price_cents']),
+                    'supermarket': canonical_name(item['receipt__supermarket_id'])
                 })
             
             # Calcular tendencia (simple: precio final vs inicial)
@@ -626,7 +657,7 @@ def get_price_trends(request):
             
             trends_data.append({
                 'product_name': product_name,
-                'total_spent': float(product_data['total_spent']),
+                'total_spent': to_euros(product_data['total_spent']),
                 'price_history': history_list,
                 'trend_percentage': round(trend_percentage, 2),
                 'trend_direction': 'up' if trend_percentage > 0 else 'down' if trend_percentage < 0 else 'stable'
@@ -645,6 +676,8 @@ def get_price_trends(request):
         return JsonResponse({'error': f'Error interno: {str(e)}'}, status=500)
 
 @require_http_methods(["GET"])
+@api_login_required
+@analytics_read
 def get_supermarket_savings(request):
     """API endpoint para calcular ahorros potenciales entre supermercados"""
     
@@ -653,7 +686,7 @@ def get_supermarket_savings(request):
     
     try:
         # Base queryset
-        products_query = Product.objects.select_related('receipt')
+        products_query = Product.objects.for_user(request.user).select_related('receipt')
         
         # Aplicar filtros
         if year:
@@ -662,23 +695,23 @@ def get_supermarket_savings(request):
             products_query = products_query.filter(receipt__date__month=month)
         
         # Obtener productos que aparecen en múltiples supermercados
-        common_products = products_query.values('name').annotate(
-            supermarket_count=Count('receipt__supermarket_name', distinct=True),
+        common_products = products_query.values('entity_id').annotate(
+            supermarket_count=Count('receipt__supermarket_id', distinct=True),
             total_purchases=Count('id')
         ).filter(supermarket_count__gt=1).order_by('-total_purchases')[:10]
         
         savings_analysis = []
         
         for product_data in common_products:
-            product_name = product_data['name']
+            product_name = entity_name(product_data['entity_id'])
             
             # Obtener precios por supermercado para este producto
             supermarket_prices = products_query.filter(
-                name=product_name
-            ).values('receipt__supermarket_name').annotate(
-                avg_price=Avg('price'),
-                min_price=Min('price'),
-                max_price=Max('price'),
+                entity_id=product_data['entity_id']
+            ).values('receipt__supermarket_id').annotate(
+                avg_price=Avg('price_cents'),
+                min_price=Min('price_cents'),
+                max_price=Max('price_cents'),
                 purchase_count=Count('id')
             ).order_by('avg_price')
             
@@ -686,20 +719,20 @@ def get_supermarket_savings(request):
                 cheapest = supermarket_prices[0]
                 most_expensive = list(supermarket_prices)[-1]
                 
-                potential_saving = float(most_expensive['avg_price']) - float(cheapest['avg_price'])
-                saving_percentage = (potential_saving / float(most_expensive['avg_price'])) * 100
+                potential_saving = to_euros(most_expensive['avg_price']) - to_euros(cheapest['avg_price'])
+                saving_percentage = (potential_saving / to_euros(most_expensive['avg_price'])) * 100
                 
                 savings_analysis.append({
                     'product_name': product_name,
                     'total_purchases': product_data['total_purchases'],
                     'cheapest_supermarket': {
-                        'name': cheapest['receipt__supermarket_name'],
-                        'avg_price': round(float(cheapest['avg_price']), 2),
+                        'name': canonical_name(cheapest['receipt__supermarket_id']),
+                        'avg_price': round(to_euros(cheapest['avg_price']), 2),
                         'purchase_count': cheapest['purchase_count']
                     },
                     'most_expensive_supermarket': {
-                        'name': most_expensive['receipt__supermarket_name'],
-                        'avg_price': round(float(most_expensive['avg_price']), 2),
+                        'name': canonical_name(most_expensive['receipt__supermarket_id']),
+                        'avg_price': round(to_euros(most_expensive['avg_price']), 2),
                         'purchase_count': most_expensive['purchase_count']
                     },
                     'potential_saving': round(potential_saving, 2),
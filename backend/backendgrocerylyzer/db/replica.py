@@ -0,0 +1,128 @@
+# replica.py - Réplica de lectura para analytics
+#
+# Las vistas de analytics decoradas con ``analytics_read`` leen de la réplica
+# (alias ANALYTICS_REPLICA_ALIAS); el resto de lecturas y todas las escrituras
+# van a la base de datos principal. En local la réplica es una copia SQLite
+# que ``manage.py snapshot_replica`` refresca con la API de backup.
+#
+# La réplica va por detrás de la principal, así que tras una escritura del
+# propio usuario (subida, edición o borrado de recibos) sus lecturas de
+# analytics vuelven a la principal durante ANALYTICS_REPLICA_RYW_WINDOW
+# segundos (read-your-writes). La marca se guarda en una caché compartida por
+# todos los workers (ANALYTICS_REPLICA_RYW_CACHE): la siguiente petición del
+# usuario puede atenderla otro worker distinto del que hizo la escritura.
+
+import sqlite3
+import time
+from contextvars import ContextVar
+from functools import wraps
+from pathlib import Path
+
+from django.conf import settings
+from django.core.cache import caches
+from django.db import DEFAULT_DB_ALIAS, connections
+
+from backendgrocerylyzer import metrics
+
+_read_alias = ContextVar('analytics_read_alias', default=None)
+
+
+def _recent_write_key(user_id):
+    return f'analytics:recent_write:{user_id}'
+
+
+def _ryw_cache():
+    return caches[settings.ANALYTICS_REPLICA_RYW_CACHE]
+
+
+def mark_recent_write(user):
+    """Fija las lecturas de analytics del usuario a la principal durante la ventana"""
+    if settings.ANALYTICS_REPLICA_ALIAS and user.is_authenticated:
+        _ryw_cache().set(_recent_write_key(user.pk), True, settings.ANALYTICS_REPLICA_RYW_WINDOW)
+
+
+def replica_available():
+    """True si hay réplica configurada y ya existe su primera copia"""
+    alias = settings.ANALYTICS_REPLICA_ALIAS
+    if not alias or alias not in connections.settings:
+        return False
+    return Path(connections[alias].settings_dict['NAME']).exists()
+
+
+def read_alias_for(user):
+    """Alias del que deben leer las analytics de ``user`` (None = principal)"""
+    if not replica_available():
+        return None
+    if _ryw_cache().get(_recent_write_key(user.pk)):
+        return None
+    return settings.ANALYTICS_REPLICA_ALIAS
+
+
+def current_read_alias():
+    """Alias de réplica activo en la vista de analytics en curso (None fuera de ellas)"""
+    return _read_alias.get()
+
+
+def analytics_read(view):
+    """Decorador: las lecturas de la vista van a la réplica si procede"""
+    @wraps(view)
+    def wrapper(request, *args, **kwargs):
+        alias = read_alias_for(request.user)
+        metrics.observe('analytics.read', 1, db=alias or DEFAULT_DB_ALIAS)
+        if alias is None:
+            return view(request, *args, **kwargs)
+        token = _read_alias.set(alias)
+        try:
+            return view(request, *args, **kwargs)
+        finally:
+            _read_alias.reset(token)
+    return wrapper
+
+
+class AnalyticsReplicaRouter:
+    """Lecturas de analytics a la réplica; escrituras y migraciones siempre a la principal"""
+
+    def db_for_read(self, model, **hints):
+        return _read_alias.get()
+
+    def db_for_write(self, model, **hints):
+        # Explícito: si no, Django escribiría en la base de la que se cargó la instancia
+        return DEFAULT_DB_ALIAS
+
+    def allow_relation(self, obj1, obj2, **hints):
+        aliases = {DEFAULT_DB_ALIAS, settings.ANALYTICS_REPLICA_ALIAS}
+        if obj1._state.db in aliases and obj2._state.db in aliases:
+            return True
+        return None
+
+    def allow_migrate(self, db, app_label, model_name=None, **hints):
+        # La réplica recibe el esquema con la copia, no con migrate
+        if db == settings.ANALYTICS_REPLICA_ALIAS:
+            return False
+        return None
+
+
+def snapshot(source=DEFAULT_DB_ALIAS, alias=None):
+    """Copia la base de datos principal sobre la réplica; devuelve la duración en ms
+
+    La API de backup copia una instantánea consistente aunque haya escrituras
+    en curso. La réplica está en WAL, así que sus lectores siguen leyendo la
+    versión anterior hasta que termina la copia.
+    """
+    alias = alias or settings.ANALYTICS_REPLICA_ALIAS
+    source_path = str(connections[source].settings_dict['NAME'])
+    replica_path = str(connections[alias].settings_dict['NAME'])
+    start = time.perf_counter()
+
+    source_conn = sqlite3.connect(source_path)
+    replica_conn = sqlite3.connect(replica_path, timeout=20)
+    try:
+        replica_conn.execute('PRAGMA journal_mode = WAL')
+        source_conn.backup(replica_conn)
+    finally:
+        replica_conn.close()
+        source_conn.close()
+
+    duration_ms = (time.perf_counter() - start) * 1000
+    metrics.observe('analytics.replica.snapshot_ms', duration_ms)
+    return duration_ms
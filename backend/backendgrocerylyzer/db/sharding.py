@@ -0,0 +1,305 @@
+# sharding.py - Reparto de recibos y productos entre bases de datos por usuario
+#
+# Con RECEIPT_SHARDS = ['default', 'shard_1', ...] cada usuario vive en un
+# shard: el de su fila ShardAssignment si existe (usuarios movidos o fijados
+# con ``manage.py rebalance_shards``) o, si no, el que da un hash consistente
+# (jump hash) de su id, que al añadir shards solo mueve 1/N de los usuarios.
+# Con un único shard (configuración por defecto) no se consulta nada.
+#
+# Las consultas por usuario (``Receipt.objects.for_user``) van explícitamente
+# a su shard; ReceiptShardRouter enruta las escrituras de instancias según su
+# propietario. Las tablas de usuarios, sesiones y perfiles solo existen en
+# 'default': Receipt.owner no tiene restricción de clave ajena en la base de
+# datos. Cada shard numera sus ids a partir de índice * SHARD_ID_SPAN, así que
+# un recibo conserva su id al mover al usuario de shard.
+#
+# Comprobar la asignación y escribir no es atómico salvo dentro de la
+# transacción del shard: las escrituras de las vistas van en ``user_write``
+# (o en la cola de escrituras, que también abre una), que vuelve a leer la
+# asignación con el lock de escritura del shard tomado. ``move_user`` conmuta
+# la asignación antes de soltar ese lock, así que una escritura que empezó
+# antes de la conmutación falla con ShardMigrationInProgress en lugar de
+# acabar en el shard de origen, que se va a borrar.
+
+from contextlib import contextmanager
+
+from django.conf import settings
+from django.db import DEFAULT_DB_ALIAS, connections, transaction
+
+SHARDED_APP = 'receipts'
+_SEQUENCED_TABLES = ('receipts_receipt', 'receipts_product')
+
+
+class ShardMigrationInProgress(Exception):
+    """El usuario se está moviendo de shard: sus escrituras están congeladas unos instantes"""
+
+
+def shards():
+    return list(settings.RECEIPT_SHARDS)
+
+
+def is_sharded():
+    return len(settings.RECEIPT_SHARDS) > 1
+
+
+def jump_hash(key, buckets):
+    """Jump consistent hash (Lamping y Veach): bucket en [0, buckets) para ``key``"""
+    key &= 0xFFFFFFFFFFFFFFFF
+    bucket, j = -1, 0
+    while j < buckets:
+        bucket = j
+        key = (key * 2862933555777941757 + 1) & 0xFFFFFFFFFFFFFFFF
+        j = int((bucket + 1) * ((1 << 31) / ((key >> 33) + 1)))
+    return bucket
+
+
+def hashed_shard(user_id):
+    return settings.RECEIPT_SHARDS[jump_hash(user_id, len(settings.RECEIPT_SHARDS))]
+
+
+def _assignment(user_id):
+    from users.models import ShardAssignment
+
+    return (
+        ShardAssignment.objects.using(DEFAULT_DB_ALIAS)
+        .filter(user_id=user_id)
+        .values_list('shard', 'frozen')
+        .first()
+    )
+
+
+def shard_for_user_id(user_id, for_write=False):
+    """Alias del shard del usuario; con ``for_write`` falla si está congelado
+
+    Fuera de la transacción del shard la respuesta puede quedar obsoleta antes
+    de escribir: para escribir, ``user_write``.
+    """
+    if not is_sharded() or user_id is None:
+        return DEFAULT_DB_ALIAS
+    assignment = _assignment(user_id)
+    if assignment is None:
+        return hashed_shard(user_id)
+    shard, frozen = assignment
+    if frozen and for_write:
+        raise ShardMigrationInProgress(f'Usuario {user_id} en migración de shard')
+    return shard
+
+
+@contextmanager
+def user_write(user_id):
+    """Transacción de escritura en el shard del usuario (lo devuelve)
+
+    Con transaction_mode IMMEDIATE el BEGIN espera al lock de escritura del
+    shard; la asignación se vuelve a leer ya con el lock, cuando move_user no
+    puede estar re-sincronizando ni conmutando.
+    """
+    shard = shard_for_user_id(user_id, for_write=True)
+    with transaction.atomic(using=shard):
+        if shard_for_user_id(user_id, for_write=True) != shard:
+            raise ShardMigrationInProgress(f'Usuario {user_id} movido de shard')
+        yield shard
+
+
+def shard_for(user):
+    """Shard del usuario, memorizado en el objeto (dura lo que la petición)"""
+    shard = getattr(user, '_receipt_shard', None)
+    if shard is None:
+        shard = user._receipt_shard = shard_for_user_id(user.pk)
+    return shard
+
+
+def read_db_for(user):
+    """Alias para leer los recibos del usuario (la réplica de analytics cubre 'default')"""
+    from backendgrocerylyzer.db.replica import current_read_alias
+
+    shard = shard_for(user)
+    replica = current_read_alias()
+    if replica and shard == DEFAULT_DB_ALIAS:
+        return replica
+    return shard
+
+
+class ReceiptShardRouter:
+    """Escrituras de receipts al shard del propietario; el resto de apps solo en 'default'"""
+
+    def db_for_read(self, model, **hints):
+        instance = hints.get('instance')
+        if model._meta.app_label != SHARDED_APP and instance is not None and instance._state.db in _shard_only():
+            # p. ej. receipt.owner desde un recibo cargado de un shard
+            return DEFAULT_DB_ALIAS
+        return None
+
+    def db_for_write(self, model, **hints):
+        if model._meta.app_label != SHARDED_APP or not is_sharded():
+            return None
+        instance = hints.get('instance')
+        if instance is None:
+            return None
+        receipt = None if hasattr(instance, 'owner_id') else getattr(instance, 'receipt', None)
+        if receipt is not None and instance._state.adding and receipt._state.db:
+            return receipt._state.db  # Producto nuevo: al shard de su recibo
+        owner_id = _owner_id(instance)
+        if owner_id is not None:
+            shard = shard_for_user_id(owner_id, for_write=True)
+            if instance._state.db not in (None, shard):
+                # Cargada antes de que se moviera el usuario: el origen se va a borrar
+                raise ShardMigrationInProgress(f'Usuario {owner_id} movido de shard')
+            return shard
+        return instance._state.db
+
+    def allow_relation(self, obj1, obj2, **hints):
+        apps = {obj1._meta.app_label, obj2._meta.app_label}
+        if SHARDED_APP in apps and len(apps) > 1:
+            return True  # Receipt.owner: usuario en 'default', recibo en su shard
+        return None
+
+    def allow_migrate(self, db, app_label, model_name=None, **hints):
+        if db in _shard_only():
+            return app_label == SHARDED_APP
+        return None
+
+
+def _shard_only():
+    return set(settings.RECEIPT_SHARDS) - {DEFAULT_DB_ALIAS}
+
+
+def _owner_id(instance):
+    if hasattr(instance, 'owner_id'):
+        return instance.owner_id
+    receipt = getattr(instance, 'receipt', None)
+    return getattr(receipt, 'owner_id', None)
+
+
+def seed_id_sequences(using, **kwargs):
+    """post_migrate: cada shard numera sus ids desde índice * SHARD_ID_SPAN"""
+    if using not in settings.RECEIPT_SHARDS:
+        return
+    start = settings.RECEIPT_SHARDS.index(using) * settings.SHARD_ID_SPAN
+    if not start:
+        return
+    with connections[using].cursor() as cursor:
+        for table in _SEQUENCED_TABLES:
+            cursor.execute('SELECT seq FROM sqlite_sequence WHERE name = %s', [table])
+            row = cursor.fetchone()
+            if row is None:
+                cursor.execute('INSERT INTO sqlite_sequence (name, seq) VALUES (%s, %s)', [table, start])
+            elif row[0] < start:
+                cursor.execute('UPDATE sqlite_sequence SET seq = %s WHERE name = %s', [start, table])
+
+
+def delete_user_receipts(sender, instance, using, **kwargs):
+    """pre_delete de User: borrar sus recibos de su shard (el CASCADE solo cubre 'default')"""
+    if not is_sharded():
+        return
+    from receipts.models import Receipt
+    from users.stats import suspended
+
+    shard = shard_for_user_id(instance.pk)
+    if shard != using:
+        with suspended():
+            Receipt.objects.using(shard).filter(owner_id=instance.pk).delete()
+
+
+def _copy_user(user_id, source, target):
+    """Copia (upsert) los recibos y productos del usuario de ``source`` a ``target``
+
+    Borra en destino lo que ya no existe en origen, así que repetirla deja el
+    destino igual que el origen. Devuelve (recibos, productos) copiados.
+    """
+    from receipts.models import Receipt, Product
+    from users.stats import suspended
+
+    receipts = list(Receipt.objects.using(source).filter(owner_id=user_id))
+    products = list(Product.objects.using(source).filter(receipt__owner_id=user_id))
+    receipt_ids = {receipt.id for receipt in receipts}
+    product_ids = {product.id for product in products}
+
+    with transaction.atomic(using=target), suspended():
+        stale_products = set(
+            Product.objects.using(target).filter(receipt__owner_id=user_id).values_list('id', flat=True)
+        ) - product_ids
+        stale_receipts = set(
+            Receipt.objects.using(target).filter(owner_id=user_id).values_list('id', flat=True)
+        ) - receipt_ids
+        for model, ids in ((Product, stale_products), (Receipt, stale_receipts)):
+            ids = list(ids)
+            for i in range(0, len(ids), 500):
+                model.objects.using(target).filter(id__in=ids[i:i + 500]).delete()
+
+        Receipt.objects.using(target).bulk_create(
+            receipts, batch_size=500, update_conflicts=True, unique_fields=['id'],
+            update_fields=['owner', 'supermarket_name', 'supermarket', 'date', 'total_cents'],
+        )
+        Product.objects.using(target).bulk_create(
+            products, batch_size=500, update_conflicts=True, unique_fields=['id'],
+            update_fields=['name', 'price_cents', 'quantity', 'receipt', 'entity', 'weighed'],
+        )
+    return len(receipts), len(products)
+
+
+def move_user(user_id, target, log=None):
+    """Mueve los datos de un usuario a ``target`` sin dejar de servirle
+
+    1. Copia en caliente: lecturas y escrituras siguen en el shard de origen.
+    2. Congela sus escrituras (ShardMigrationInProgress), espera a las que
+       estén en curso tomando el lock de escritura del origen, re-sincroniza
+       los cambios y conmuta la asignación.
+    3. Borra los datos del origen.
+    """
+    from receipts.changes import log_reset
+    from receipts.models import Receipt
+    from users.models import ShardAssignment
+    from users.stats import suspended
+
+    log = log or (lambda message: None)
+    if target not in settings.RECEIPT_SHARDS:
+        raise ValueError(f'Shard desconocido: {target}')
+    source = shard_for_user_id(user_id)
+    if source == target:
+        return source, (0, 0)
+
+    receipts, products = _copy_user(user_id, source, target)
+    log(f'  copia inicial: {receipts} recibos, {products} productos')
+
+    ShardAssignment.objects.update_or_create(user_id=user_id, defaults={'shard': source, 'frozen': True})
+    try:
+        # Con transaction_mode IMMEDIATE el BEGIN toma el lock de escritura del
+        # origen: espera a que terminen las escrituras en curso del usuario. La
+        # conmutación va dentro, así que las que esperan el lock ya la ven
+        with transaction.atomic(using=source):
+            copied = _copy_user(user_id, source, target)
+            ShardAssignment.objects.filter(user_id=user_id).update(shard=target, frozen=False)
+        log_reset(target, user_id)
+    except Exception:
+        ShardAssignment.objects.filter(user_id=user_id).update(frozen=False)
+        raise
+    log(f'  re-sincronizado y conmutado a {target}: {copied[0]} recibos, {copied[1]} productos')
+
+    with suspended():
+        Receipt.objects.using(source).filter(owner_id=user_id).delete()
+    return source, copied
+
+
+def pin_existing(log=None):
+    """Fija a cada usuario al shard donde ya están sus datos si el hash no coincide
+
+    Necesario al añadir shards: el hash de algunos usuarios cambia, pero sus
+    datos siguen donde estaban hasta que se muevan con ``move_user``.
+    """
+    from receipts.models import Receipt
+    from users.models import ShardAssignment
+
+    log = log or (lambda message: None)
+    pinned = 0
+    assigned = set(ShardAssignment.objects.values_list('user_id', flat=True))
+    for alias in settings.RECEIPT_SHARDS:
+        owners = Receipt.objects.using(alias).exclude(owner_id=None).values_list('owner_id', flat=True).distinct()
+        for owner_id in owners:
+            if owner_id in assigned:
+                continue
+            if hashed_shard(owner_id) != alias:
+                ShardAssignment.objects.create(user_id=owner_id, shard=alias)
+                assigned.add(owner_id)
+                pinned += 1
+                log(f'  usuario {owner_id} fijado a {alias} (hash: {hashed_shard(owner_id)})')
+    return pinned
@@ -0,0 +1,35 @@
+# base.py - Backend SQLite con pragmas de concurrencia
+#
+# Igual que django.db.backends.sqlite3, pero aplica al abrir cada conexión los
+# pragmas de OPTIONS['pragmas'] (WAL, busy_timeout, synchronous, mmap_size,
+# cache_size...). En WAL los lectores no se bloquean detrás del escritor y
+# busy_timeout hace que un escritor espere el lock en lugar de fallar con
+# "database is locked".
+
+from django.db.backends.sqlite3 import base
+
+DEFAULT_PRAGMAS = {
+    'journal_mode': 'WAL',
+    'synchronous': 'NORMAL',  # Seguro en WAL: solo se pierde la última transacción ante un corte de luz
+    'busy_timeout': 5000,
+    'cache_size': -20000,  # KiB (negativo): ~20 MB de caché de páginas por conexión
+    'mmap_size': 268435456,  # 256 MB
+    'temp_store': 'MEMORY',
+}
+
+
+class DatabaseWrapper(base.DatabaseWrapper):
+    def get_connection_params(self):
+        params = super().get_connection_params()
+        params.pop('pragmas', None)
+        return params
+
+    @property
+    def pragmas(self):
+        return {**DEFAULT_PRAGMAS, **self.settings_dict['OPTIONS'].get('pragmas', {})}
+
+    def get_new_connection(self, conn_params):
+        conn = super().get_new_connection(conn_params)
+        for name, value in self.pragmas.items():
+            conn.execute(f'PRAGMA {name} = {value}')
+        return conn
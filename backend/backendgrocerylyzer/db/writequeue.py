@@ -0,0 +1,131 @@
+# writequeue.py - Cola de escrituras serializada del proceso
+#
+# SQLite admite un único escritor a la vez. En lugar de que cada hilo compita
+# por el lock (y falle con "database is locked" o espere en busy_timeout), las
+# escrituras se encolan y las ejecuta un único hilo escritor. Los trabajos que
+# se acumulan mientras se escribe se agrupan en una sola transacción (un solo
+# commit/fsync para todo el lote), cada uno en su propio savepoint para que el
+# fallo de uno no afecte al resto.
+#
+# ``run_write`` es síncrona para quien la llama: devuelve el resultado del
+# trabajo o relanza su excepción. Se ejecuta en línea (en el hilo llamante,
+# dentro de transaction.atomic) si la cola está desactivada
+# (SQLITE_WRITE_QUEUE = False) o si ya estamos dentro de un bloque atómico,
+# porque entonces la escritura tiene que formar parte de esa transacción.
+
+import logging
+import queue
+import threading
+import time
+from concurrent.futures import Future
+
+from django.conf import settings
+from django.db import connections, transaction
+
+from backendgrocerylyzer import metrics
+
+logger = logging.getLogger(__name__)
+
+MAX_BATCH = 64
+
+
+class _Job:
+    __slots__ = ('fn', 'args', 'kwargs', 'future', 'enqueued')
+
+    def __init__(self, fn, args, kwargs):
+        self.fn = fn
+        self.args = args
+        self.kwargs = kwargs
+        self.future = Future()
+        self.enqueued = time.perf_counter()
+
+
+class WriteQueue:
+    """Hilo escritor único para un alias de base de datos"""
+
+    def __init__(self, using='default', max_batch=MAX_BATCH):
+        self.using = using
+        self.max_batch = max_batch
+        self._queue = queue.Queue()
+        self._thread = None
+        self._start_lock = threading.Lock()
+
+    def submit(self, fn, *args, **kwargs):
+        self._ensure_started()
+        job = _Job(fn, args, kwargs)
+        self._queue.put(job)
+        return job.future
+
+    def is_writer_thread(self):
+        return self._thread is not None and threading.current_thread() is self._thread
+
+    def _ensure_started(self):
+        if self._thread is not None and self._thread.is_alive():
+            return
+        with self._start_lock:
+            if self._thread is None or not self._thread.is_alive():
+                self._thread = threading.Thread(
+                    target=self._run, name=f'sqlite-writer-{self.using}', daemon=True
+                )
+                self._thread.start()
+
+    def _run(self):
+        while True:
+            batch = [self._queue.get()]
+            # Agrupar lo que ya esté esperando, sin retrasar la primera escritura
+            while len(batch) < self.max_batch:
+                try:
+                    batch.append(self._queue.get_nowait())
+                except queue.Empty:
+                    break
+            self._run_batch(batch)
+
+    def _run_batch(self, batch):
+        connection = connections[self.using]
+        connection.close_if_unusable_or_obsolete()
+        start = time.perf_counter()
+        done = []
+        try:
+            with transaction.atomic(using=self.using):
+                for job in batch:
+                    try:
+                        with transaction.atomic(using=self.using):
+                            done.append((job, job.fn(*job.args, **job.kwargs)))
+                    except Exception as e:
+                        job.future.set_exception(e)
+        except Exception as e:
+            # Falló el commit: ninguno de los trabajos se ha guardado
+            logger.exception("Error en el lote de escrituras", extra={'jobs': len(batch)})
+            for job, _ in done:
+                job.future.set_exception(e)
+            return
+
+        for job, result in done:
+            job.future.set_result(result)
+            metrics.observe('db.write_queue.wait_ms', (start - job.enqueued) * 1000)
+        metrics.observe('db.write_queue.batch_size', len(batch))
+        metrics.observe('db.write_queue.batch_ms', (time.perf_counter() - start) * 1000)
+
+
+_queues = {}
+_queues_lock = threading.Lock()
+
+
+def get_queue(using='default'):
+    with _queues_lock:
+        if using not in _queues:
+            _queues[using] = WriteQueue(using)
+        return _queues[using]
+
+
+def run_write(fn, *args, using='default', **kwargs):
+    """Ejecuta ``fn(*args, **kwargs)`` como escritura serializada y devuelve su resultado"""
+    write_queue = get_queue(using)
+    if (
+        not settings.SQLITE_WRITE_QUEUE
+        or connections[using].in_atomic_block
+        or write_queue.is_writer_thread()
+    ):
+        with transaction.atomic(using=using):
+            return fn(*args, **kwargs)
+    return write_queue.submit(fn, *args, **kwargs).result()
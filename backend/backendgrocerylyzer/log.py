@@ -0,0 +1,168 @@
+# log.py - Logging estructurado para GroceryLyzer
+#
+# Los módulos usan ``logging.getLogger(__name__)`` y añaden campos con
+# ``extra={...}``. La configuración (settings.LOGGING) envía todo a un
+# QueueHandler: el request solo encola el registro y un hilo aparte hace el
+# formateo JSON y la escritura en stdout.
+
+import atexit
+import copy
+import json
+import logging
+import os
+import queue
+import random
+import time
+import weakref
+from contextlib import contextmanager
+from logging.handlers import QueueHandler, QueueListener
+
+# Atributos estándar de LogRecord; el resto son campos "extra"
+_RESERVED_ATTRS = set(vars(logging.makeLogRecord({}))) | {'message', 'asctime'}
+
+
+class StructuredFormatter(logging.Formatter):
+    """Formatea cada registro como una línea JSON incluyendo los campos extra"""
+
+    def format(self, record):
+        payload = {
+            'ts': round(record.created, 3),
+            'level': record.levelname,
+            'logger': record.name,
+            'msg': record.getMessage(),
+        }
+        for key, value in record.__dict__.items():
+            if key not in _RESERVED_ATTRS and not key.startswith('_'):
+                payload[key] = value
+        if record.exc_info:
+            payload['exc'] = self.formatException(record.exc_info)
+        elif record.exc_text:
+            # Ya formateado al encolarlo (QueueListenerHandler.prepare)
+            payload['exc'] = record.exc_text
+        return json.dumps(payload, default=str, ensure_ascii=False)
+
+
+class SamplingFilter(logging.Filter):
+    """Deja pasar solo una fracción de los registros por debajo de un nivel
+
+    Los registros de nivel ``min_level`` o superior pasan siempre; los de debug
+    (trazas por página, por producto...) se muestrean con probabilidad ``rate``.
+    """
+
+    def __init__(self, rate=1.0, min_level='INFO'):
+        super().__init__()
+        self.rate = float(rate)
+        self.min_level = min_level if isinstance(min_level, int) else logging.getLevelName(min_level)
+        if not isinstance(self.min_level, int):
+            raise ValueError(f'Nivel de log desconocido: {min_level}')
+
+    def filter(self, record):
+        if record.levelno >= self.min_level or self.rate >= 1.0:
+            return True
+        return random.random() < self.rate
+
+
+class QueueListenerHandler(QueueHandler):
+    """QueueHandler que arranca su propio QueueListener
+
+    ``handlers`` son los handlers reales (p.ej. ``cfg://handlers.console``).
+    La cola es acotada y nunca bloquea: si se llena, el registro se descarta y
+    se cuenta en ``dropped`` en lugar de frenar el request.
+
+    Un fork (serve_workers) no copia el hilo del listener: antes del fork se
+    vacía y para la cola, el padre lo vuelve a arrancar y el hijo arranca el
+    suyo con una cola nueva (ganchos registrados una vez para todo el módulo).
+    """
+
+    def __init__(self, handlers, maxsize=10000, respect_handler_level=True):
+        super().__init__(queue.Queue(maxsize))
+        # Acceder por índice resuelve las referencias cfg:// de dictConfig
+        targets = [handlers[i] for i in range(len(handlers))]
+        self.dropped = 0
+        self.maxsize = maxsize
+        self.closed = False
+        self.started = False
+        self.listener = QueueListener(self.queue, *targets, respect_handler_level=respect_handler_level)
+        self._start()
+        _handlers.add(self)
+
+    def _start(self):
+        if not self.started and not self.closed:
+            self.listener.start()
+            self.started = True
+
+    def _stop(self):
+        if self.started:
+            self.started = False
+            self.listener.stop()
+
+    def close(self):
+        # logging.shutdown(): vaciar la cola antes de salir
+        self.closed = True
+        self._stop()
+        super().close()
+
+    def _start_in_child(self):
+        # El hilo se paró antes del fork; la cola puede tener el lock tomado por otro hilo del padre
+        if not self.closed:
+            self.queue = self.listener.queue = queue.Queue(self.maxsize)
+            self._start()
+
+    def prepare(self, record):
+        # El QueueHandler de la stdlib mete el traceback en msg y borra
+        # exc_info; aquí el mensaje queda limpio y el traceback (que no se
+        # puede encolar como objeto) viaja formateado en exc_text
+        exc_text = record.exc_text
+        if record.exc_info:
+            exc_text = logging.Formatter().formatException(record.exc_info)
+        record = copy.copy(record)
+        record.msg = record.message = record.getMessage()
+        record.args = None
+        record.exc_info = None
+        record.exc_text = exc_text
+        return record
+
+    def enqueue(self, record):
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            self.dropped += 1
+
+
+# Handlers vivos, para los ganchos de fork y de salida del proceso
+_handlers = weakref.WeakSet()
+
+
+def _each_handler(method):
+    def hook():
+        for handler in list(_handlers):
+            getattr(handler, method)()
+    return hook
+
+
+atexit.register(_each_handler('_stop'))
+if hasattr(os, 'register_at_fork'):
+    os.register_at_fork(
+        before=_each_handler('_stop'),
+        after_in_parent=_each_handler('_start'),
+        after_in_child=_each_handler('_start_in_child'),
+    )
+
+
+@contextmanager
+def timed(logger, stage, level=logging.DEBUG, **fields):
+    """Mide una etapa y la registra con ``stage`` y ``duration_ms``
+
+    Devuelve un dict donde el bloque puede añadir más campos::
+
+        with timed(logger, 'pdfplumber', pages=3) as span:
+            span['chars'] = len(text)
+    """
+    start = time.perf_counter()
+    try:
+        yield fields
+    finally:
+        if logger.isEnabledFor(level):
+            fields['stage'] = stage
+            fields['duration_ms'] = round((time.perf_counter() - start) * 1000, 2)
+            logger.log(level, 'stage %s', stage, extra=fields)
@@ -0,0 +1,64 @@
+# memory.py - Memoria residente del proceso (Linux, /proc)
+#
+# tracemalloc solo ve las asignaciones de Python y NumPy; los tensores de
+# torch y los buffers de las librerías nativas del OCR no. Para los
+# benchmarks del OCR se mide el pico de memoria residente (VmHWM), que en
+# Linux se puede reiniciar escribiendo "5" en /proc/self/clear_refs. Fuera de
+# Linux las funciones devuelven None.
+#
+# Con procesos que comparten páginas (fork con los modelos ya cargados) la RSS
+# de cada uno cuenta entera la memoria compartida: ``shared_memory_mb`` lee
+# /proc/<pid>/smaps_rollup, donde la PSS reparte cada página compartida entre
+# los procesos que la usan y las páginas se separan en compartidas y privadas.
+
+
+def _status_kb(field, pid='self'):
+    try:
+        with open(f'/proc/{pid}/status') as status:
+            for line in status:
+                if line.startswith(field + ':'):
+                    return int(line.split()[1])
+    except OSError:
+        pass
+    return None
+
+
+def rss_mb(pid='self'):
+    """Memoria residente actual en MB"""
+    kb = _status_kb('VmRSS', pid)
+    return None if kb is None else kb / 1024
+
+
+def peak_rss_mb():
+    """Pico de memoria residente del proceso (desde el arranque o el último reset) en MB"""
+    kb = _status_kb('VmHWM')
+    return None if kb is None else kb / 1024
+
+
+def reset_peak_rss():
+    """Reinicia el pico de memoria residente; False si el sistema no lo permite"""
+    try:
+        with open('/proc/self/clear_refs', 'w') as clear_refs:
+            clear_refs.write('5')
+        return True
+    except OSError:
+        return False
+
+
+def shared_memory_mb(pid='self'):
+    """{'rss', 'pss', 'shared', 'private'} en MB según smaps_rollup, o None"""
+    fields = {}
+    try:
+        with open(f'/proc/{pid}/smaps_rollup') as rollup:
+            for line in rollup:
+                parts = line.split()
+                if len(parts) == 3 and parts[2] == 'kB':
+                    fields[parts[0].rstrip(':')] = int(parts[1])
+    except OSError:
+        return None
+    return {
+        'rss': fields.get('Rss', 0) / 1024,
+        'pss': fields.get('Pss', 0) / 1024,
+        'shared': (fields.get('Shared_Clean', 0) + fields.get('Shared_Dirty', 0)) / 1024,
+        'private': (fields.get('Private_Clean', 0) + fields.get('Private_Dirty', 0)) / 1024,
+    }
@@ -0,0 +1,88 @@
+# metrics.py - Métricas en memoria del proceso
+#
+# Registro mínimo de series (count/sum/min/max + percentiles sobre una muestra
+# acotada de los últimos valores). Cada worker tiene sus propias series; el
+# endpoint /api/metrics/ expone las del proceso que atiende la petición.
+
+import threading
+from collections import deque
+
+from django.conf import settings
+from django.http import JsonResponse
+from django.views.decorators.http import require_http_methods
+
+SAMPLE_SIZE = 512
+
+_lock = threading.Lock()
+_series = {}
+
+
+class _Series:
+    __slots__ = ('count', 'total', 'min', 'max', 'samples')
+
+    def __init__(self):
+        self.count = 0
+        self.total = 0.0
+        self.min = None
+        self.max = None
+        self.samples = deque(maxlen=SAMPLE_SIZE)
+
+    def add(self, value):
+        self.count += 1
+        self.total += value
+        self.min = value if self.min is None else min(self.min, value)
+        self.max = value if self.max is None else max(self.max, value)
+        self.samples.append(value)
+
+    def as_dict(self):
+        ordered = sorted(self.samples)
+
+        def percentile(p):
+            return ordered[min(len(ordered) - 1, int(p * len(ordered)))] if ordered else None
+
+        return {
+            'count': self.count,
+            'sum': round(self.total, 3),
+            'avg': round(self.total / self.count, 3) if self.count else None,
+            'min': self.min,
+            'max': self.max,
+            'p50': percentile(0.50),
+            'p95': percentile(0.95),
+            'p99': percentile(0.99),
+        }
+
+
+def observe(name, value, **labels):
+    """Registra un valor en la serie ``name`` con las etiquetas dadas"""
+    key = (name, tuple(sorted(labels.items())))
+    with _lock:
+        series = _series.get(key)
+        if series is None:
+            series = _series[key] = _Series()
+        series.add(value)
+
+
+def snapshot():
+    """Devuelve todas las series como lista de dicts serializables"""
+    with _lock:
+        return [
+            {'name': name, 'labels': dict(labels), **series.as_dict()}
+            for (name, labels), series in sorted(_series.items())
+        ]
+
+
+def reset():
+    with _lock:
+        _series.clear()
+
+
+@require_http_methods(["GET"])
+def metrics_view(request):
+    """API endpoint con las métricas del proceso (solo staff fuera de DEBUG)"""
+    if not settings.DEBUG and not (request.user.is_authenticated and request.user.is_staff):
+        return JsonResponse({'error': 'No autorizado'}, status=403)
+
+    return JsonResponse({
+        'success': True,
+        'metrics': snapshot()
+    })
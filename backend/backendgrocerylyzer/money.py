@@ -0,0 +1,39 @@
+# money.py - Importes en céntimos enteros
+#
+# Receipt.total_cents, Product.price_cents y UserProfile.total_spent_cents son
+# MoneyField: enteros de céntimos. Las sumas (en SQL y en Python) son exactas
+# y baratas, y los importes solo se convierten a euros al construir la
+# respuesta JSON (``to_euros``). Lo que entra en euros (OCR, peticiones de la
+# API, datos de ejemplo) se convierte una vez con ``to_cents``.
+
+from decimal import Decimal, InvalidOperation, ROUND_HALF_UP
+
+from django.db import models
+
+_CENT = Decimal('0.01')
+
+
+class MoneyField(models.BigIntegerField):
+    """Importe en céntimos de euro (entero)"""
+
+    description = 'Importe en céntimos'
+
+
+def to_cents(euros):
+    """Convierte euros (float, int, str o Decimal; None = 0) a céntimos, redondeando .5 hacia arriba"""
+    if euros is None or euros == '':
+        return 0
+    try:
+        # str(): 12.34 * 3 = 37.019999... debe dar 3702, no 3701
+        amount = Decimal(str(euros)).quantize(_CENT, rounding=ROUND_HALF_UP)
+    except InvalidOperation:
+        raise ValueError(f'Importe inválido: {euros!r}')
+    return int(amount.scaleb(2))
+
+
+def to_euros(cents):
+    """Céntimos (también sumas/medias de SQL o enteros de NumPy; None = 0) a euros para JSON"""
+    if cents is None:
+        return 0.0
+    return float(cents) / 100
+
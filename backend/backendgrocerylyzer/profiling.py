@@ -0,0 +1,159 @@
+# profiling.py - Captura opcional de perfiles cProfile por petición
+#
+# ProfilerMiddleware perfila una petición cuando trae la cabecera
+# X-Profile-Token firmada (ver ``manage.py profiler_token``) o cuando cae en
+# la tasa de muestreo. Los perfiles se guardan como ficheros .prof en un
+# directorio acotado (anillo: se borran los más antiguos) y se listan desde
+# /admin/profiles/. Con PROFILER_ENABLED = False el middleware se retira de
+# la cadena al arrancar (MiddlewareNotUsed), así que no añade coste alguno.
+#
+# Se perfila una sola petición a la vez por proceso: desde Python 3.12 cProfile
+# no admite dos perfiladores activos (enable() lanza ValueError), así que con
+# el perfilador ocupado la petición se atiende sin perfilar.
+
+import cProfile
+import io
+import logging
+import pstats
+import random
+import re
+import threading
+import time
+from pathlib import Path
+
+from django.conf import settings
+from django.contrib.admin.views.decorators import staff_member_required
+from django.core import signing
+from django.core.exceptions import MiddlewareNotUsed
+from django.http import FileResponse, Http404, HttpResponse, JsonResponse
+from django.views.decorators.http import require_http_methods
+
+logger = logging.getLogger(__name__)
+
+TOKEN_HEADER = 'HTTP_X_PROFILE_TOKEN'
+TOKEN_SALT = 'grocerylyzer.profiler'
+
+_PROFILE_NAME = re.compile(r'^[\w.-]+\.prof$')
+_SORT_KEYS = ('cumulative', 'tottime', 'calls')
+_profiling = threading.Lock()
+
+
+def make_token():
+    """Genera un token firmado válido durante PROFILER_TOKEN_MAX_AGE segundos"""
+    return signing.TimestampSigner(salt=TOKEN_SALT).sign('profile')
+
+
+def _valid_token(token):
+    try:
+        signing.TimestampSigner(salt=TOKEN_SALT).unsign(token, max_age=settings.PROFILER_TOKEN_MAX_AGE)
+        return True
+    except signing.BadSignature:
+        return False
+
+
+def _profile_dir():
+    return Path(settings.PROFILER_DIR)
+
+
+class ProfilerMiddleware:
+    """Perfila peticiones con token firmado o por muestreo"""
+
+    def __init__(self, get_response):
+        if not settings.PROFILER_ENABLED:
+            raise MiddlewareNotUsed()
+        self.get_response = get_response
+        self.sample_rate = settings.PROFILER_SAMPLE_RATE
+        self.path_prefixes = tuple(settings.PROFILER_PATH_PREFIXES)
+        _profile_dir().mkdir(parents=True, exist_ok=True)
+
+    def __call__(self, request):
+        if not self._should_profile(request) or not _profiling.acquire(blocking=False):
+            return self.get_response(request)
+
+        try:
+            profiler = cProfile.Profile()
+            start = time.perf_counter()
+            profiler.enable()
+            try:
+                response = self.get_response(request)
+            finally:
+                profiler.disable()
+        finally:
+            _profiling.release()
+        duration_ms = (time.perf_counter() - start) * 1000
+
+        name = self._store(profiler, request, duration_ms)
+        response['X-Profile-Id'] = name
+        return response
+
+    def _should_profile(self, request):
+        if not request.path.startswith(self.path_prefixes):
+            return False
+        token = request.META.get(TOKEN_HEADER)
+        if token:
+            return _valid_token(token)
+        return self.sample_rate > 0 and random.random() < self.sample_rate
+
+    def _store(self, profiler, request, duration_ms):
+        slug = re.sub(r'[^\w]+', '_', request.path).strip('_')[:60]
+        name = f"{time.time():.3f}_{request.method}_{slug}_{duration_ms:.0f}ms.prof"
+        profiler.dump_stats(str(_profile_dir() / name))
+        _trim_ring()
+        logger.info("Perfil capturado", extra={'profile': name, 'path': request.path, 'duration_ms': round(duration_ms, 2)})
+        return name
+
+
+def _list_profiles():
+    """Perfiles guardados, del más reciente al más antiguo"""
+    directory = _profile_dir()
+    if not directory.exists():
+        return []
+    return sorted(directory.glob('*.prof'), key=lambda p: p.stat().st_mtime, reverse=True)
+
+
+def _trim_ring():
+    for old in _list_profiles()[settings.PROFILER_MAX_FILES:]:
+        old.unlink(missing_ok=True)
+
+
+@staff_member_required
+@require_http_methods(["GET"])
+def profiles_list_view(request):
+    """Listado de perfiles capturados (solo staff)"""
+    profiles = []
+    for path in _list_profiles():
+        stat = path.stat()
+        profiles.append({
+            'name': path.name,
+            'size': stat.st_size,
+            'created': time.strftime('%Y-%m-%d %H:%M:%S', time.localtime(stat.st_mtime)),
+        })
+
+    return JsonResponse({
+        'success': True,
+        'enabled': settings.PROFILER_ENABLED,
+        'max_files': settings.PROFILER_MAX_FILES,
+        'count': len(profiles),
+        'profiles': profiles
+    })
+
+
+@staff_member_required
+@require_http_methods(["GET"])
+def profile_detail_view(request, name):
+    """Descarga un perfil (.prof) o, con ?format=text, su resumen pstats"""
+    if not _PROFILE_NAME.match(name):
+        raise Http404()
+    path = _profile_dir() / name
+    if not path.exists():
+        raise Http404()
+
+    if request.GET.get('format') == 'text':
+        output = io.StringIO()
+        sort = request.GET.get('sort', 'cumulative')
+        if sort not in _SORT_KEYS:
+            sort = 'cumulative'
+        pstats.Stats(str(path), stream=output).sort_stats(sort).print_stats(40)
+        return HttpResponse(output.getvalue(), content_type='text/plain; charset=utf-8')
+
+    return FileResponse(path.open('rb'), as_attachment=True, filename=name)
@@ -0,0 +1,186 @@
+# sessions.py - Sesiones con pocas escrituras en base de datos
+#
+# SessionStore extiende cached_db: las sesiones calientes se leen de una caché
+# compartida por los workers (alias SESSION_CACHE_ALIAS) y solo se escriben en la tabla
+# django_session cuando su contenido cambia (login, logout, datos nuevos).
+#
+# La expiración se renueva de forma perezosa: SessionRenewalMiddleware marca la
+# sesión para guardar solo cuando ha pasado SESSION_RENEW_FRACTION de su
+# duración desde la última renovación. Esas renovaciones no tocan los datos,
+# así que van a la caché al momento y a la base de datos en diferido
+# (write-behind): se acumulan y se vuelcan con un único bulk_update cada
+# SESSION_WRITE_BEHIND_INTERVAL segundos o al llegar a SESSION_WRITE_BEHIND_MAX.
+#
+# La caché tiene que ser compartida entre workers (settings.CACHES['sessions']):
+# un logout o flush borra la entrada y ningún otro proceso sigue autenticando
+# con una copia propia. La renovación solo en caché no llega a los datos de la
+# tabla; al leer de la base de datos se deduce de expire_date.
+
+import atexit
+import logging
+import threading
+import time
+
+from django.conf import settings
+from django.contrib.sessions.backends.cached_db import SessionStore as CachedDBStore
+from django.contrib.sessions.backends.db import SessionStore as DBStore
+
+logger = logging.getLogger(__name__)
+
+RENEWED_KEY = '_renewed_at'
+
+_lock = threading.Lock()
+_pending = {}  # session_key -> nueva fecha de expiración
+_pending_since = None
+
+
+class SessionStore(CachedDBStore):
+    """Sesión cached_db con renovación perezosa y write-behind de la expiración"""
+
+    cache_key_prefix = 'grocerylyzer.sessions'
+
+    def __init__(self, session_key=None):
+        super().__init__(session_key)
+        self._renewal_only = False
+
+    def _cache_timeout(self, expiry=None):
+        return max(0, min(self.get_expiry_age(expiry=expiry), settings.SESSION_CACHE_TIMEOUT))
+
+    def load(self):
+        try:
+            data = self._cache.get(self.cache_key)
+        except Exception:
+            data = None
+
+        if data is None:
+            s = self._get_session_from_db()
+            if s:
+                data = self.decode(s.session_data)
+                # La última renovación pudo quedarse solo en la caché (y en
+                # expire_date): sin esto se renovaría en cada fallo de caché
+                renewed_at = int(s.expire_date.timestamp()) - self.get_session_cookie_age()
+                data[RENEWED_KEY] = max(data.get(RENEWED_KEY, 0), renewed_at)
+                self._cache.set(self.cache_key, data, self._cache_timeout(expiry=s.expire_date))
+            else:
+                data = {}
+        return data
+
+    def needs_renewal(self):
+        """True si ha pasado la fracción configurada de la duración desde la última renovación"""
+        renewed_at = self.get(RENEWED_KEY)
+        if renewed_at is None:
+            return True
+        return time.time() - renewed_at >= settings.SESSION_RENEW_FRACTION * self.get_session_cookie_age()
+
+    def renew(self):
+        """Marca la sesión para renovar su expiración sin reescribir los datos"""
+        self._renewal_only = True
+        self.modified = True
+
+    def save(self, must_create=False):
+        if self._renewal_only and not must_create and self.session_key:
+            self._renewal_only = False
+            self._session[RENEWED_KEY] = int(time.time())
+            self._cache.set(self.cache_key, self._session, self._cache_timeout())
+            _enqueue(self.session_key, self.get_expiry_date())
+            return
+
+        # Escritura completa: descarta cualquier renovación pendiente de esta sesión
+        if self.session_key:
+            _discard(self.session_key)
+        data = self._get_session(no_load=must_create)
+        if data:
+            data[RENEWED_KEY] = int(time.time())
+        DBStore.save(self, must_create)
+        try:
+            self._cache.set(self.cache_key, self._session, self._cache_timeout())
+        except Exception:
+            logger.exception("Error guardando la sesión en caché")
+
+
+def _enqueue(session_key, expire_date):
+    global _pending_since
+    with _lock:
+        if not _pending:
+            _pending_since = time.monotonic()
+        _pending[session_key] = expire_date
+    flush_pending()
+
+
+def _discard(session_key):
+    with _lock:
+        _pending.pop(session_key, None)
+
+
+def pending_count():
+    with _lock:
+        return len(_pending)
+
+
+def flush_pending(force=False):
+    """Vuelca las renovaciones pendientes si toca (o siempre con ``force``); devuelve cuántas"""
+    global _pending_since
+    with _lock:
+        if not _pending:
+            return 0
+        due = (
+            force
+            or len(_pending) >= settings.SESSION_WRITE_BEHIND_MAX
+            or time.monotonic() - _pending_since >= settings.SESSION_WRITE_BEHIND_INTERVAL
+        )
+        if not due:
+            return 0
+        batch = dict(_pending)
+        _pending.clear()
+
+    # Solo la expiración: los datos en la base de datos no se sobrescriben
+    Session = SessionStore.get_model_class()
+    try:
+        Session.objects.bulk_update(
+            [Session(session_key=key, expire_date=expire_date) for key, expire_date in batch.items()],
+            ['expire_date'],
+            batch_size=500,
+        )
+    except Exception:
+        # Una renovación perdida solo adelanta la expiración de la sesión
+        logger.exception("Error volcando renovaciones de sesión", extra={'sessions': len(batch)})
+        return 0
+    logger.debug("Renovaciones de sesión volcadas", extra={'sessions': len(batch)})
+    return len(batch)
+
+
+def _flush_at_exit():
+    try:
+        flush_pending(force=True)
+    except Exception:
+        pass
+
+
+atexit.register(_flush_at_exit)
+
+
+class SessionRenewalMiddleware:
+    """Renueva la expiración de las sesiones usadas solo cuando hace falta
+
+    Va justo después de SessionMiddleware, que guarda la sesión al responder
+    si está marcada como modificada.
+    """
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        response = self.get_response(request)
+        session = getattr(request, 'session', None)
+        if (
+            session is not None
+            and hasattr(session, 'renew')
+            and session.accessed
+            and not session.modified
+            and not session.is_empty()
+            and response.status_code != 500
+            and session.needs_renewal()
+        ):
+            session.renew()
+        flush_pending()
+        return response
@@ -10,6 +10,7 @@ For the full list of settings and their values, see
 https://docs.djangoproject.com/en/5.1/ref/settings/
 """
 
+import os
 from pathlib import Path
 
 # Build paths inside the project like this: BASE_DIR / 'subdir'.
@@ -40,14 +41,17 @@ INSTALLED_APPS = [
     'rest_framework',
     'corsheaders',
     'users',
+    'catalog',
     'receipts',
     'analytics'
 ]
 
 MIDDLEWARE = [
+    'backendgrocerylyzer.profiling.ProfilerMiddleware',
     'corsheaders.middleware.CorsMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
+    'backendgrocerylyzer.sessions.SessionRenewalMiddleware',
     'django.middleware.common.CommonMiddleware',
     'django.middleware.csrf.CsrfViewMiddleware',
     'django.contrib.auth.middleware.AuthenticationMiddleware',
@@ -101,13 +105,76 @@ WSGI_APPLICATION = 'backendgrocerylyzer.wsgi.application'
 # Database
 # https://docs.djangoproject.com/en/5.1/ref/settings/#databases
 
+# Backend SQLite propio (backendgrocerylyzer/db/sqlite3): WAL y pragmas de
+# concurrencia al conectar. Las conexiones se reutilizan entre peticiones
+# (CONN_MAX_AGE) y las transacciones toman el lock de escritura al empezar
+# (IMMEDIATE), así que esperan en busy_timeout en vez de fallar al promocionar.
 DATABASES = {
     'default': {
-        'ENGINE': 'django.db.backends.sqlite3',
+        'ENGINE': 'backendgrocerylyzer.db.sqlite3',
         'NAME': BASE_DIR / 'db.sqlite3',
+        'CONN_MAX_AGE': int(os.environ.get('GROCERYLYZER_DB_CONN_MAX_AGE', '600')),
+        'CONN_HEALTH_CHECKS': True,
+        'OPTIONS': {
+            'timeout': 20,
+            'transaction_mode': 'IMMEDIATE',
+            'pragmas': {
+                'journal_mode': 'WAL',
+                'synchronous': 'NORMAL',
+                'busy_timeout': 20000,
+                'cache_size': -20000,
+                'mmap_size': 268435456,
+            },
+        },
     }
 }
 
+# Sharding de recibos por usuario (backendgrocerylyzer/db/sharding.py): con
+# GROCERYLYZER_RECEIPT_SHARDS=N los recibos y productos se reparten entre
+# 'default' y N-1 ficheros SQLite más. Usuarios, sesiones y perfiles siguen en
+# 'default'. Al añadir shards, ``manage.py rebalance_shards --pin`` fija a los
+# usuarios existentes donde ya están sus datos.
+RECEIPT_SHARDS = ['default']
+SHARD_ID_SPAN = 10 ** 12  # ids de cada shard: índice * SHARD_ID_SPAN en adelante
+for _index in range(1, int(os.environ.get('GROCERYLYZER_RECEIPT_SHARDS', '1'))):
+    RECEIPT_SHARDS.append(f'shard_{_index}')
+    DATABASES[f'shard_{_index}'] = {
+        **DATABASES['default'],
+        'NAME': BASE_DIR / f'db.shard{_index}.sqlite3',
+    }
+
+# Réplica de lectura para analytics (backendgrocerylyzer/db/replica.py): con
+# GROCERYLYZER_ANALYTICS_REPLICA=<ruta> las vistas de analytics leen de esa copia
+# SQLite, refrescada con ``manage.py snapshot_replica --interval 60``. Tras una
+# escritura del usuario, sus analytics leen de la principal durante la ventana.
+ANALYTICS_REPLICA_ALIAS = None
+ANALYTICS_REPLICA_SNAPSHOT_INTERVAL = int(os.environ.get('GROCERYLYZER_ANALYTICS_REPLICA_INTERVAL', '60'))
+ANALYTICS_REPLICA_RYW_WINDOW = 2 * ANALYTICS_REPLICA_SNAPSHOT_INTERVAL
+ANALYTICS_REPLICA_RYW_CACHE = 'shared'  # La marca debe verla cualquier worker
+if os.environ.get('GROCERYLYZER_ANALYTICS_REPLICA'):
+    ANALYTICS_REPLICA_ALIAS = 'replica'
+    DATABASES[ANALYTICS_REPLICA_ALIAS] = {
+        'ENGINE': 'backendgrocerylyzer.db.sqlite3',
+        'NAME': os.environ['GROCERYLYZER_ANALYTICS_REPLICA'],
+        'CONN_MAX_AGE': DATABASES['default']['CONN_MAX_AGE'],
+        'CONN_HEALTH_CHECKS': True,
+        'OPTIONS': {'pragmas': {'query_only': 1}},
+        'TEST': {'MIRROR': 'default'},
+    }
+
+# Snapshots columnares de analytics (analytics/columnar.py): usuarios que cada
+# proceso mantiene en memoria
+ANALYTICS_SNAPSHOT_MAX_USERS = int(os.environ.get('GROCERYLYZER_ANALYTICS_SNAPSHOT_USERS', '32'))
+
+DATABASE_ROUTERS = [
+    'backendgrocerylyzer.db.sharding.ReceiptShardRouter',
+    'backendgrocerylyzer.db.replica.AnalyticsReplicaRouter',
+]
+
+# Escrituras de la ingesta serializadas en un único hilo escritor por proceso
+# (backendgrocerylyzer/db/writequeue.py)
+SQLITE_WRITE_QUEUE = os.environ.get('GROCERYLYZER_SQLITE_WRITE_QUEUE', '1') == '1'
+
 
 # Password validation
 # https://docs.djangoproject.com/en/5.1/ref/settings/#auth-password-validators
@@ -145,14 +212,44 @@ USE_TZ = True
 
 STATIC_URL = 'static/'
 
+# 'default' es memoria del proceso. 'sessions' y 'shared' la comparten todos
+# los workers de la máquina (ficheros en CACHE_DIR): un logout en uno invalida
+# la sesión en todos y la marca de escritura reciente de analytics la ven todos.
+# Con varias máquinas, apuntarlas a una caché de red (Redis, Memcached).
+CACHE_DIR = Path(os.environ.get('GROCERYLYZER_CACHE_DIR', str(BASE_DIR / 'cache')))
+CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+    },
+    'sessions': {
+        'BACKEND': 'django.core.cache.backends.filebased.FileBasedCache',
+        'LOCATION': str(CACHE_DIR / 'sessions'),
+        'OPTIONS': {'MAX_ENTRIES': 10000},
+    },
+    'shared': {
+        'BACKEND': 'django.core.cache.backends.filebased.FileBasedCache',
+        'LOCATION': str(CACHE_DIR / 'shared'),
+        'OPTIONS': {'MAX_ENTRIES': 10000},
+    },
+}
+
 # Default primary key field type
 # https://docs.djangoproject.com/en/5.1/ref/settings/#default-auto-field
 
 DEFAULT_AUTO_FIELD = 'django.db.models.BigAutoField'
 
 # Configuración de sesiones
+# Sesiones con pocas escrituras (backendgrocerylyzer/sessions.py): caché
+# compartida para las lecturas y renovación perezosa de la expiración en lugar
+# de un UPDATE de django_session en cada petición.
+SESSION_ENGINE = 'backendgrocerylyzer.sessions'
+SESSION_CACHE_ALIAS = 'sessions'
 SESSION_COOKIE_AGE = 86400  # 24 horas
-SESSION_SAVE_EVERY_REQUEST = True
+SESSION_SAVE_EVERY_REQUEST = False
+SESSION_RENEW_FRACTION = float(os.environ.get('GROCERYLYZER_SESSION_RENEW_FRACTION', '0.1'))
+SESSION_CACHE_TIMEOUT = 300  # segundos que una sesión se sirve de la caché sin releerla
+SESSION_WRITE_BEHIND_INTERVAL = 30  # segundos entre volcados de renovaciones
+SESSION_WRITE_BEHIND_MAX = 500
 SESSION_COOKIE_HTTPONLY = True
 SESSION_COOKIE_SAMESITE = 'Lax'
 
@@ -162,3 +259,105 @@ if DEBUG:
     CSRF_COOKIE_SECURE = False
     SESSION_COOKIE_SAMESITE = None
     CSRF_COOKIE_SAMESITE = None
+
+# Configuración de logging
+# Nivel y muestreo configurables por entorno: en producción usar INFO para que
+# las trazas de debug del OCR no cuesten nada; GROCERYLYZER_LOG_SAMPLE_RATE
+# permite activar DEBUG guardando solo una fracción de los registros.
+LOG_LEVEL = os.environ.get('GROCERYLYZER_LOG_LEVEL', 'DEBUG' if DEBUG else 'INFO')
+LOG_SAMPLE_RATE = float(os.environ.get('GROCERYLYZER_LOG_SAMPLE_RATE', '1.0'))
+
+LOGGING = {
+    'version': 1,
+    'disable_existing_loggers': False,
+    'formatters': {
+        'structured': {
+            '()': 'backendgrocerylyzer.log.StructuredFormatter',
+        },
+    },
+    'filters': {
+        'sampling': {
+            '()': 'backendgrocerylyzer.log.SamplingFilter',
+            'rate': LOG_SAMPLE_RATE,
+        },
+    },
+    'handlers': {
+        'console': {
+            'class': 'logging.StreamHandler',
+            'formatter': 'structured',
+        },
+        # La escritura real la hace un hilo aparte; el request solo encola
+        'queue': {
+            '()': 'backendgrocerylyzer.log.QueueListenerHandler',
+            'handlers': ['cfg://handlers.console'],
+            'filters': ['sampling'],
+        },
+    },
+    'loggers': {
+        app: {'handlers': ['queue'], 'level': LOG_LEVEL, 'propagate': False}
+        for app in ('backendgrocerylyzer', 'receipts', 'analytics', 'users')
+    },
+}
+
+# Adjuntar las trazas por etapa del pipeline de ingesta a la respuesta del
+# upload (también se puede pedir por petición con ?debug=1)
+INGESTION_DEBUG_TRACE = os.environ.get('GROCERYLYZER_INGESTION_DEBUG_TRACE', '0') == '1'
+
+# Perfilado opcional por petición (cProfile). Desactivado no tiene coste: el
+# middleware se retira de la cadena al arrancar. Activado, perfila peticiones
+# con cabecera X-Profile-Token firmada (manage.py profiler_token) o una
+# fracción aleatoria PROFILER_SAMPLE_RATE de las rutas en PROFILER_PATH_PREFIXES.
+PROFILER_ENABLED = os.environ.get('GROCERYLYZER_PROFILER', '0') == '1'
+PROFILER_SAMPLE_RATE = float(os.environ.get('GROCERYLYZER_PROFILER_SAMPLE_RATE', '0'))
+PROFILER_PATH_PREFIXES = ['/api/analytics/', '/api/receipts/']
+PROFILER_DIR = BASE_DIR / 'profiles'
+PROFILER_MAX_FILES = 50
+PROFILER_TOKEN_MAX_AGE = 3600  # 1 hora
+
+# OCR de recibos escaneados. ``manage.py ocr_service`` arranca un único proceso
+# con los modelos cargados que escucha en OCR_SERVICE_SOCKET y agrupa las
+# páginas de todos los workers en micro-lotes (OCR_SERVICE_BATCH_SIZE páginas
+# o OCR_SERVICE_MAX_WAIT_MS de espera). Si no está arrancado el worker hace el
+# OCR en su propio proceso; con OCR_LOCAL_FALLBACK=0 (cada worker cargaría sus
+# propios modelos) no, y la subida de un recibo escaneado falla.
+OCR_LANGUAGES = ['es', 'en']
+OCR_SERVICE_ENABLED = os.environ.get('GROCERYLYZER_OCR_SERVICE', '1') == '1'
+OCR_SERVICE_SOCKET = os.environ.get('GROCERYLYZER_OCR_SOCKET', str(BASE_DIR / 'ocr.sock'))
+OCR_SERVICE_CONNECT_TIMEOUT = 0.5  # segundos
+OCR_SERVICE_TIMEOUT = float(os.environ.get('GROCERYLYZER_OCR_TIMEOUT', '60'))  # segundos por documento
+OCR_SERVICE_BATCH_SIZE = int(os.environ.get('GROCERYLYZER_OCR_BATCH_SIZE', '8'))
+OCR_SERVICE_MAX_WAIT_MS = int(os.environ.get('GROCERYLYZER_OCR_MAX_WAIT_MS', '25'))
+OCR_LOCAL_FALLBACK = os.environ.get('GROCERYLYZER_OCR_LOCAL_FALLBACK', '1') == '1'
+# Preprocesado de las páginas antes del OCR (receipts/ocr/preprocess.py): gris,
+# recorte, enderezado, contraste y reducción hasta esta altura de línea
+OCR_PREPROCESS = os.environ.get('GROCERYLYZER_OCR_PREPROCESS', '1') == '1'
+OCR_TARGET_TEXT_HEIGHT = int(os.environ.get('GROCERYLYZER_OCR_TEXT_HEIGHT', '28'))  # píxeles
+# Resolución de rasterizado por página (receipts/ocr/dpi.py): la que da
+# OCR_TARGET_TEXT_HEIGHT a una línea de OCR_TEXT_LINE_PT puntos, sin pasar de
+# la resolución nativa del escaneo ni de OCR_MAX_PAGE_PIXELS
+OCR_TEXT_LINE_PT = float(os.environ.get('GROCERYLYZER_OCR_TEXT_LINE_PT', '10'))
+OCR_MIN_DPI = 100
+OCR_MAX_DPI = 300
+OCR_MAX_PAGE_PIXELS = int(os.environ.get('GROCERYLYZER_OCR_MAX_PAGE_PIXELS', str(12_000_000)))
+# Detección en toda la página y reconocimiento solo de la cabecera y la tabla
+# de productos (receipts/ocr/regions.py); sin anclas se reconoce todo
+OCR_ITEM_REGIONS = os.environ.get('GROCERYLYZER_OCR_ITEM_REGIONS', '1') == '1'
+# Motor OCR por modo (receipts/ocr/engines.py): fast usa OCR_FAST_ENGINE,
+# accurate OCR_ACCURATE_ENGINE y auto el rápido, repitiendo con el preciso las
+# páginas con confianza media por debajo de OCR_ESCALATE_CONFIDENCE (sin el
+# rápido, fast y auto usan el preciso). Cada subida puede pedir su modo con el
+# campo ocr_mode.
+OCR_MODE = os.environ.get('GROCERYLYZER_OCR_MODE', 'auto')
+OCR_FAST_ENGINE = os.environ.get('GROCERYLYZER_OCR_FAST_ENGINE', 'tesseract')
+OCR_ACCURATE_ENGINE = os.environ.get('GROCERYLYZER_OCR_ACCURATE_ENGINE', 'easyocr')
+OCR_ESCALATE_CONFIDENCE = float(os.environ.get('GROCERYLYZER_OCR_ESCALATE_CONFIDENCE', '0.75'))
+OCR_TESSERACT_CMD = os.environ.get('GROCERYLYZER_TESSERACT_CMD', 'tesseract')
+# Inferencia en CPU. OCR_THREADS son los hilos de torch (y de Tesseract) de
+# cada worker que hace OCR en su proceso: con varios workers, núcleos entre
+# workers (el servicio OCR usa todos, ver ocr_service --threads). Modelos
+# cuantizados a int8, red de reconocimiento de EasyOCR y cajas por pasada de
+# la red de reconocimiento. manage.py benchmark_ocr_tuning compara valores.
+OCR_THREADS = int(os.environ.get('GROCERYLYZER_OCR_THREADS', '1'))
+OCR_QUANTIZE = os.environ.get('GROCERYLYZER_OCR_QUANTIZE', '1') == '1'
+OCR_RECOG_NETWORK = os.environ.get('GROCERYLYZER_OCR_RECOG_NETWORK', 'standard')
+OCR_RECOG_BATCH_SIZE = int(os.environ.get('GROCERYLYZER_OCR_RECOG_BATCH_SIZE', '16'))
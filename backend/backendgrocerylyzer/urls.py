@@ -1,9 +1,13 @@
 from django.contrib import admin
 from django.urls import path, include
+from . import metrics, profiling
 
 urlpatterns = [
+    path('admin/profiles/', profiling.profiles_list_view, name='admin_profiles'),
+    path('admin/profiles/<str:name>/', profiling.profile_detail_view, name='admin_profile_detail'),
     path('admin/', admin.site.urls),
     path('api/receipts/', include('receipts.urls')),
     path('api/analytics/', include('analytics.urls')),
-    path('api/users/', include('users.urls'))
+    path('api/users/', include('users.urls')),
+    path('api/metrics/', metrics.metrics_view, name='api_metrics')
 ]
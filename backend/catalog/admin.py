@@ -0,0 +1,41 @@
+from django.contrib import admin
+from .models import ProductAlias, ProductEntity, Supermarket, SupermarketAlias
+
+class SupermarketAliasInline(admin.TabularInline):
+    """Textos normalizados que se resuelven a este supermercado"""
+    model = SupermarketAlias
+    extra = 1
+
+@admin.register(Supermarket)
+class SupermarketAdmin(admin.ModelAdmin):
+    """Dimensión de supermercados (los procesos recargan los alias cada pocos minutos)"""
+    list_display = ('name', 'created_at')
+    search_fields = ('name', 'aliases__alias')
+    inlines = (SupermarketAliasInline,)
+
+@admin.register(SupermarketAlias)
+class SupermarketAliasAdmin(admin.ModelAdmin):
+    """Para reasignar alias al fusionar supermercados"""
+    list_display = ('alias', 'supermarket')
+    search_fields = ('alias', 'supermarket__name')
+    list_select_related = ('supermarket',)
+
+class ProductAliasInline(admin.TabularInline):
+    """Nombres normalizados (con sus errores de OCR) de esta entidad"""
+    model = ProductAlias
+    extra = 0
+
+@admin.register(ProductEntity)
+class ProductEntityAdmin(admin.ModelAdmin):
+    """Entidades de producto (el índice de cada proceso se sincroniza cada pocos segundos)"""
+    list_display = ('name', 'created_at')
+    search_fields = ('name', 'aliases__alias')
+    inlines = (ProductAliasInline,)
+
+@admin.register(ProductAlias)
+class ProductAliasAdmin(admin.ModelAdmin):
+    """Para reasignar alias al fusionar entidades"""
+    list_display = ('alias', 'entity')
+    search_fields = ('alias', 'entity__name')
+    list_select_related = ('entity',)
+    raw_id_fields = ('entity',)
@@ -0,0 +1,116 @@
+from django.core.management.base import BaseCommand
+from catalog.matching import ProductIndex, normalize_product
+from receipts.datasets import BASE_PRODUCTS
+import random
+import statistics
+import time
+
+BRANDS = [
+    'Hacendado', 'Pascual', 'Central Lechera', 'Puleva', 'Kaiku', 'Danone', 'Nestle', 'Carbonell',
+    'Koipe', 'Coosur', 'Bimbo', 'Panrico', 'Gallo', 'Barilla', 'Brillante', 'Sos', 'Calvo', 'Isabel',
+    'Orlando', 'Solis', 'Hellmanns', 'Ybarra', 'Litoral', 'Campofrio', 'Navidul', 'Elpozo', 'Casa Tarradellas',
+    'Pescanova', 'Findus', 'Frudesa', 'Don Simon', 'Granini', 'Font Vella', 'Lanjaron', 'Mahou', 'Estrella',
+    'Colacao', 'Nesquik', 'Cuetara', 'Fontaneda',
+]
+NEW_BRANDS = ['Auchan', 'Deliplus', 'Milbona', 'Carrefour Bio', 'Eliges', 'Alteza', 'Ecocesta', 'Vegalia']
+VARIANTS = ['', ' Eco', ' Bio', ' Light', ' Sin Lactosa', ' Familiar', ' Premium', ' Marca Blanca', ' Tradicional']
+
+# Confusiones típicas del OCR
+_DIGITS = {'a': '4', 'o': '0', 'l': '1', 'e': '3', 's': '5', 'b': '8', 'i': '1'}
+
+
+def synthetic_names(count, rng, brands=BRANDS):
+    """``count`` nombres distintos (marca, producto base, variante y pack)"""
+    names = set()
+    limit = len(BASE_PRODUCTS) * len(brands) * len(VARIANTS) * 12
+    while len(names) < min(count, limit):
+        base, _ = rng.choice(BASE_PRODUCTS)
+        pack = rng.randint(1, 12)
+        names.add(f"{base} {rng.choice(brands)}{rng.choice(VARIANTS)}" + (f' Pack {pack}' if pack > 1 else ''))
+    return sorted(names)
+
+
+def ocr_noise(name, rng):
+    """El nombre en mayúsculas con un error de OCR"""
+    words = name.upper().split()
+    kind = rng.randrange(5)
+    long_words = [i for i, word in enumerate(words) if len(word) >= 6 and word.isalpha()]
+    if kind == 0:  # Letra leída como dígito
+        i = rng.randrange(len(words))
+        chars = [c for c in words[i] if c.lower() in _DIGITS]
+        if chars:
+            words[i] = words[i].replace(chars[0], _DIGITS[chars[0].lower()], 1)
+    elif kind == 1 and long_words:  # Letra perdida
+        i = rng.choice(long_words)
+        j = rng.randrange(1, len(words[i]) - 1)
+        words[i] = words[i][:j] + words[i][j + 1:]
+    elif kind == 2 and long_words:  # Letra cambiada
+        i = rng.choice(long_words)
+        j = rng.randrange(1, len(words[i]) - 1)
+        words[i] = words[i][:j] + rng.choice('ACEILNORSTU') + words[i][j + 1:]
+    elif kind == 3:  # 'm' leída como 'rn'
+        words = [word.replace('M', 'RN', 1) for word in words]
+    elif len(words) > 2:  # Espacio perdido
+        i = rng.randrange(len(words) - 1)
+        words[i:i + 2] = [words[i] + words[i + 1]]
+    return ' '.join(words)
+
+
+class Command(BaseCommand):
+    help = 'Benchmark de la resolución de entidades de producto: latencia por nombre y aciertos con errores de OCR'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--names', type=int, default=200_000, help='Nombres distintos en el índice')
+        parser.add_argument('--queries', type=int, default=5_000, help='Nombres resueltos por escenario')
+        parser.add_argument('--seed', type=int, default=39)
+
+    def handle(self, *args, **options):
+        rng = random.Random(options['seed'])
+        names = synthetic_names(options['names'], rng)
+
+        start = time.perf_counter()
+        index = ProductIndex()
+        for entity_id, name in enumerate(names):
+            index.add(normalize_product(name), entity_id)
+        self.stdout.write(f'Índice: {len(index)} alias en {time.perf_counter() - start:.1f}s')
+
+        queries = options['queries']
+        sample = [rng.randrange(len(names)) for _ in range(queries)]
+        unseen = [name for name in synthetic_names(queries, rng, NEW_BRANDS) if normalize_product(name) not in index]
+        scenarios = [
+            ('repetido', [(names[i].upper(), i) for i in sample]),
+            ('error_ocr', [(ocr_noise(names[i], rng), i) for i in sample]),
+            ('nuevo', [(name, None) for name in unseen]),
+        ]
+
+        self.stdout.write(
+            f"{'escenario':<12}{'p50 µs':>10}{'p95 µs':>10}{'p99 µs':>10}{'máx µs':>10}"
+            f"{'aciertos':>10}{'fallos':>8}{'erróneos':>10}"
+        )
+        worst_p95 = 0
+        for label, cases in scenarios:
+            timings = []
+            hits = misses = wrong = 0
+            for raw, expected in cases:
+                start = time.perf_counter()
+                entity_id, _ = index.match(normalize_product(raw))
+                timings.append((time.perf_counter() - start) * 1_000_000)
+                if entity_id == expected:
+                    hits += 1
+                elif entity_id is None:
+                    misses += 1
+                else:
+                    wrong += 1
+            timings.sort()
+            p95 = timings[int(len(timings) * 0.95)]
+            worst_p95 = max(worst_p95, p95)
+            self.stdout.write(
+                f"{label:<12}{statistics.median(timings):>10.0f}{p95:>10.0f}"
+                f"{timings[int(len(timings) * 0.99)]:>10.0f}{timings[-1]:>10.0f}"
+                f"{hits / len(cases):>10.1%}{misses:>8}{wrong:>10}"
+            )
+
+        if worst_p95 < 1000:
+            self.stdout.write(self.style.SUCCESS('✅ p95 por debajo de 1 ms en todos los escenarios'))
+        else:
+            self.stdout.write(self.style.WARNING(f'p95 de {worst_p95:.0f} µs: por encima de 1 ms'))
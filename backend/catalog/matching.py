@@ -0,0 +1,280 @@
+# matching.py - Resolución de nombres de producto tolerante a errores de OCR
+#
+# "LECHE ENTERA 1L", "LECHE ENTER4 1L" y "Leche Entera 1L" deben acabar en la
+# misma entidad de producto. Comparar cada nombre nuevo con todos los conocidos es
+# cuadrático, y con cientos de miles de nombres casi todos comparten
+# trigramas ("leche", "aceite"...). Pero los errores del OCR son de letras
+# dentro de una palabra o de espacios, y el vocabulario de palabras es
+# pequeño (miles) aunque haya muchísimos nombres. ProductIndex bloquea por
+# palabra:
+#
+#   1. clave exacta: el nombre normalizado ya es un alias conocido (lo normal
+#      al volver a comprar un producto);
+#   2. cada palabra desconocida se corrige contra el vocabulario con dos
+#      claves de bloqueo: su vecindario de borrados (SymSpell: dos palabras a
+#      distancia <= k comparten alguna variante con <= k letras borradas) y un
+#      esqueleto fonético/visual (v=b, rn=m, sin h, sin letras dobles...). Una
+#      palabra que no encaja puede ser dos pegadas ("LECHEENTERA");
+#   3. la firma del nombre corregido (palabras, números y tamaños) se busca
+#      tal cual; el coste total de las correcciones debe quedar dentro del
+#      umbral.
+#
+# Los tamaños ("1l", "500g") y los números sueltos ("Pack 6") forman parte de
+# la identidad y nunca se corrigen: "Leche Entera", "Leche Entera 1L" y
+# "Leche Entera 1,5L" son tres productos (su precio no es comparable), y
+# "Pack 6" no es "Pack 4". Si un tamaño que falta pudiera encajar con
+# cualquiera, el resultado dependería de qué variante se vio antes. Tampoco
+# se confunden "Leche Entera 1L Eco" y "Leche Entera 1L Bio".
+#
+# Este módulo no toca la base de datos (lo usan catalog.products y el
+# benchmark; la migración 0007 de receipts tiene su propia copia).
+
+import re
+import unicodedata
+from array import array
+
+THRESHOLD = 0.85
+# Correcciones que se prueban por palabra y nombres corregidos por consulta
+MAX_WORD_CANDIDATES = 3
+MAX_COMBINATIONS = 12
+
+_TOKEN = re.compile(r'[a-z0-9]+(?:[.,][0-9]+[a-z]*)*')
+_UNITS = r'(?:kg|gr|g|mg|lt|l|ml|cl|uds|ud|un|u)'
+_SIZE = re.compile(rf'^\d+(?:\.\d+)?(?:x\d+(?:\.\d+)?)?{_UNITS}$')
+_NUMBER = re.compile(r'^\d+(?:\.\d+)?$')
+# Espacio perdido junto a un número: "PACK12", "CEBOLLAS1KG", "500GSOS"
+_GLUED_TAIL = re.compile(rf'^([a-z]{{3,}})(\d+(?:\.\d+)?(?:x\d+(?:\.\d+)?)?{_UNITS}?)$')
+_GLUED_HEAD = re.compile(rf'^(\d{{2,}}(?:\.\d+)?{_UNITS})([a-z]{{3,}})$')  # "8LANCA" es "BLANCA"
+# Unidades mal leídas: "400RNL", "75C1"
+_UNIT_FIXES = [(re.compile(r'^(\d+(?:\.\d+)?)(?:rnl|rn1|m1)$'), r'\1ml'), (re.compile(r'^(\d+(?:\.\d+)?)c1$'), r'\1cl'),
+               (re.compile(r'^(\d+(?:\.\d+)?)k9$'), r'\1kg'), (re.compile(r'^(\d+(?:\.\d+)?)rng$'), r'\1mg')]
+# Dígitos que el OCR pone en lugar de letras dentro de una palabra
+_OCR_DIGITS = str.maketrans('0123456789', 'olzeasgtbg')
+_SKELETON = str.maketrans('vzykqwj', 'bsicaux')
+_DOUBLE = re.compile(r'(.)\1+')
+
+
+def normalize_product(name):
+    """Clave del nombre: minúsculas, sin acentos, dígitos de OCR corregidos en palabras
+
+    'LECHE ENTER4 1,5L' -> 'leche entera 1.5l'
+    """
+    text = unicodedata.normalize('NFKD', name or '').encode('ascii', 'ignore').decode().lower()
+    tokens = []
+    for token in _TOKEN.findall(text):
+        if token.isalpha() or token.isdigit():
+            tokens.append(token)
+        else:
+            tokens.extend(_split_token(token.replace(',', '.')))
+    return ' '.join(tokens)
+
+
+def _fix_unit(token):
+    for pattern, replacement in _UNIT_FIXES:
+        token = pattern.sub(replacement, token)
+    return token
+
+
+def _split_token(token):
+    token = _fix_unit(token)
+    if _SIZE.match(token) or _NUMBER.match(token):
+        return [token]
+    glued = _GLUED_TAIL.match(token)
+    if glued:
+        word, tail = glued.groups()
+        tail = _fix_unit(tail)
+        # "ENTER4" es una letra mal leída; "PACK8", "TRIGO1KG" o "PACK12", un espacio perdido
+        if _SIZE.match(tail) or len(tail) > 1 or word == 'pack':
+            return [word.translate(_OCR_DIGITS), tail]
+    glued = _GLUED_HEAD.match(token)
+    if glued:
+        return list(glued.groups())
+    return [token.translate(_OCR_DIGITS).replace('.', '')]
+
+
+def split_key(key):
+    """(palabras, números, tamaños) de una clave normalizada"""
+    words, numbers, sizes = [], [], []
+    for token in key.split():
+        if token.isalpha():
+            words.append(token)
+        elif _SIZE.match(token):
+            sizes.append(token)
+        elif _NUMBER.match(token):
+            numbers.append(token)
+        else:
+            words.append(token)
+    return tuple(words), tuple(numbers), tuple(sorted(sizes))
+
+
+def skeleton(word):
+    """Clave fonética/visual de una palabra: 'vaso' y 'baso', 'molde' y 'rnolde'..."""
+    word = word.replace('rn', 'm').replace('cl', 'd').replace('qu', 'k').replace('ll', 'y').replace('h', '')
+    return _DOUBLE.sub(r'\1', word.translate(_SKELETON))
+
+
+def max_word_edits(length):
+    """Errores admitidos en una palabra según su longitud ("eco" y "bio" no se confunden)"""
+    if length <= 2:
+        return 0
+    if length <= 5:
+        return 1
+    return 2
+
+
+def deletions(word, distance):
+    """Variantes de ``word`` con hasta ``distance`` letras borradas (incluida la propia palabra)"""
+    variants = {word}
+    frontier = {word}
+    for _ in range(distance):
+        frontier = {w[:i] + w[i + 1:] for w in frontier for i in range(len(w))}
+        variants |= frontier
+    return variants
+
+
+def bounded_distance(a, b, limit):
+    """Distancia de Levenshtein entre ``a`` y ``b``, o None si supera ``limit``"""
+    if a == b:
+        return 0
+    if abs(len(a) - len(b)) > limit:
+        return None
+    previous = list(range(len(b) + 1))
+    for i, ca in enumerate(a, 1):
+        current = [i]
+        for j, cb in enumerate(b, 1):
+            current.append(min(previous[j] + 1, current[j - 1] + 1, previous[j - 1] + (ca != cb)))
+        if min(current) > limit:
+            return None
+        previous = current
+    return previous[-1] if previous[-1] <= limit else None
+
+
+def similarity(words_a, words_b):
+    """Parecido (0..1) entre dos nombres ya divididos en palabras
+
+    Con el mismo número de palabras se compara palabra a palabra, con el tope
+    de ``max_word_edits``; con distinto número solo se admite un espacio
+    perdido o sobrante del OCR (y como mucho una letra más).
+    """
+    length = max(sum(map(len, words_a)), sum(map(len, words_b)))
+    if not length:
+        return 0.0
+    if len(words_a) == len(words_b):
+        edits = 0
+        for a, b in zip(words_a, words_b):
+            distance = bounded_distance(a, b, max_word_edits(max(len(a), len(b))))
+            if distance is None:
+                return 0.0
+            edits += distance
+        return 1 - edits / length
+    if abs(len(words_a) - len(words_b)) == 1:
+        distance = bounded_distance(''.join(words_a), ''.join(words_b), 1)
+        if distance is not None:
+            return 1 - distance / length
+    return 0.0
+
+
+def _signature(words, numbers, sizes):
+    return ' '.join(words) + '|' + ' '.join(numbers) + '|' + ' '.join(sizes)
+
+
+class ProductIndex:
+    """Índice de bloqueo sobre claves normalizadas -> id de entidad (solo añade)"""
+
+    def __init__(self):
+        self.keys = []
+        self.entities = array('q')
+        self._exact = {}  # clave -> posición
+        self._signatures = {}  # palabras|números|tamaños -> posiciones
+        self._vocabulary = {}  # palabra -> nº de claves que la usan
+        self._deletions = {}  # variante con letras borradas -> palabras
+        self._skeletons = {}  # esqueleto -> palabras
+
+    def __len__(self):
+        return len(self.keys)
+
+    def __contains__(self, key):
+        return key in self._exact
+
+    def add(self, key, entity_id):
+        if key in self._exact:
+            return
+        position = len(self.keys)
+        words, numbers, sizes = split_key(key)
+        self.keys.append(key)
+        self.entities.append(entity_id)
+        self._exact[key] = position
+        self._signatures.setdefault(_signature(words, numbers, sizes), []).append(position)
+        for word in words:
+            if word in self._vocabulary:
+                self._vocabulary[word] += 1
+                continue
+            self._vocabulary[word] = 1
+            for variant in deletions(word, max_word_edits(len(word))):
+                self._deletions.setdefault(variant, []).append(word)
+            self._skeletons.setdefault(skeleton(word), []).append(word)
+
+    def match(self, key):
+        """(id de entidad, puntuación) del mejor alias para ``key``, o (None, 0.0)"""
+        position = self._exact.get(key)
+        if position is not None:
+            return self.entities[position], 1.0
+        words, numbers, sizes = split_key(key)
+        if not words:
+            return None, 0.0
+
+        length = sum(map(len, words))
+        for candidate, edits in self._corrected(words):
+            score = 1 - edits / length
+            if score < THRESHOLD:
+                break  # Ordenadas por coste: las siguientes son peores
+            positions = self._signatures.get(_signature(candidate, numbers, sizes))
+            if positions:
+                return self.entities[positions[0]], score
+        return None, 0.0
+
+    def _corrected(self, words):
+        """Nombres del vocabulario cercanos a ``words``: [(palabras, coste)] de menor a mayor coste"""
+        # Búsqueda en haz por posición: cada palabra se sustituye por una
+        # corrección, o junto con la siguiente por una palabra del vocabulario
+        # (espacio sobrante del OCR: "LECHE ENT ERA")
+        beams = {0: [((), 0)]}
+        for i, word in enumerate(words):
+            states = sorted(beams.pop(i, ()), key=lambda state: state[1])[:MAX_COMBINATIONS]
+            if not states:
+                continue
+            choices = self._word_choices(word)
+            if i + 1 < len(words) and word + words[i + 1] in self._vocabulary:
+                choices.append(((word + words[i + 1],), 0, 2))
+            for prefix, cost in states:
+                for replacement, edits, consumed in choices:
+                    beams.setdefault(i + consumed, []).append((prefix + replacement, cost + edits))
+        return sorted(beams.get(len(words), ()), key=lambda state: state[1])[:MAX_COMBINATIONS]
+
+    def _word_choices(self, word):
+        """[(palabras que la sustituyen, ediciones, palabras consumidas)] para una palabra"""
+        if word in self._vocabulary:
+            return [((word,), 0, 1)]
+        limit = max_word_edits(len(word))
+        candidates = set()
+        for variant in deletions(word, limit):
+            candidates.update(self._deletions.get(variant, ()))
+        # Mismo esqueleto ("rnolde" y "molde"): una sola confusión
+        word_skeleton = skeleton(word)
+        sounds_alike = self._skeletons.get(word_skeleton, ())
+        candidates.update(sounds_alike)
+        scored = []
+        for candidate in candidates:
+            distance = bounded_distance(word, candidate, limit)
+            if candidate in sounds_alike:
+                distance = 1 if distance is None else min(distance, 1)
+            if distance is not None:
+                scored.append((distance, -self._vocabulary[candidate], candidate))
+        scored.sort()
+        choices = [((candidate,), distance, 1) for distance, _, candidate in scored[:MAX_WORD_CANDIDATES]]
+        # Espacio perdido: "LECHEENTERA", "PAPELDE"
+        for cut in range(2, len(word) - 1):
+            if word[:cut] in self._vocabulary and word[cut:] in self._vocabulary:
+                choices.append(((word[:cut], word[cut:]), 0, 1))
+                break
+        return choices
@@ -0,0 +1,46 @@
+# Cadenas conocidas con los alias que suelen dar el OCR y los usuarios
+
+from django.db import migrations
+
+# Alias ya normalizados (catalog.supermarkets.normalize); se congelan aquí
+SUPERMARKETS = {
+    'Mercadona': ['mercadona', 'mercadona s a', 'mercadona sa'],
+    'Carrefour': ['carrefour', 'carrefour express', 'carrefour market', 'centros comerciales carrefour'],
+    'Lidl': ['lidl', 'lidl supermercados'],
+    'DIA': ['dia', 'dia market', 'dia maxi', 'supermercados dia', 'dia retail espana'],
+    'Alcampo': ['alcampo', 'mi alcampo', 'auchan'],
+    'Aldi': ['aldi', 'aldi supermercados'],
+    'El Corte Inglés': ['el corte ingles', 'corte ingles', 'supermercado el corte ingles'],
+    'Hipercor': ['hipercor'],
+    'Eroski': ['eroski', 'eroski center', 'eroski city'],
+    'Consum': ['consum', 'consum s coop', 'charter'],
+    'Ahorramas': ['ahorramas', 'ahorra mas'],
+    'BM Supermercados': ['bm', 'bm supermercados'],
+    'Bonpreu': ['bonpreu', 'bon preu', 'esclat'],
+    'Gadis': ['gadis'],
+    'Froiz': ['froiz'],
+    'Covirán': ['coviran'],
+    'Spar': ['spar'],
+    'Desconocido': ['desconocido'],
+}
+
+
+def seed(apps, schema_editor):
+    alias = schema_editor.connection.alias
+    Supermarket = apps.get_model('catalog', 'Supermarket')
+    SupermarketAlias = apps.get_model('catalog', 'SupermarketAlias')
+    for name, aliases in SUPERMARKETS.items():
+        supermarket, _ = Supermarket.objects.using(alias).get_or_create(name=name)
+        for text in aliases:
+            SupermarketAlias.objects.using(alias).get_or_create(alias=text, defaults={'supermarket': supermarket})
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('catalog', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.RunPython(seed, migrations.RunPython.noop),
+    ]
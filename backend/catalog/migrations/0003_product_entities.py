@@ -0,0 +1,36 @@
+# Generated by Django 5.1.1 on 2026-10-19 19:36
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('catalog', '0002_seed_supermarkets'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ProductEntity',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('name', models.CharField(max_length=255)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+            ],
+            options={
+                'verbose_name_plural': 'product entities',
+            },
+        ),
+        migrations.CreateModel(
+            name='ProductAlias',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('alias', models.CharField(max_length=255, unique=True)),
+                ('entity', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='aliases', to='catalog.productentity')),
+            ],
+            options={
+                'verbose_name_plural': 'product aliases',
+            },
+        ),
+    ]
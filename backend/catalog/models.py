@@ -0,0 +1,46 @@
+from django.db import models
+
+
+class Supermarket(models.Model):
+    """Dimensión de supermercados: los recibos agrupan por este id entero"""
+    name = models.CharField(max_length=100, unique=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        ordering = ['name']
+
+    def __str__(self):
+        return self.name
+
+class SupermarketAlias(models.Model):
+    """Texto normalizado (OCR o usuario) que identifica a un supermercado"""
+    alias = models.CharField(max_length=255, unique=True)
+    supermarket = models.ForeignKey(Supermarket, related_name='aliases', on_delete=models.CASCADE)
+
+    class Meta:
+        verbose_name_plural = 'supermarket aliases'
+
+    def __str__(self):
+        return f"{self.alias} -> {self.supermarket}"
+
+class ProductEntity(models.Model):
+    """Producto canónico: agrupa los nombres (con errores de OCR) del mismo producto"""
+    name = models.CharField(max_length=255)
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        verbose_name_plural = 'product entities'
+
+    def __str__(self):
+        return self.name
+
+class ProductAlias(models.Model):
+    """Nombre normalizado (catalog.matching.normalize_product) de una entidad"""
+    alias = models.CharField(max_length=255, unique=True)
+    entity = models.ForeignKey(ProductEntity, related_name='aliases', on_delete=models.CASCADE)
+
+    class Meta:
+        verbose_name_plural = 'product aliases'
+
+    def __str__(self):
+        return f"{self.alias} -> {self.entity}"
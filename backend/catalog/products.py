@@ -0,0 +1,119 @@
+# products.py - Resolución de nombres de producto a entidades (ProductEntity)
+#
+# Al guardar un producto su nombre se normaliza y se busca en un ProductIndex
+# (catalog/matching.py) con todos los alias conocidos: si encaja con uno,
+# el producto toma su entidad y el nombre nuevo se guarda como alias (la
+# próxima vez es una coincidencia exacta); si no, se crea una entidad nueva.
+# Product.entity_id es la clave por la que agrupan las analíticas por producto.
+#
+# El índice vive en memoria del proceso y se sincroniza con ProductAlias de
+# forma incremental (alias con id mayor que el último visto) como mucho cada
+# PRODUCT_INDEX_SYNC_SECONDS. Dos procesos que vean a la vez variantes nuevas
+# del mismo producto pueden crear dos entidades; se fusionan reasignando
+# alias y productos. Como la dimensión de supermercados, vive solo en 'default'.
+
+import threading
+import time
+
+from django.db import DEFAULT_DB_ALIAS, transaction
+
+from backendgrocerylyzer import metrics
+
+from .matching import ProductIndex, normalize_product
+from .models import ProductAlias, ProductEntity
+
+UNKNOWN_PRODUCT = 'Producto'
+PRODUCT_INDEX_SYNC_SECONDS = 30
+
+_lock = threading.Lock()
+_index = ProductIndex()
+_last_alias_id = 0
+_synced_at = None
+_names = {}  # id de entidad -> nombre canónico
+
+
+def _sync(force=False):
+    global _last_alias_id, _synced_at
+    if not force and _synced_at is not None and time.monotonic() - _synced_at < PRODUCT_INDEX_SYNC_SECONDS:
+        return
+    rows = ProductAlias.objects.using(DEFAULT_DB_ALIAS).filter(id__gt=_last_alias_id).order_by('id')
+    for alias_id, alias, entity_id in rows.values_list('id', 'alias', 'entity_id').iterator(chunk_size=5000):
+        _index.add(alias, entity_id)
+        _last_alias_id = alias_id
+    _synced_at = time.monotonic()
+
+
+def _learn(key, entity_id, name=None):
+    with _lock:
+        _index.add(key, entity_id)
+        if name is not None:
+            _names[entity_id] = name
+
+
+def _create(raw, key):
+    """Entidad nueva con ``key`` como primer alias (o la de otro proceso que se adelantó)"""
+    name = ' '.join((raw or '').split())[:255] or UNKNOWN_PRODUCT
+    with transaction.atomic(using=DEFAULT_DB_ALIAS):
+        entity = ProductEntity.objects.using(DEFAULT_DB_ALIAS).create(name=name)
+        ProductAlias.objects.using(DEFAULT_DB_ALIAS).bulk_create(
+            [ProductAlias(alias=key, entity=entity)], ignore_conflicts=True
+        )
+        entity_id = ProductAlias.objects.using(DEFAULT_DB_ALIAS).values_list('entity_id', flat=True).get(alias=key)
+        if entity_id != entity.id:
+            entity.delete()
+            name = None
+    # Al índice solo cuando se confirma (puede ir dentro de una transacción mayor)
+    transaction.on_commit(lambda: _learn(key, entity_id, name), using=DEFAULT_DB_ALIAS)
+    return entity_id
+
+
+def resolve_product(raw):
+    """Id de la entidad de producto para el nombre ``raw``, creándola si no se parece a ninguna"""
+    start = time.perf_counter()
+    key = normalize_product(raw)[:255] or normalize_product(UNKNOWN_PRODUCT)
+    with _lock:
+        _sync()
+        entity_id, score = _index.match(key)
+
+    if entity_id is not None and key not in _index:
+        # Variante nueva de un producto conocido: alias para la próxima vez
+        ProductAlias.objects.using(DEFAULT_DB_ALIAS).bulk_create(
+            [ProductAlias(alias=key, entity_id=entity_id)], ignore_conflicts=True
+        )
+        transaction.on_commit(lambda: _learn(key, entity_id), using=DEFAULT_DB_ALIAS)
+    elif entity_id is None:
+        # Puede que otro proceso la haya creado después de la última sincronización
+        entity_id = ProductAlias.objects.using(DEFAULT_DB_ALIAS).filter(alias=key).values_list(
+            'entity_id', flat=True
+        ).first()
+        if entity_id is None:
+            entity_id = _create(raw, key)
+        else:
+            _learn(key, entity_id)
+    metrics.observe('catalog.product_resolve_ms', (time.perf_counter() - start) * 1000)
+    return entity_id
+
+
+def entity_names(entity_ids):
+    """{id: nombre canónico} de las entidades pedidas (cacheado en el proceso)"""
+    missing = [entity_id for entity_id in set(entity_ids) if entity_id not in _names]
+    for i in range(0, len(missing), 500):
+        found = ProductEntity.objects.using(DEFAULT_DB_ALIAS).filter(id__in=missing[i:i + 500])
+        names = dict(found.values_list('id', 'name'))
+        with _lock:
+            _names.update(names)
+    return {entity_id: _names.get(entity_id, UNKNOWN_PRODUCT) for entity_id in entity_ids}
+
+
+def entity_name(entity_id):
+    return entity_names([entity_id])[entity_id]
+
+
+def reset():
+    """Olvida el índice y los nombres (tras fusionar entidades o en pruebas)"""
+    global _index, _last_alias_id, _synced_at
+    with _lock:
+        _index = ProductIndex()
+        _last_alias_id = 0
+        _synced_at = None
+        _names.clear()
@@ -0,0 +1,127 @@
+# supermarkets.py - Resolución del texto de supermercado a la dimensión Supermarket
+#
+# El texto que llega del OCR o del usuario ("MERCADONA S.A.", "dia", "Carrefour
+# Express") se normaliza y se busca en SupermarketAlias una sola vez, al
+# guardar el recibo: Receipt.supermarket_id es la clave entera por la que
+# agrupan analytics. Un texto desconocido crea su propio supermercado (con el
+# texto como nombre) y su alias; fusionar después es cambiar el alias de
+# supermercado.
+#
+# Alias y nombres se cachean en memoria del proceso (la dimensión es pequeña)
+# y se recargan cada SUPERMARKET_CACHE_SECONDS. La dimensión vive solo en
+# 'default' (como los usuarios): las consultas de este módulo van siempre ahí,
+# no a una réplica ni a un shard.
+
+import re
+import threading
+import time
+import unicodedata
+
+from django.db import DEFAULT_DB_ALIAS, IntegrityError, transaction
+
+from .models import Supermarket, SupermarketAlias
+
+UNKNOWN_SUPERMARKET = 'Desconocido'
+SUPERMARKET_CACHE_SECONDS = 300
+
+_lock = threading.Lock()
+_aliases = {}  # alias normalizado -> id
+_names = {}  # id -> nombre canónico
+_loaded_at = None
+
+
+def normalize(name):
+    """Minúsculas, sin acentos y solo palabras alfanuméricas: 'DÍA  %' -> 'dia'"""
+    text = unicodedata.normalize('NFKD', name or '')
+    text = ''.join(c for c in text if not unicodedata.combining(c)).lower()
+    return ' '.join(re.findall(r'[a-z0-9]+', text))
+
+
+def match_alias(normalized, aliases):
+    """Id del alias más largo que coincide con las primeras palabras del texto, o None
+
+    'mercadona s a' encuentra 'mercadona'; 'dia market' prefiere 'dia market' a 'dia'.
+    """
+    words = normalized.split()
+    for size in range(len(words), 0, -1):
+        supermarket_id = aliases.get(' '.join(words[:size]))
+        if supermarket_id is not None:
+            return supermarket_id
+    return None
+
+
+def _load():
+    global _loaded_at
+    aliases = dict(SupermarketAlias.objects.using(DEFAULT_DB_ALIAS).values_list('alias', 'supermarket_id'))
+    names = dict(Supermarket.objects.using(DEFAULT_DB_ALIAS).values_list('id', 'name'))
+    with _lock:
+        _aliases.clear()
+        _aliases.update(aliases)
+        _names.clear()
+        _names.update(names)
+        _loaded_at = time.monotonic()
+
+
+def _ensure_loaded():
+    if _loaded_at is None or time.monotonic() - _loaded_at > SUPERMARKET_CACHE_SECONDS:
+        _load()
+
+
+def _remember(alias, supermarket_id, name):
+    with _lock:
+        _aliases[alias] = supermarket_id
+        _names[supermarket_id] = name
+
+
+def _create(raw, alias):
+    """Crea el supermercado (o reutiliza el del mismo nombre) y su alias en 'default'"""
+    name = ' '.join((raw or '').split())[:100] or UNKNOWN_SUPERMARKET
+    try:
+        with transaction.atomic(using=DEFAULT_DB_ALIAS):
+            supermarket, _ = Supermarket.objects.using(DEFAULT_DB_ALIAS).get_or_create(name=name)
+            SupermarketAlias.objects.using(DEFAULT_DB_ALIAS).create(alias=alias, supermarket=supermarket)
+    except IntegrityError:
+        # Otro proceso creó el alias a la vez
+        supermarket = Supermarket.objects.using(DEFAULT_DB_ALIAS).get(aliases__alias=alias)
+    # Solo se cachea cuando se confirma (puede ir dentro de una transacción mayor)
+    transaction.on_commit(
+        lambda: _remember(alias, supermarket.id, supermarket.name), using=DEFAULT_DB_ALIAS
+    )
+    return supermarket.id
+
+
+def resolve_supermarket(raw):
+    """Id del supermercado para el texto ``raw``, creándolo si no se conoce"""
+    alias = normalize(raw) or normalize(UNKNOWN_SUPERMARKET)
+    _ensure_loaded()
+    supermarket_id = match_alias(alias, _aliases)
+    if supermarket_id is not None:
+        return supermarket_id
+
+    # Quizá lo ha creado otro proceso después de la última carga
+    found = SupermarketAlias.objects.using(DEFAULT_DB_ALIAS).filter(alias=alias).values_list(
+        'supermarket_id', 'supermarket__name'
+    ).first()
+    if found:
+        _remember(alias, *found)
+        return found[0]
+    return _create(raw, alias)
+
+
+def canonical_name(supermarket_id):
+    """Nombre canónico de un id de la dimensión"""
+    _ensure_loaded()
+    name = _names.get(supermarket_id)
+    if name is None and supermarket_id is not None:
+        _load()
+        name = _names.get(supermarket_id)
+    return name or UNKNOWN_SUPERMARKET
+
+
+def reset():
+    """Olvida la caché (tras editar alias en el admin o en pruebas)"""
+    global _loaded_at
+    with _lock:
+        _aliases.clear()
+        _names.clear()
+        _loaded_at = None
@@ -0,0 +1,58 @@
+from django.test import SimpleTestCase
+
+from catalog.matching import ProductIndex, normalize_product
+
+
+class ProductIndexTests(SimpleTestCase):
+    NAMES = [
+        'Leche Entera 1L',
+        'Leche Semidesnatada 1L',
+        'Leche Entera 1L Eco',
+        'Molde Integral Bimbo',
+        'Pack 6 Yogur Natural',
+    ]
+
+    def setUp(self):
+        self.index = ProductIndex()
+        for entity_id, name in enumerate(self.NAMES):
+            self.index.add(normalize_product(name), entity_id)
+
+    def match(self, name):
+        return self.index.match(normalize_product(name))[0]
+
+    def test_normalize(self):
+        self.assertEqual(normalize_product('LECHE ENTER4 1,5L'), 'leche entera 1.5l')
+        self.assertEqual(normalize_product('Café Molído 250G'), 'cafe molido 250g')
+
+    def test_ocr_typos_merge(self):
+        cases = {
+            'LECHE ENTER4 1L': 0,  # Dígito por letra
+            'LECHE ENTRA 1L': 0,  # Letra perdida
+            'LECHEENTERA 1L': 0,  # Espacio perdido
+            'LECHE ENT ERA 1L': 0,  # Espacio sobrante
+            'RNOLDE INTEGRAL BIMBO': 3,  # 'm' leída como 'rn'
+            'LECHE SEMIDESNATADA1L': 1,  # Tamaño pegado
+            'PACK6 YOGUR NATURAL': 4,
+        }
+        for name, entity_id in cases.items():
+            with self.subTest(name=name):
+                self.assertEqual(self.match(name), entity_id)
+
+    def test_near_misses_do_not_merge(self):
+        for name in ['Leche Entera 1L Bio', 'Pack 4 Yogur Natural', 'Leche Condensada 1L', 'Queso Entero 1L']:
+            with self.subTest(name=name):
+                self.assertIsNone(self.match(name))
+
+    def test_sizes_are_part_of_identity(self):
+        for name in ['Leche Semidesnatada', 'LECHE SEMIDESNATADA 1,5L', 'Leche Entera 500ML']:
+            with self.subTest(name=name):
+                self.assertIsNone(self.match(name))
+        # Sin tamaño es otro producto, con su propio alias
+        self.index.add(normalize_product('LECHE ENTERA'), 9)
+        self.assertEqual(self.match('Leche Entera'), 9)
+        self.assertEqual(self.match('Leche Entera 1L'), 0)
+        # El orden en que se vieron las variantes no cambia el resultado
+        index = ProductIndex()
+        for entity_id, name in enumerate(['LECHE ENTERA', 'Leche Entera 1L']):
+            index.add(normalize_product(name), entity_id)
+        self.assertEqual(index.match(normalize_product('Leche Entera 1L'))[0], 1)
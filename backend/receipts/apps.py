@@ -4,3 +4,12 @@ from django.apps import AppConfig
 class ReceiptsConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'receipts'
+
+    def ready(self):
+        from django.contrib.auth import get_user_model
+        from django.db.models.signals import post_migrate, pre_delete
+        from backendgrocerylyzer.db import sharding
+        from . import changes  # noqa: F401
+
+        post_migrate.connect(sharding.seed_id_sequences, sender=self)
+        pre_delete.connect(sharding.delete_user_receipts, sender=get_user_model())
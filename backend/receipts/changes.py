@@ -0,0 +1,71 @@
+# changes.py - Registro de cambios de recibos (ReceiptChange)
+#
+# Cada alta, edición o borrado de un recibo (y de sus productos) deja una fila
+# en ReceiptChange, en la misma base de datos y transacción que el cambio. Los
+# snapshots columnares de analytics (analytics/columnar.py) leen solo las
+# filas nuevas para recargar los recibos afectados. SQLite serializa las
+# escrituras, así que los ids del registro siguen el orden de commit.
+#
+# Las operaciones masivas que no emiten señales (bulk_create, borrados con
+# users.stats.suspended) registran un reinicio con ``log_reset``.
+#
+# Las filas de más de CHANGE_RETENTION_SECONDS no las necesita ningún snapshot
+# (se reconstruyen enteros antes) y se borran desde el camino de escritura,
+# como mucho una vez por PRUNE_INTERVAL_SECONDS y base de datos en cada proceso.
+
+import threading
+import time
+from datetime import timedelta
+
+from django.db.models.signals import post_save, post_delete
+from django.dispatch import receiver
+from django.utils import timezone
+
+from users.stats import is_suspended
+
+from .models import Receipt, ReceiptChange
+
+
+CHANGE_RETENTION_SECONDS = 2 * 3600
+PRUNE_INTERVAL_SECONDS = 3600
+
+_prune_lock = threading.Lock()
+_pruned_at = {}
+
+
+def prune_changes(using):
+    """Borra los cambios que ya no necesita ningún snapshot (si no se hizo hace poco)"""
+    now = time.monotonic()
+    with _prune_lock:
+        if using in _pruned_at and now - _pruned_at[using] < PRUNE_INTERVAL_SECONDS:
+            return 0
+        _pruned_at[using] = now
+    cutoff = timezone.now() - timedelta(seconds=CHANGE_RETENTION_SECONDS)
+    deleted, _ = ReceiptChange.objects.using(using).filter(created_at__lt=cutoff).delete()
+    return deleted
+
+
+def log_change(receipt):
+    """Registra un cambio en ``receipt`` o en sus productos"""
+    using = receipt._state.db or 'default'
+    ReceiptChange.objects.using(using).create(user_id=receipt.owner_id, receipt_id=receipt.id)
+    prune_changes(using)
+
+
+def log_reset(using, user_id=None):
+    """Obliga a recargar entero el snapshot de ``user_id`` (o de todos los usuarios)"""
+    ReceiptChange.objects.using(using).create(user_id=user_id, receipt_id=None)
+
+
+@receiver(post_save, sender=Receipt)
+def receipt_saved(sender, instance, raw=False, **kwargs):
+    if raw or is_suspended():
+        return
+    log_change(instance)
+
+
+@receiver(post_delete, sender=Receipt)
+def receipt_deleted(sender, instance, **kwargs):
+    if is_suspended():
+        return
+    log_change(instance)
@@ -0,0 +1,228 @@
+# datasets.py - Generador determinista de datos sintéticos
+#
+# Usado por ``manage.py generate_dataset`` y por los benchmarks de analytics.
+# Con la misma semilla y el mismo preset genera exactamente los mismos recibos
+# y productos (fechas incluidas: se parte de una fecha final fija, no de hoy).
+# Inserta con bulk_create por lotes, así que el coste de memoria es el de un
+# lote y no el del dataset completo.
+
+import math
+import random
+from datetime import date, timedelta
+
+from django.contrib.auth.models import User
+from django.db import DEFAULT_DB_ALIAS, transaction
+
+from backendgrocerylyzer.db.sharding import shard_for, shards
+from catalog.products import resolve_product
+from catalog.supermarkets import resolve_supermarket
+from users.stats import reconcile, suspended
+
+from .changes import log_reset
+from .models import Receipt, Product
+
+# Presets estables para benchmarks: no cambiar sus valores sin regenerar las
+# baselines que dependan de ellos.
+PRESETS = {
+    'tiny': {'receipts': 200, 'catalog_size': 60, 'days': 365},
+    'small': {'receipts': 2_000, 'catalog_size': 300, 'days': 540},
+    'medium': {'receipts': 50_000, 'catalog_size': 3_000, 'days': 1_095},
+    'large': {'receipts': 1_500_000, 'catalog_size': 30_000, 'days': 1_825},
+}
+
+DEFAULT_SEED = 42
+DEFAULT_END_DATE = date(2025, 6, 30)
+
+# (nombre, cuota de mercado, rango de multiplicador de precio)
+SUPERMARKETS = [
+    ('Mercadona', 0.27, (0.92, 1.05)),
+    ('Carrefour', 0.18, (0.97, 1.12)),
+    ('Lidl', 0.15, (0.85, 0.98)),
+    ('DIA', 0.13, (0.88, 1.02)),
+    ('Alcampo', 0.11, (0.90, 1.04)),
+    ('Aldi', 0.10, (0.84, 0.97)),
+    ('El Corte Inglés', 0.06, (1.10, 1.30)),
+]
+
+# (nombre base, precio base en euros)
+BASE_PRODUCTS = [
+    ('Leche Entera 1L', 1.20), ('Leche Semidesnatada 1L', 1.10), ('Pan de Molde Integral', 1.80),
+    ('Barra de Pan', 0.65), ('Aceite de Oliva Virgen Extra 1L', 5.50), ('Aceite de Girasol 1L', 2.10),
+    ('Huevos Camperos 12u', 3.20), ('Arroz Bomba 1kg', 2.30), ('Arroz Redondo 1kg', 1.30),
+    ('Pollo Filetes 1kg', 7.50), ('Carne Picada Mixta 500g', 3.90), ('Lomo de Cerdo 1kg', 6.80),
+    ('Merluza Congelada 400g', 4.60), ('Salmón Fresco 300g', 5.90), ('Tomates Cherry 500g', 2.10),
+    ('Tomate Pera 1kg', 1.90), ('Plátanos 1kg', 1.60), ('Manzana Golden 1kg', 1.95),
+    ('Naranjas 2kg', 2.80), ('Patatas 3kg', 3.40), ('Cebollas 1kg', 1.25), ('Lechuga Iceberg', 0.95),
+    ('Yogur Natural Pack 8', 2.80), ('Yogur Griego Pack 4', 2.40), ('Queso Manchego Curado 300g', 8.60),
+    ('Queso Rallado Mozzarella 200g', 1.79), ('Mantequilla 250g', 2.60), ('Jamón Cocido 200g', 2.30),
+    ('Jamón Serrano 100g', 2.90), ('Chorizo Extra 200g', 2.20), ('Pasta Penne 500g', 1.40),
+    ('Pasta Espaguetis 500g', 1.20), ('Tomate Frito 400g', 0.95), ('Atún en Aceite Pack 6', 8.40),
+    ('Garbanzos Cocidos 400g', 0.85), ('Lentejas 1kg', 1.90), ('Café Molido Premium 250g', 4.80),
+    ('Cacao Soluble 500g', 3.10), ('Galletas María 800g', 1.90), ('Cereales Corn Flakes 500g', 2.40),
+    ('Zumo de Naranja 1L', 1.60), ('Agua Mineral 6x1.5L', 2.10), ('Refresco Cola 2L', 1.85),
+    ('Cerveza Premium Pack 6', 6.90), ('Vino Tinto Rioja 75cl', 5.40), ('Detergente Líquido 3L', 12.50),
+    ('Suavizante 2L', 3.60), ('Lavavajillas 1L', 2.30), ('Papel Higiénico 18 rollos', 9.20),
+    ('Papel de Cocina 4 rollos', 3.10), ('Gel de Ducha 750ml', 2.70), ('Champú 400ml', 3.20),
+    ('Pasta de Dientes 75ml', 1.90), ('Pizza Barbacoa Congelada', 3.40), ('Helado Vainilla 1L', 3.90),
+    ('Guisantes Congelados 1kg', 2.20), ('Mayonesa 450ml', 2.10), ('Azúcar Blanco 1kg', 1.15),
+    ('Harina de Trigo 1kg', 0.90), ('Sal Marina 1kg', 0.55),
+]
+
+_VARIANTS = ['Marca Blanca', 'Eco', 'Premium', 'Sin Lactosa', 'Familiar', 'Light', 'Bio', 'Pack Ahorro']
+
+
+def build_catalog(size, rng):
+    """Catálogo de ``size`` productos con precio base y tasa de inflación anual
+
+    Los primeros son los productos base; el resto son variantes (marca, tamaño)
+    con precio derivado. La popularidad sigue una ley de Zipf sobre el orden.
+    """
+    catalog = []
+    for name, price in BASE_PRODUCTS[:size]:
+        catalog.append((name, price, rng.gauss(0.03, 0.02)))
+
+    variant = 0
+    while len(catalog) < size:
+        name, price = BASE_PRODUCTS[variant % len(BASE_PRODUCTS)]
+        label = _VARIANTS[(variant // len(BASE_PRODUCTS)) % len(_VARIANTS)]
+        generation = variant // (len(BASE_PRODUCTS) * len(_VARIANTS))
+        suffix = f' {label}' if generation == 0 else f' {label} {generation + 1}'
+        catalog.append((name + suffix, round(price * rng.uniform(0.7, 1.6), 2), rng.gauss(0.03, 0.02)))
+        variant += 1
+
+    weights = [1 / (rank ** 1.1) for rank in range(1, len(catalog) + 1)]
+    return catalog, _cumulative(weights)
+
+
+def _cumulative(weights):
+    total = 0.0
+    cumulative = []
+    for weight in weights:
+        total += weight
+        cumulative.append(total)
+    return cumulative
+
+
+def ensure_users(count, prefix='demo'):
+    """Devuelve ``count`` usuarios sintéticos (demo, demo_1, demo_2...), creándolos si faltan"""
+    users = []
+    for i in range(count):
+        username = prefix if i == 0 else f'{prefix}_{i}'
+        user, created = User.objects.get_or_create(username=username)
+        if created:
+            user.set_unusable_password()
+            user.save(update_fields=['password'])
+        users.append(user)
+    return users
+
+
+def clear():
+    """Borra todos los recibos y productos y recalcula las estadísticas de los perfiles"""
+    with suspended():
+        for alias in shards():
+            Product.objects.using(alias).all().delete()
+            Receipt.objects.using(alias).all().delete()
+    for alias in shards():
+        log_reset(alias)
+    reconcile()
+
+
+def generate(receipts, catalog_size, days, seed=DEFAULT_SEED, end_date=DEFAULT_END_DATE,
+             batch_size=2_000, progress=None, owners=None):
+    """Genera ``receipts`` recibos con sus productos y devuelve contadores
+
+    Los recibos se reparten entre ``owners`` (lista de usuarios); con uno solo
+    todos son suyos. ``progress`` es un callable opcional que recibe
+    (recibos_creados, productos_creados).
+    """
+    owners = owners or ensure_users(1)
+    owner_shards = {owner.id: shard_for(owner) for owner in owners}
+    rng = random.Random(seed)
+    catalog, catalog_weights = build_catalog(catalog_size, rng)
+    supermarket_weights = _cumulative([share for _, share, _ in SUPERMARKETS])
+    # bulk_create no pasa por Receipt.save: los ids de la dimensión se resuelven aquí
+    supermarket_ids = {name: resolve_supermarket(name) for name, _, _ in SUPERMARKETS}
+    with transaction.atomic(using=DEFAULT_DB_ALIAS):
+        entity_ids = {name: resolve_product(name) for name, _, _ in catalog}
+    start_date = end_date - timedelta(days=days - 1)
+    receipts_created = 0
+    products_created = 0
+
+    while receipts_created < receipts:
+        count = min(batch_size, receipts - receipts_created)
+        batch_receipts = []
+        batch_items = []
+
+        for _ in range(count):
+            # Más compras en los meses recientes (densidad creciente en el tiempo)
+            offset = int(days * math.sqrt(rng.random()))
+            receipt_date = start_date + timedelta(days=min(offset, days - 1))
+            years = (receipt_date - start_date).days / 365
+
+            supermarket, _, (low, high) = rng.choices(SUPERMARKETS, cum_weights=supermarket_weights)[0]
+            store_multiplier = rng.uniform(low, high)
+
+            # Tamaño de la cesta: mayoría pequeña, cola de compras grandes
+            basket_size = min(40, max(1, int(rng.lognormvariate(1.8, 0.6))))
+            items = []
+            total_cents = 0
+            for name, base_price, inflation in rng.choices(catalog, cum_weights=catalog_weights, k=basket_size):
+                price = base_price * store_multiplier * (1 + inflation) ** years
+                if rng.random() < 0.08:  # Oferta puntual
+                    price *= 0.8
+                price_cents = max(1, round(price * 100))
+                quantity = rng.choices((1, 2, 3, 4), weights=(70, 20, 7, 3))[0]
+                total_cents += price_cents * quantity
+                items.append((name, price_cents, quantity))
+
+            # Solo se consume aleatoriedad con varios usuarios: con uno, el
+            # dataset es idéntico al de un único propietario
+            owner = owners[0] if len(owners) == 1 else rng.choice(owners)
+
+            batch_receipts.append(Receipt(
+                owner=owner,
+                supermarket_name=supermarket,
+                supermarket_id=supermarket_ids[supermarket],
+                date=receipt_date,
+                total_cents=total_cents,
+            ))
+            batch_items.append(items)
+
+        # Cada recibo va al shard de su propietario
+        by_shard = {}
+        for receipt, items in zip(batch_receipts, batch_items):
+            by_shard.setdefault(owner_shards[receipt.owner_id], []).append((receipt, items))
+
+        products_count = 0
+        for alias, rows in by_shard.items():
+            with transaction.atomic(using=alias):
+                Receipt.objects.using(alias).bulk_create([receipt for receipt, _ in rows])
+                products = [
+                    Product(
+                        name=name, price_cents=price_cents, quantity=quantity, receipt=receipt,
+                        entity_id=entity_ids[name],
+                    )
+                    for receipt, items in rows
+                    for name, price_cents, quantity in items
+                ]
+                Product.objects.using(alias).bulk_create(products, batch_size=5_000)
+            products_count += len(products)
+
+        receipts_created += count
+        products_created += products_count
+        if progress:
+            progress(receipts_created, products_created)
+
+    # bulk_create no emite señales: recalcular las estadísticas de los perfiles
+    # y recargar los snapshots de analytics
+    reconcile(user_ids=[owner.id for owner in owners])
+    for owner in owners:
+        log_reset(owner_shards[owner.id], owner.id)
+
+    return {'receipts': receipts_created, 'products': products_created}
+
+
+def generate_preset(name, seed=DEFAULT_SEED, progress=None, **overrides):
+    """Genera el dataset de un preset (ver PRESETS)"""
+    options = {**PRESETS[name], **overrides}
+    return generate(seed=seed, progress=progress, **options)
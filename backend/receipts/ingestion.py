@@ -0,0 +1,418 @@
+# ingestion.py - Del PDF subido a los datos del recibo
+#
+# Texto con pdfplumber, OCR de las páginas escaneadas (rasterizado con
+# pdf2image, preprocesado y motores de receipts/ocr) y parseo del texto. Es la
+# única parte de la app que necesita la cadena de PDF/OCR (pdfplumber,
+# pdf2image, PIL y, al reconocer, torch): views.py la importa dentro del
+# upload, así que cargar las URLs (manage.py, workers, tests) no la paga.
+# manage.py benchmark_imports vigila que siga siendo así.
+
+import logging
+
+logger = logging.getLogger(__name__)
+
+# Parche para compatibilidad con PIL
+try:
+    from PIL import Image
+    if not hasattr(Image, 'ANTIALIAS'):
+        Image.ANTIALIAS = Image.LANCZOS
+        logger.debug("Parche PIL.ANTIALIAS aplicado globalmente")
+except Exception as e:
+    logger.warning("Advertencia al aplicar parche PIL global: %s", e)
+
+import re
+from datetime import datetime
+
+import numpy as np
+import pdfplumber
+from django.conf import settings
+from pdf2image import convert_from_path
+
+from backendgrocerylyzer import metrics
+from .ocr import engines as ocr_engines
+from .ocr.dpi import plan_page, plan_runs
+from .ocr.layout import assemble_lines
+from .ocr.preprocess import preprocess
+from .pipeline import (
+    IngestionTrace, confidence_stats,
+    STAGE_PDFPLUMBER, STAGE_RASTERIZE, STAGE_PREPROCESS, STAGE_OCR, STAGE_PARSE,
+)
+
+# Una página con menos texto que esto y cubierta sobre todo por imágenes es un
+# escaneo (aunque lleve un sello o una cabecera con capa de texto)
+MIN_PAGE_TEXT_CHARS = 20
+SCANNED_IMAGE_COVERAGE = 0.5
+# Tokens del OCR que se descartan y los que hacen dudosa su línea (se registran en el log)
+OCR_MIN_CONFIDENCE = 0.5
+OCR_UNCERTAIN_CONFIDENCE = 0.7
+OCR_MODES = ocr_engines.MODES
+
+def page_needs_ocr(page, page_text):
+    """True si la página de pdfplumber no tiene capa de texto útil"""
+    text = page_text.strip()
+    if not text:
+        return True
+    if len(text) >= MIN_PAGE_TEXT_CHARS or not page.images:
+        return False
+    covered = sum((image['x1'] - image['x0']) * (image['bottom'] - image['top']) for image in page.images)
+    return covered >= SCANNED_IMAGE_COVERAGE * float(page.width * page.height)
+
+def rasterize_pages(pdf_path, pages):
+    """(imágenes PIL en gris, plan de cada página) rasterizando cada página una sola vez
+
+    La resolución de cada página la decide receipts.ocr.dpi con su tamaño e imágenes.
+    """
+    plans = [plan_page(page) for page in pages]
+    by_page = {}
+    for first, last, dpi in plan_runs(plans):
+        images = convert_from_path(pdf_path, dpi=dpi, first_page=first, last_page=last, grayscale=True)
+        by_page.update(zip(range(first, last + 1), images))
+    return [by_page[plan['page']] for plan in plans], plans
+
+def extract_with_ocr(pdf_path, pages, trace=None, ocr_mode=None):
+    """Texto por OCR de las páginas ``pages`` (de pdfplumber): {nº de página: texto}
+
+    El motor lo decide ``ocr_mode`` (fast, accurate o auto; por defecto
+    OCR_MODE). Si el OCR falla devuelve {} y las páginas se quedan con el
+    texto de pdfplumber.
+    """
+    trace = trace or IngestionTrace()
+    logger.debug("Extrayendo con OCR", extra={'pdf_path': pdf_path, 'pages': [page.page_number for page in pages]})
+    
+    try:
+        # Convertir solo las páginas escaneadas a imágenes, con la resolución planificada
+        with trace.span(STAGE_RASTERIZE, pages=len(pages)) as span:
+            images, plans = rasterize_pages(pdf_path, pages)
+            span.update(dpi=[plan['dpi'] for plan in plans], pixels=sum(plan['pixels'] for plan in plans))
+        logger.info("Plan de rasterizado", extra={'plans': plans})
+        
+        arrays = [np.array(image) for image in images]
+        
+        # Gris, recortada, enderezada y reducida: menos píxeles que reconocer (y que enviar al servicio)
+        if settings.OCR_PREPROCESS:
+            with trace.span(STAGE_PREPROCESS, pages=len(arrays)) as span:
+                processed = [preprocess(array) for array in arrays]
+                arrays = [image for image, _ in processed]
+                span.update(
+                    input_pixels=sum(info['input_pixels'] for _, info in processed),
+                    output_pixels=sum(info['output_pixels'] for _, info in processed),
+                )
+        
+        # Todas las páginas en una petición: el servicio las junta con las de otros workers
+        with trace.span(STAGE_OCR, pages=len(arrays), mode=ocr_mode or settings.OCR_MODE) as span:
+            page_results, span['engines'] = ocr_engines.readtext(arrays, ocr_mode, trace)
+            all_confidences = [confidence for results in page_results for (_, _, confidence) in results]
+            span.update(confidence_stats(all_confidences))
+        
+        # Reconstruir las líneas del recibo con las cajas (el parser trabaja por líneas)
+        texts = {}
+        uncertain_lines = 0
+        for page, results in zip(pages, page_results):
+            lines = assemble_lines(results, OCR_MIN_CONFIDENCE)
+            texts[page.page_number] = "\n".join(" ".join(text for text, _ in line) for line in lines)
+            uncertain = [line for line in lines if min(confidence for _, confidence in line) < OCR_UNCERTAIN_CONFIDENCE]
+            uncertain_lines += len(uncertain)
+            
+            # El preview solo se construye si DEBUG está activo
+            if lines and logger.isEnabledFor(logging.DEBUG):
+                logger.debug(
+                    "Preview página %d", page.page_number,
+                    extra={'preview': texts[page.page_number][:200], 'uncertain_lines': uncertain[:20]}
+                )
+        
+        stats = confidence_stats(all_confidences)
+        stats['uncertain_lines'] = uncertain_lines
+        if all_confidences:
+            metrics.observe('ingestion.ocr.confidence_mean', stats['confidence_mean'])
+        logger.info("OCR completado", extra={'pages': len(images), 'chars': sum(map(len, texts.values())), **stats})
+        return texts
+        
+    except Exception as e:
+        logger.warning("Error en OCR, se conserva el texto de pdfplumber: %s", e)
+        return {}
+
+PRODUCT_LINE = re.compile(
+    r'^([A-ZÁÉÍÓÚÑÜ][A-ZÁÉÍÓÚÑÜ0-9%/.,\-\s]*?)\s+(\d+(?:[,\.]\d+)?)\s*(ud|kg)\s+(\d+[,\.]\d{2})\s*€'
+    r'(?:\s+(\d+[,\.]\d{2})\s*€)?(?:\s+[A-Z])?$'
+)
+
+def parse_receipt_text(text):
+    """
+    Extrae supermercado, fecha, total y productos del texto de un recibo
+    """
+    data = {
+        "supermarket": None,
+        "datetime": None,
+        "total_amount": None,
+        "items": [],
+    }
+    
+    # Procesar el texto extraído
+    lines = text.splitlines()
+    
+    # 1) Buscar supermercado (extraer solo el nombre de la tienda)
+    supermercado_patterns = [
+        r'DIA',
+        r'MERCADONA',
+        r'CARREFOUR',
+        r'LIDL',
+        r'ALDI',
+        r'Compra en (.+?) \d{2}/\d{2}/\d{4}',
+    ]
+    
+    for pattern in supermercado_patterns:
+        match = re.search(pattern, text, re.IGNORECASE)
+        if match:
+            if match.groups():
+                data["supermarket"] = match.group(1).strip()
+            else:
+                data["supermarket"] = match.group(0).strip()
+            logger.debug("Supermercado: %s", data['supermarket'])
+            break
+    
+    # Si no se encontró con patrones, usar la primera línea significativa
+    if not data["supermarket"]:
+        for line in lines[:5]:
+            line = line.strip()
+            if line and len(line) > 3 and not re.match(r'^\d', line):
+                data["supermarket"] = line[:50]  # Limitar longitud
+                logger.debug("Supermercado (fallback): %s", data['supermarket'])
+                break
+    
+    # 2) Buscar fecha/hora
+    date_patterns = [
+        r'(\d{1,2}[/-]\d{1,2}[/-]\d{4}[\s]+\d{1,2}:\d{2})',
+        r'(\d{1,2}[/-]\d{1,2}[/-]\d{4})',
+        r'(\d{4}[/-]\d{1,2}[/-]\d{1,2})',
+    ]
+    
+    for pattern in date_patterns:
+        match = re.search(pattern, text)
+        if match:
+            try:
+                date_str = match.group(1)
+                # Intentar diferentes formatos
+                formats = [
+                    "%d/%m/%Y %H:%M",
+                    "%d-%m-%Y %H:%M",
+                    "%d/%m/%Y",
+                    "%d-%m-%Y",
+                    "%Y/%m/%d",
+                    "%Y-%m-%d"
+                ]
+                for fmt in formats:
+                    try:
+                        data["datetime"] = datetime.strptime(date_str, fmt)
+                        logger.debug("Fecha: %s", data['datetime'])
+                        break
+                    except ValueError:
+                        continue
+                if data["datetime"]:
+                    break
+            except Exception as e:
+                logger.debug("Error al parsear fecha: %s", e)
+    
+    # 3) Buscar total (mejorado)
+    total_patterns = [
+        r'Total a pagar[._\s]*(\d+[,\.]\d{2})',
+        r'Total venta [A-Za-z]*\s+(\d+[,\.]\d{2})',
+        r'IMPORTE:\s*(\d+[,\.]\d{2})',
+        r'Total[:\s]*(\d+[,\.]\d{2})',
+        r'TOTAL[:\s]*(\d+[,\.]\d{2})',
+    ]
+    
+    for pattern in total_patterns:
+        matches = re.findall(pattern, text, re.IGNORECASE | re.MULTILINE)
+        if matches:
+            try:
+                # Tomar el último (probablemente el total final)
+                total_str = matches[-1].replace(',', '.')
+                data["total_amount"] = float(total_str)
+                logger.debug("Total: %s", data['total_amount'])
+                break
+            except ValueError:
+                continue
+    
+    # 4) Buscar productos (usando tu lógica completa)
+    # Buscar la sección de productos entre marcadores específicos
+    productos_section = None
+    
+    # Para DIA: entre "Productos vendidos por Dia" y "Total venta Dia"
+    match = re.search(
+        r'Productos vendidos por Dia[^A-Z]*?DESCRIPCIÓN.*?Total venta Dia',
+        text,
+        re.S | re.IGNORECASE
+    )
+    if match:
+        productos_section = match.group(0)
+        logger.debug("Sección de productos DIA encontrada")
+    
+    if productos_section:
+        # Texto en líneas (capa de texto o OCR reconstruido por líneas): una
+        # línea por producto, NOMBRE cantidad ud|kg precio € [total €] [IVA]
+        for line in productos_section.splitlines():
+            match = PRODUCT_LINE.match(line.strip())
+            if not match:
+                continue
+            nombre, cantidad_str, unidad, precio_str, total_str = match.groups()
+            nombre = re.sub(r'\s+', ' ', nombre).strip()
+            if len(nombre) <= 2 or any(x in nombre for x in ['DESCRIPCIÓN', 'CANTIDAD', 'PRECIO', 'TOTAL']):
+                continue
+            precio = float(precio_str.replace(',', '.'))
+            cantidad = float(cantidad_str.replace(',', '.'))
+            total = float(total_str.replace(',', '.')) if total_str else round(precio * cantidad, 2)
+            if unidad == 'kg':
+                # Product.quantity es entero: un producto a peso es 1 unidad de su
+                # importe, marcada para que no se compare como precio unitario
+                cantidad, precio = 1, total
+            data["items"].append({
+                "name": nombre,
+                "quantity": int(cantidad),
+                "unit_price": precio,
+                "total_price": total,
+                "weighed": unidad == 'kg',
+            })
+        logger.debug("Productos por línea", extra={'items': len(data["items"])})
+    
+    if productos_section and not data["items"]:
+        # Usar un método más directo: buscar todos los productos usando regex
+        # Patrón que captura: NOMBRE cantidad ud/kg precio € precio € 
+        
+        # Primero, intentar patrón con cantidad explícita
+        productos_pattern1 = r'([A-Z][A-Z\s]+?)\s+(\d+[,\.]?\d*)\s+(ud|kg)\s+(\d+[,\.]\d{2})\s*€\s+(\d+[,\.]\d{2})\s*€'
+        productos_matches1 = re.findall(productos_pattern1, productos_section)
+        
+        # Segundo, intentar patrón con cantidad implícita (ud = 1)
+        productos_pattern2 = r'([A-Z][A-Z\s]+?)\s+ud\s+(\d+[,\.]\d{2})\s*€\s+(\d+[,\.]\d{2})\s*€'
+        productos_matches2 = re.findall(productos_pattern2, productos_section)
+        logger.debug(
+            "Productos encontrados",
+            extra={'explicit_qty': len(productos_matches1), 'implicit_qty': len(productos_matches2)}
+        )
+        
+        # Procesar productos con cantidad explícita
+        for match in productos_matches1:
+            try:
+                nombre = match[0].strip()
+                cantidad_str = match[1].replace(',', '.')
+                unidad = match[2]
+                precio_unitario = float(match[3].replace(',', '.'))
+                precio_total = float(match[4].replace(',', '.'))
+                
+                # Para ud, la cantidad debe ser entero
+                if unidad == 'ud':
+                    cantidad = int(float(cantidad_str))
+                else:  # kg: 1 unidad de su importe, como en el parser por líneas
+                    cantidad, precio_unitario = 1, precio_total
+                
+                # Limpiar nombre - remover letra inicial A/B
+                nombre = re.sub(r'^[AB]\s+', '', nombre)
+                nombre = re.sub(r'\s+', ' ', nombre).strip()
+                
+                if len(nombre) > 2:
+                    item = {
+                        "name": nombre,
+                        "quantity": cantidad,
+                        "unit_price": precio_unitario,
+                        "total_price": precio_total,
+                        "weighed": unidad == 'kg',
+                    }
+                    
+                    data["items"].append(item)
+            
+            except Exception as e:
+                logger.debug("Error procesando producto %s: %s", match, e)
+        
+        # Procesar productos con cantidad implícita (ud = 1)
+        for match in productos_matches2:
+            try:
+                nombre = match[0].strip()
+                precio_unitario = float(match[1].replace(',', '.'))
+                precio_total = float(match[2].replace(',', '.'))
+                
+                # Cantidad implícita = 1 para ud
+                cantidad = 1
+                
+                # Limpiar nombre
+                nombre = re.sub(r'^.*?TOTAL\s+', '', nombre)
+                nombre = re.sub(r'^.*?PRECIO\s+KG\s+', '', nombre)
+                nombre = re.sub(r'^.*?CANTIDAD\s+', '', nombre)
+                nombre = re.sub(r'^[A-Z]\s+', '', nombre)  # Remover letra inicial A/B
+                nombre = re.sub(r'\s+', ' ', nombre).strip()
+                
+                # Verificar que no sea duplicado
+                ya_existe = any(item['name'] == nombre for item in data["items"])
+                
+                if len(nombre) > 2 and not ya_existe and not any(x in nombre for x in ['DESCRIPCIÓN', 'CANTIDAD', 'PRECIO', 'TOTAL']):
+                    item = {
+                        "name": nombre,
+                        "quantity": cantidad,
+                        "unit_price": precio_unitario,
+                        "total_price": precio_total,
+                        "weighed": False,
+                    }
+                    
+                    data["items"].append(item)
+            
+            except Exception as e:
+                logger.debug("Error procesando producto %s: %s", match, e)
+    
+    return data
+
+def parse_receipt_pdf_ocr(pdf_path, trace=None, ocr_mode=None):
+    """
+    Extrae datos del PDF usando OCR si no hay texto directo
+    """
+    trace = trace or IngestionTrace()
+    logger.debug("Analizando PDF", extra={'pdf_path': pdf_path})
+    
+    try:
+        # Una sola apertura: pdfplumber para las páginas con capa de texto y OCR
+        # solo para las escaneadas, reutilizando los mismos objetos página
+        with pdfplumber.open(pdf_path) as pdf:
+            with trace.span(STAGE_PDFPLUMBER, pages=len(pdf.pages)) as span:
+                page_texts = [page.extract_text() or "" for page in pdf.pages]
+                scanned = [page for page, page_text in zip(pdf.pages, page_texts) if page_needs_ocr(page, page_text)]
+                span.update(chars=sum(map(len, page_texts)), scanned_pages=len(scanned))
+            
+            if scanned:
+                logger.info("Páginas sin texto - usando OCR", extra={'pages': [page.page_number for page in scanned]})
+                for page_number, page_text in extract_with_ocr(pdf_path, scanned, trace, ocr_mode).items():
+                    page_texts[page_number - 1] = page_text
+            else:
+                logger.debug("Texto extraído directamente del PDF")
+        
+        text = "\n".join(page_texts)
+        
+        if not text.strip():
+            logger.warning("No se pudo extraer texto ni con OCR")
+            # Devolver datos básicos en lugar de None
+            return {
+                "supermarket": "Desconocido",
+                "datetime": datetime.now(),
+                "total_amount": 0.0,
+                "items": [],
+            }
+        
+        if logger.isEnabledFor(logging.DEBUG):
+            logger.debug("Texto final extraído", extra={'chars': len(text), 'preview': text[:2000]})
+        
+        with trace.span(STAGE_PARSE) as span:
+            data = parse_receipt_text(text)
+            span['items'] = len(data['items'])
+        
+    except Exception as e:
+        logger.exception("Error general procesando PDF")
+        # Devolver datos básicos en lugar de None
+        return {
+            "supermarket": "Desconocido",
+            "datetime": datetime.now(),
+            "total_amount": 0.0,
+            "items": [],
+        }
+    
+    logger.info(
+        "Recibo analizado",
+        extra={'supermarket': data['supermarket'], 'total_amount': data['total_amount'], 'items': len(data['items'])}
+    )
+    return data
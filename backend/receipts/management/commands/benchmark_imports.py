@@ -0,0 +1,72 @@
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+import os
+import resource
+import statistics
+import subprocess
+import sys
+
+# Paquetes que solo debe cargar la ingesta (receipts/ingestion.py). numpy no
+# está: lo usan también las analíticas (analytics/columnar.py)
+HEAVY_MODULES = ('torch', 'easyocr', 'cv2', 'pdfplumber', 'pdfminer', 'pdf2image', 'PIL')
+
+# Lo que hace un worker o un manage.py al arrancar: configurar Django y cargar las URLs
+STARTUP = 'import django; django.setup(); from django.urls import get_resolver; get_resolver().url_patterns'
+SCENARIOS = [
+    ('arranque', STARTUP),
+    ('arranque + ingesta', STARTUP + '; import receipts.ingestion'),
+]
+
+
+def _importtime(code):
+    """{módulo: (propio, acumulado) en µs} de ``python -X importtime`` en un proceso nuevo"""
+    env = {**os.environ, 'DJANGO_SETTINGS_MODULE': 'backendgrocerylyzer.settings', 'GROCERYLYZER_LOG_LEVEL': 'WARNING'}
+    completed = subprocess.run(
+        [sys.executable, '-X', 'importtime', '-c', code],
+        cwd=settings.BASE_DIR, env=env, capture_output=True, text=True,
+    )
+    if completed.returncode:
+        raise CommandError(f'El proceso de medida ha fallado:\n{completed.stderr[-2000:]}')
+    modules = {}
+    for line in completed.stderr.splitlines():
+        if not line.startswith('import time:') or 'imported package' in line:
+            continue
+        own, cumulative, name = line[len('import time:'):].split('|')
+        # Los de primer nivel llevan un solo espacio de sangría
+        modules[name.strip()] = (int(own), int(cumulative), len(name) - len(name.lstrip()) == 1)
+    return modules
+
+
+class Command(BaseCommand):
+    help = 'Tiempo de import del arranque (python -X importtime) y comprobación de que no carga la cadena de OCR/PDF'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--repeat', type=int, default=3, help='Procesos medidos por escenario (mediana)')
+        parser.add_argument('--top', type=int, default=10, help='Módulos de primer nivel más lentos a mostrar')
+
+    def handle(self, *args, **options):
+        startup_heavy = []
+        for label, code in SCENARIOS:
+            totals, modules = [], {}
+            for _ in range(options['repeat']):
+                modules = _importtime(code)
+                totals.append(sum(cumulative for _, cumulative, top in modules.values() if top) / 1000)
+            # ru_maxrss de los hijos es el máximo de todos los medidos hasta ahora
+            peak_mb = resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss / 1024
+            heavy = sorted({name.split('.')[0] for name in modules} & set(HEAVY_MODULES))
+            if label == 'arranque':
+                startup_heavy = heavy
+
+            self.stdout.write(
+                f"{label}: {statistics.median(totals):.0f}ms de imports, {len(modules)} módulos, "
+                f"RSS máx. {peak_mb:.0f}MB, pesados: {', '.join(heavy) or 'ninguno'}"
+            )
+            slowest = sorted(
+                ((cumulative, name) for name, (_, cumulative, top) in modules.items() if top), reverse=True
+            )[:options['top']]
+            for cumulative, name in slowest:
+                self.stdout.write(f'    {cumulative / 1000:>8.1f}ms  {name}')
+
+        if startup_heavy:
+            raise CommandError(f"El arranque importa la cadena de OCR/PDF: {', '.join(startup_heavy)}")
+        self.stdout.write(self.style.SUCCESS('✅ El arranque no importa la cadena de OCR/PDF'))
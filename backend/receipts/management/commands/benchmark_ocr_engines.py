@@ -0,0 +1,84 @@
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from receipts.ocr import engines
+from receipts.ocr.layout import assemble_lines
+from receipts.ocr.preprocess import preprocess
+from receipts.ingestion import OCR_MIN_CONFIDENCE, parse_receipt_text, rasterize_pages
+import difflib
+import numpy as np
+import os
+import pdfplumber
+import statistics
+import time
+
+
+def _text(results):
+    lines = assemble_lines(results, OCR_MIN_CONFIDENCE)
+    return "\n".join(" ".join(text for text, _ in line) for line in lines)
+
+
+class Command(BaseCommand):
+    help = 'Benchmark de los modos OCR (fast, accurate, auto): tiempo por página, confianza y productos reconocidos'
+
+    def add_arguments(self, parser):
+        parser.add_argument('pdfs', nargs='*', help='PDFs a medir (por defecto media/sample*.pdf)')
+        parser.add_argument('--repeat', type=int, default=3, help='Repeticiones por página y modo')
+        parser.add_argument('--modes', nargs='+', choices=engines.MODES, default=list(engines.MODES),
+                            help='Modos a comparar')
+
+    def handle(self, *args, **options):
+        pdfs = options['pdfs'] or sorted(str(path) for path in (settings.BASE_DIR / 'media').glob('sample*.pdf'))
+        if not pdfs:
+            raise CommandError('No hay PDFs que medir')
+
+        pages = []
+        for path in pdfs:
+            try:
+                with pdfplumber.open(path) as pdf:
+                    images, plans = rasterize_pages(path, pdf.pages)
+            except Exception as e:
+                raise CommandError(f'No se pudo rasterizar {path}: {e}')
+            for image, plan in zip(images, plans):
+                array = preprocess(image)[0] if settings.OCR_PREPROCESS else np.array(image)
+                pages.append((f"{os.path.basename(path)} p{plan['page']}", array))
+
+        for name, engine in sorted(engines.ENGINES.items()):
+            if not engine().available():
+                self.stdout.write(self.style.WARNING(f'Motor {name} no disponible'))
+
+        self.stdout.write(
+            f"{'Página':<18} {'modo':<9} {'motores':<20} {'ms':>8} {'confianza':>10} {'productos':>10} {'texto':>6}"
+        )
+        totals = {}
+        for label, image in pages:
+            reference = None
+            for mode in options['modes']:
+                timings = []
+                try:
+                    for _ in range(options['repeat']):
+                        start = time.perf_counter()
+                        (results,), names = engines.readtext([image], mode)
+                        timings.append((time.perf_counter() - start) * 1000)
+                except engines.OCREngineUnavailable as e:
+                    self.stdout.write(f"{label:<18} {mode:<9} {'-':<20} no disponible: {e}")
+                    continue
+                text = _text(results)
+                if reference is None:
+                    reference = text
+                # Parecido con el texto del primer modo medido (1.0 = idéntico)
+                similarity = difflib.SequenceMatcher(None, reference, text).ratio()
+                items = len(parse_receipt_text(text)['items'])
+                elapsed = statistics.median(timings)
+                total = totals.setdefault(mode, [0.0, 0])
+                total[0] += elapsed
+                total[1] += items
+                self.stdout.write(
+                    f"{label:<18} {mode:<9} {','.join(names):<20} {elapsed:>8.0f} "
+                    f"{engines.mean_confidence(results):>10.2f} {items:>10} {similarity:>6.2f}"
+                )
+
+        self.stdout.write('')
+        for mode, (elapsed, items) in totals.items():
+            self.stdout.write(self.style.SUCCESS(
+                f'✅ {mode}: {elapsed / len(pages):.0f}ms por página, {items} productos en {len(pages)} páginas'
+            ))
@@ -0,0 +1,96 @@
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from backendgrocerylyzer.memory import peak_rss_mb, reset_peak_rss
+from receipts.ocr.preprocess import preprocess
+from receipts.ocr.service import get_reader
+from receipts.ingestion import rasterize_pages
+import difflib
+import numpy as np
+import os
+import pdfplumber
+import statistics
+import time
+
+
+def _recognize(reader, image, repeat):
+    """(resultados, mediana en ms, pico de memoria residente durante el OCR en MB)"""
+    timings = []
+    peak = None
+    for _ in range(repeat):
+        before = peak_rss_mb() if reset_peak_rss() else None
+        start = time.perf_counter()
+        results = reader.readtext(image)
+        timings.append((time.perf_counter() - start) * 1000)
+        if before is not None:
+            peak = max(peak or 0, peak_rss_mb() - before)
+    return results, statistics.median(timings), peak
+
+
+class Command(BaseCommand):
+    help = 'Benchmark del preprocesado de páginas para OCR: tiempo, memoria y texto reconocido con y sin preprocesar'
+
+    def add_arguments(self, parser):
+        parser.add_argument('pdfs', nargs='*', help='PDFs a medir (por defecto media/sample*.pdf)')
+        parser.add_argument('--repeat', type=int, default=3, help='Repeticiones del OCR por página y variante')
+        parser.add_argument('--text-height', type=int, default=settings.OCR_TARGET_TEXT_HEIGHT,
+                            help='Altura de línea objetivo del preprocesado (píxeles)')
+
+    def handle(self, *args, **options):
+        pdfs = options['pdfs'] or sorted(str(path) for path in (settings.BASE_DIR / 'media').glob('sample*.pdf'))
+        if not pdfs:
+            raise CommandError('No hay PDFs que medir')
+
+        reader = get_reader()
+        # Calentamiento: la primera inferencia incluye la inicialización de torch
+        reader.readtext(np.full((64, 256), 255, dtype=np.uint8))
+
+        self.stdout.write(
+            f"{'Página':<26} {'variante':<13} {'píxeles':>10} {'MB':>7} {'OCR ms':>9} {'pico MB':>8} "
+            f"{'cajas':>6} {'texto':>6}"
+        )
+        totals = {'original': [0.0, 0, 0.0], 'preprocesada': [0.0, 0, 0.0]}
+        for path in pdfs:
+            try:
+                with pdfplumber.open(path) as pdf:
+                    images, plans = rasterize_pages(path, pdf.pages)
+            except Exception as e:
+                raise CommandError(f'No se pudo rasterizar {path}: {e}')
+            for image, plan in zip(images, plans):
+                label = f"{os.path.basename(path)} p{plan['page']} {plan['dpi']}dpi"
+                original = np.array(image)
+                start = time.perf_counter()
+                processed, info = preprocess(original, options['text_height'])
+                preprocess_ms = (time.perf_counter() - start) * 1000
+
+                reference = None
+                for variant, pixels in (('original', original), ('preprocesada', processed)):
+                    results, ocr_ms, peak = _recognize(reader, pixels, options['repeat'])
+                    text = ' '.join(text for _, text, _ in results)
+                    if reference is None:
+                        reference = text
+                    # Parecido con el texto de la página original (1.0 = idéntico)
+                    similarity = difflib.SequenceMatcher(None, reference, text).ratio()
+                    if variant == 'preprocesada':
+                        ocr_ms += preprocess_ms
+                    total = totals[variant]
+                    total[0] += ocr_ms
+                    total[1] += pixels.nbytes
+                    total[2] = max(total[2], peak or 0)
+                    peak_text = '-' if peak is None else f'{peak:.0f}'
+                    self.stdout.write(
+                        f"{label:<26} {variant:<13} "
+                        f"{pixels.shape[0] * pixels.shape[1]:>10} {pixels.nbytes / 2 ** 20:>7.1f} {ocr_ms:>9.0f} "
+                        f"{peak_text:>8} {len(results):>6} {similarity:>6.2f}"
+                    )
+                self.stdout.write(
+                    f"{'':<26} {'':<13} preprocesado {preprocess_ms:.0f}ms, "
+                    f"escala {info.get('scale', 1.0)}, inclinación {info.get('skew', 0.0)}°"
+                )
+
+        (raw_ms, raw_bytes, raw_peak), (pre_ms, pre_bytes, pre_peak) = totals['original'], totals['preprocesada']
+        self.stdout.write('')
+        self.stdout.write(self.style.SUCCESS(
+            f'Preprocesado: OCR {raw_ms:.0f}ms -> {pre_ms:.0f}ms ({raw_ms / max(pre_ms, 1):.1f}x), '
+            f'entrada {raw_bytes / 2 ** 20:.1f}MB -> {pre_bytes / 2 ** 20:.1f}MB, '
+            f'pico de memoria {raw_peak:.0f}MB -> {pre_peak:.0f}MB'
+        ))
@@ -0,0 +1,85 @@
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from receipts.ocr import service
+from receipts.ocr.preprocess import preprocess
+from receipts.ingestion import rasterize_pages
+import itertools
+import numpy as np
+import os
+import pdfplumber
+import time
+
+
+def _flag(value):
+    if value not in ('0', '1'):
+        raise ValueError(value)
+    return value == '1'
+
+
+class Command(BaseCommand):
+    help = 'Barrido de opciones de inferencia OCR en CPU (hilos, cuantización, red, lote): páginas/s por núcleo'
+
+    def add_arguments(self, parser):
+        cores = os.cpu_count() or 1
+        parser.add_argument('pdfs', nargs='*', help='PDFs a medir (por defecto media/sample*.pdf)')
+        parser.add_argument('--threads', type=int, nargs='+', default=sorted({1, min(2, cores), cores}),
+                            help='Hilos de torch a probar')
+        parser.add_argument('--quantize', type=_flag, nargs='+', default=[True, False],
+                            help='Modelos cuantizados (1) o no (0)')
+        parser.add_argument('--recog-networks', nargs='+', default=[settings.OCR_RECOG_NETWORK],
+                            help='Redes de reconocimiento de EasyOCR')
+        parser.add_argument('--batch-sizes', type=int, nargs='+', default=[1, 8, 16, 32],
+                            help='Cajas por pasada de la red de reconocimiento')
+        parser.add_argument('--repeat', type=int, default=2, help='Pasadas por combinación (se queda la mejor)')
+
+    def handle(self, *args, **options):
+        pdfs = options['pdfs'] or sorted(str(path) for path in (settings.BASE_DIR / 'media').glob('sample*.pdf'))
+        if not pdfs:
+            raise CommandError('No hay PDFs que medir')
+
+        pages = []
+        for path in pdfs:
+            try:
+                with pdfplumber.open(path) as pdf:
+                    images, _ = rasterize_pages(path, pdf.pages)
+            except Exception as e:
+                raise CommandError(f'No se pudo rasterizar {path}: {e}')
+            pages.extend(preprocess(image)[0] if settings.OCR_PREPROCESS else np.array(image) for image in images)
+
+        self.stdout.write(f'{len(pages)} páginas, {os.cpu_count()} núcleos')
+        self.stdout.write(
+            f"{'hilos':>5} {'cuant.':>6} {'red':<12} {'lote':>5} {'s':>7} {'pág/s':>7} {'pág/s/núcleo':>13}"
+        )
+        rows = []
+        for quantize, network in itertools.product(options['quantize'], options['recog_networks']):
+            try:
+                reader = service.load_reader(quantize=quantize, recog_network=network)
+            except Exception as e:
+                self.stdout.write(self.style.WARNING(f'No se pudo cargar la red {network} (cuantizada={quantize}): {e}'))
+                continue
+            # Calentamiento: la primera inferencia incluye la inicialización de torch
+            reader.readtext(np.full((64, 256), 255, dtype=np.uint8))
+            for threads, batch_size in itertools.product(options['threads'], options['batch_sizes']):
+                service.set_threads(threads)
+                elapsed = float('inf')
+                for _ in range(options['repeat']):
+                    start = time.perf_counter()
+                    for page in pages:
+                        service.recognize_batch(reader, [page], batch_size)
+                    elapsed = min(elapsed, time.perf_counter() - start)
+                rate = len(pages) / elapsed
+                rows.append((rate / threads, threads, quantize, network, batch_size))
+                self.stdout.write(
+                    f"{threads:>5} {'sí' if quantize else 'no':>6} {network:<12} {batch_size:>5} "
+                    f"{elapsed:>7.2f} {rate:>7.2f} {rate / threads:>13.2f}"
+                )
+
+        if not rows:
+            raise CommandError('No se pudo medir ninguna combinación')
+        per_core, threads, quantize, network, batch_size = max(rows)
+        self.stdout.write('')
+        self.stdout.write(self.style.SUCCESS(
+            f'✅ Mejor por núcleo: GROCERYLYZER_OCR_THREADS={threads} GROCERYLYZER_OCR_QUANTIZE={int(quantize)} '
+            f'GROCERYLYZER_OCR_RECOG_NETWORK={network} GROCERYLYZER_OCR_RECOG_BATCH_SIZE={batch_size} '
+            f'({per_core:.2f} páginas/s por núcleo)'
+        ))
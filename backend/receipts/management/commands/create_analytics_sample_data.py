@@ -1,4 +1,6 @@
-from django.core.management.base import BaseCommand
+from django.core.management.base import BaseCommand, CommandError
+from django.contrib.auth.models import User
+from backendgrocerylyzer.money import to_cents
 from receipts.models import Receipt, Product
 from datetime import datetime, timedelta
 import random
@@ -6,7 +8,15 @@ import random
 class Command(BaseCommand):
     help = 'Crear datos de ejemplo optimizados para el dashboard de analytics'
 
+    def add_arguments(self, parser):
+        parser.add_argument('--username', required=True, help='Usuario propietario de los recibos')
+
     def handle(self, *args, **options):
+        try:
+            owner = User.objects.get(username=options['username'])
+        except User.DoesNotExist:
+            raise CommandError(f"No existe el usuario {options['username']}")
+        
         # Limpiar datos existentes (opcional)
         self.stdout.write('Creando datos de ejemplo optimizados para analytics...')
         
@@ -64,9 +74,10 @@ class Command(BaseCommand):
             
             # Crear recibo
             receipt = Receipt.objects.create(
+                owner=owner,
                 supermarket_name=supermarket_name,
                 date=receipt_date.date(),
-                total_amount=0  # Se calculará después
+                total_cents=0  # Se calculará después
             )
             
             # Seleccionar productos para este recibo
@@ -83,7 +94,7 @@ class Command(BaseCommand):
                 if random.random() < product['frequency']:
                     products_in_receipt.append(product)
             
-            total_amount = 0
+            total_cents = 0
             
             for product_data in products_in_receipt:
                 # Calcular precio con variaciones
@@ -99,25 +110,25 @@ class Command(BaseCommand):
                 # Variación aleatoria pequeña
                 random_variation = random.uniform(0.95, 1.05)
                 
-                final_price = round(
+                final_price = to_cents(round(
                     base_price * supermarket_multiplier * time_multiplier * random_variation, 
                     2
-                )
+                ))
                 
                 # Cantidad (generalmente 1, pero a veces más)
                 quantity = random.choices([1, 2, 3], weights=[70, 25, 5])[0]
                 
                 Product.objects.create(
                     name=product_data['name'],
-                    price=final_price,
+                    price_cents=final_price,
                     quantity=quantity,
                     receipt=receipt
                 )
                 
-                total_amount += final_price * quantity
+                total_cents += final_price * quantity
             
             # Actualizar total del recibo
-            receipt.total_amount = round(total_amount, 2)
+            receipt.total_cents = total_cents
             receipt.save()
         
         # Estadísticas finales
@@ -1,4 +1,6 @@
-from django.core.management.base import BaseCommand
+from django.core.management.base import BaseCommand, CommandError
+from django.contrib.auth.models import User
+from backendgrocerylyzer.money import to_cents
 from receipts.models import Receipt, Product
 from datetime import datetime, timedelta
 import random
@@ -6,7 +8,15 @@ import random
 class Command(BaseCommand):
     help = 'Crear datos de ejemplo para el dashboard de analytics'
 
+    def add_arguments(self, parser):
+        parser.add_argument('--username', required=True, help='Usuario propietario de los recibos')
+
     def handle(self, *args, **options):
+        try:
+            owner = User.objects.get(username=options['username'])
+        except User.DoesNotExist:
+            raise CommandError(f"No existe el usuario {options['username']}")
+        
         # Limpiar datos existentes (opcional)
         self.stdout.write('Creando datos de ejemplo...')
         
@@ -45,14 +55,15 @@ class Command(BaseCommand):
             
             # Crear recibo
             receipt = Receipt.objects.create(
+                owner=owner,
                 supermarket_name=supermarket,
                 date=receipt_date.date(),
-                total_amount=0  # Se calculará después
+                total_cents=0  # Se calculará después
             )
             
             # Añadir productos al recibo (entre 3 y 8 productos)
             num_products = random.randint(3, 8)
-            total_amount = 0
+            total_cents = 0
             
             selected_products = random.sample(products_data, min(num_products, len(products_data)))
             
@@ -70,20 +81,20 @@ class Command(BaseCommand):
                 else:
                     price_multiplier = random.uniform(0.95, 1.15)
                 
-                price = round(random.uniform(base_min, base_max) * price_multiplier, 2)
+                price_cents = to_cents(round(random.uniform(base_min, base_max) * price_multiplier, 2))
                 quantity = random.randint(1, 3)
                 
                 Product.objects.create(
                     name=product_data['name'],
-                    price=price,
+                    price_cents=price_cents,
                     quantity=quantity,
                     receipt=receipt
                 )
                 
-                total_amount += price * quantity
+                total_cents += price_cents * quantity
             
             # Actualizar total del recibo
-            receipt.total_amount = round(total_amount, 2)
+            receipt.total_cents = total_cents
             receipt.save()
         
         self.stdout.write(
@@ -0,0 +1,66 @@
+from django.core.management.base import BaseCommand, CommandError
+from receipts.datasets import PRESETS, DEFAULT_SEED, DEFAULT_END_DATE, generate, ensure_users, clear
+from datetime import datetime
+import time
+
+class Command(BaseCommand):
+    help = 'Generar un dataset sintético determinista (presets tiny/small/medium/large) para carga y benchmarks'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--preset', choices=sorted(PRESETS), default='small')
+        parser.add_argument('--receipts', type=int, help='Número de recibos (sobrescribe el preset)')
+        parser.add_argument('--catalog-size', type=int, help='Productos distintos en el catálogo')
+        parser.add_argument('--days', type=int, help='Días cubiertos por el dataset')
+        parser.add_argument('--seed', type=int, default=DEFAULT_SEED)
+        parser.add_argument('--end-date', default=DEFAULT_END_DATE.isoformat(), help='Fecha del último día (YYYY-MM-DD)')
+        parser.add_argument('--batch-size', type=int, default=2000, help='Recibos por lote de bulk_create')
+        parser.add_argument('--users', type=int, default=1, help='Repartir los recibos entre N usuarios sintéticos')
+        parser.add_argument('--user-prefix', default='demo', help='Prefijo de los usuarios sintéticos (demo, demo_1...)')
+        parser.add_argument('--clear', action='store_true', help='Borrar recibos y productos existentes antes')
+
+    def handle(self, *args, **options):
+        config = dict(PRESETS[options['preset']])
+        for key in ('receipts', 'catalog_size', 'days'):
+            if options[key] is not None:
+                config[key] = options[key]
+        
+        try:
+            end_date = datetime.strptime(options['end_date'], '%Y-%m-%d').date()
+        except ValueError:
+            raise CommandError('Formato de fecha inválido (usar YYYY-MM-DD)')
+        
+        if options['clear']:
+            self.stdout.write('Borrando datos existentes...')
+            clear()
+        
+        self.stdout.write(
+            f"Generando preset '{options['preset']}': {config['receipts']} recibos, "
+            f"catálogo de {config['catalog_size']} productos, {config['days']} días (seed={options['seed']})"
+        )
+        
+        start = time.perf_counter()
+        report_every = max(options['batch_size'], config['receipts'] // 20)
+        
+        def progress(receipts, products):
+            if receipts % report_every < options['batch_size'] or receipts == config['receipts']:
+                rate = products / max(time.perf_counter() - start, 1e-9)
+                self.stdout.write(f'  {receipts} recibos, {products} productos ({rate:,.0f} productos/s)')
+        
+        owners = ensure_users(options['users'], options['user_prefix'])
+        
+        result = generate(
+            owners=owners,
+            seed=options['seed'],
+            end_date=end_date,
+            batch_size=options['batch_size'],
+            progress=progress,
+            **config
+        )
+        
+        duration = time.perf_counter() - start
+        self.stdout.write(
+            self.style.SUCCESS(
+                f"✅ Se crearon {result['receipts']} recibos con {result['products']} productos en {duration:.1f}s "
+                f"para {len(owners)} usuario(s)"
+            )
+        )
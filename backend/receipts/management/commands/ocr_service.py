@@ -0,0 +1,52 @@
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from receipts.ocr import service
+import os
+import signal
+import time
+
+
+def _stop(signum, frame):
+    raise KeyboardInterrupt
+
+
+class Command(BaseCommand):
+    help = 'Servicio OCR de la máquina: carga los modelos una vez y atiende a todos los workers por un socket UNIX'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--socket', default=settings.OCR_SERVICE_SOCKET, help='Ruta del socket UNIX')
+        parser.add_argument('--batch-size', type=int, default=settings.OCR_SERVICE_BATCH_SIZE,
+                            help='Máximo de páginas por micro-lote')
+        parser.add_argument('--max-wait-ms', type=int, default=settings.OCR_SERVICE_MAX_WAIT_MS,
+                            help='Espera máxima de la primera página de un lote a que lleguen más')
+        parser.add_argument('--threads', type=int, default=os.cpu_count() or 1,
+                            help='Hilos de torch del servicio (por defecto todos los núcleos: es el único proceso con OCR)')
+
+    def handle(self, *args, **options):
+        path = options['socket']
+        if os.path.exists(path):
+            if service.service_running(path):
+                raise CommandError(f'Ya hay un servicio OCR escuchando en {path}')
+            os.unlink(path)  # Socket de un servicio anterior que no se cerró
+
+        start = time.perf_counter()
+        reader = service.get_reader(options['threads'])
+        self.stdout.write(f"Modelos cargados en {time.perf_counter() - start:.1f}s ({options['threads']} hilos)")
+
+        server = service.OCRServer(
+            path, reader, options['batch_size'], options['max_wait_ms'], settings.OCR_SERVICE_TIMEOUT
+        )
+        # SIGTERM (systemd, docker stop) cierra igual que Ctrl+C
+        signal.signal(signal.SIGTERM, _stop)
+        self.stdout.write(self.style.SUCCESS(
+            f"✅ Servicio OCR en {path} (lotes de {options['batch_size']} páginas, espera {options['max_wait_ms']}ms)"
+        ))
+        try:
+            server.serve_forever()
+        except KeyboardInterrupt:
+            pass
+        finally:
+            server.server_close()
+            if os.path.exists(path):
+                os.unlink(path)
+            self.stdout.write('Servicio OCR detenido')
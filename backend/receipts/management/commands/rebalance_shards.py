@@ -0,0 +1,57 @@
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand, CommandError
+from backendgrocerylyzer.db import sharding
+from receipts.models import Receipt
+from users.models import ShardAssignment
+
+class Command(BaseCommand):
+    help = 'Estado y reequilibrado de los shards de recibos (mover usuarios en caliente)'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--pin', action='store_true',
+                            help='Fijar a los usuarios existentes al shard donde ya están sus datos (tras añadir shards)')
+        parser.add_argument('--user', help='Usuario a mover (con --to)')
+        parser.add_argument('--to', choices=settings.RECEIPT_SHARDS, help='Shard de destino')
+        parser.add_argument('--apply', action='store_true',
+                            help='Mover a su shard de hash a todos los usuarios fijados en otro')
+
+    def handle(self, *args, **options):
+        if not sharding.is_sharded():
+            raise CommandError('Solo hay un shard (definir GROCERYLYZER_RECEIPT_SHARDS=N)')
+
+        if options['pin']:
+            pinned = sharding.pin_existing(log=self.stdout.write)
+            self.stdout.write(self.style.SUCCESS(f'✅ {pinned} usuarios fijados'))
+
+        if options['user']:
+            if not options['to']:
+                raise CommandError('--user requiere --to')
+            try:
+                user = User.objects.get(username=options['user'])
+            except User.DoesNotExist:
+                raise CommandError(f"Usuario inexistente: {options['user']}")
+            self._move(user.id, options['to'])
+
+        # Usuarios fijados fuera de su shard de hash
+        misplaced = [
+            (user_id, shard) for user_id, shard in ShardAssignment.objects.values_list('user_id', 'shard')
+            if sharding.hashed_shard(user_id) != shard
+        ]
+        if options['apply']:
+            for user_id, _ in misplaced:
+                self._move(user_id, sharding.hashed_shard(user_id))
+            misplaced = []
+
+        self.stdout.write('\nShards:')
+        for alias in sharding.shards():
+            receipts = Receipt.objects.using(alias)
+            users = receipts.exclude(owner_id=None).values('owner_id').distinct().count()
+            self.stdout.write(f'  {alias:<12} {users:>6} usuarios {receipts.count():>9} recibos')
+        if misplaced:
+            self.stdout.write(f'{len(misplaced)} usuarios fuera de su shard de hash (mover con --apply)')
+
+    def _move(self, user_id, target):
+        self.stdout.write(f'Moviendo usuario {user_id} a {target}...')
+        source, (receipts, products) = sharding.move_user(user_id, target, log=self.stdout.write)
+        self.stdout.write(self.style.SUCCESS(f'✅ {source} -> {target}: {receipts} recibos, {products} productos'))
@@ -0,0 +1,145 @@
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.core.servers.basehttp import WSGIRequestHandler, WSGIServer
+from django.core.wsgi import get_wsgi_application
+from django.db import connections
+from backendgrocerylyzer.memory import rss_mb, shared_memory_mb
+from receipts.ocr import service
+from PIL import Image, ImageDraw
+import gc
+import logging
+import numpy as np
+import os
+import signal
+import time
+import traceback
+
+
+def _stop(signum, frame):
+    raise KeyboardInterrupt
+
+
+def _warmup_page():
+    """Página pequeña con texto: ejercita la detección y el reconocimiento"""
+    image = Image.new('L', (480, 96), 255)
+    draw = ImageDraw.Draw(image)
+    draw.text((12, 12), 'Total venta Dia', fill=0)
+    draw.text((12, 52), 'TOMATE FRITO 2 ud 0,79 EUR', fill=0)
+    return np.asarray(image)
+
+
+class Command(BaseCommand):
+    help = (
+        'Arranca N workers web que comparten los modelos OCR: el padre los carga una vez y '
+        'hace fork (copy-on-write); informa de la memoria de cada worker'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--bind', default='127.0.0.1:8000', help='Dirección host:puerto')
+        parser.add_argument('--workers', type=int, default=2, help='Procesos worker')
+        parser.add_argument('--threads', type=int, default=settings.OCR_THREADS,
+                            help='Hilos de torch de cada worker')
+        parser.add_argument('--report-interval', type=int, default=60,
+                            help='Segundos entre informes de memoria (0: solo el primero)')
+
+    def handle(self, *args, **options):
+        host, _, port = options['bind'].rpartition(':')
+        if not host or not port.isdigit():
+            raise CommandError('--bind debe ser host:puerto')
+
+        # 1. Precarga: app WSGI, cadena de ingesta y modelos, con una inferencia
+        #    para que las asignaciones perezosas de torch se hagan antes del fork
+        start = time.perf_counter()
+        application = get_wsgi_application()
+        from receipts import ingestion  # Lo que el upload importaría en cada worker
+        reader = service.get_reader(options['threads'])
+        service.recognize_batch(reader, [_warmup_page()])
+        self.stdout.write(f'Modelos cargados en {time.perf_counter() - start:.1f}s, padre {rss_mb():.0f}MB')
+
+        # Los workers usan el lector heredado, no el servicio OCR
+        settings.OCR_SERVICE_ENABLED = False
+        # Sin conexiones abiertas compartidas entre procesos
+        connections.close_all()
+        # Los objetos ya creados pasan a la generación permanente: el recolector
+        # no los recorre y no escribe en sus páginas (que dejarían de compartirse)
+        gc.collect()
+        gc.freeze()
+
+        server = WSGIServer((host, int(port)), WSGIRequestHandler)
+        server.set_app(application)
+        workers = {}
+        signal.signal(signal.SIGTERM, _stop)
+        try:
+            for _ in range(options['workers']):
+                self._spawn(server, workers, options['threads'])
+            self.stdout.write(self.style.SUCCESS(
+                f"✅ {options['workers']} workers en http://{host}:{port} compartiendo los modelos OCR"
+            ))
+            # El primer informe, cuando los workers ya han hecho su inferencia de calentamiento
+            next_report = time.monotonic() + 5
+            while True:
+                pid, status = os.waitpid(-1, os.WNOHANG)
+                if pid:
+                    # Un worker caído se sustituye por otro hijo del padre precargado
+                    self.stdout.write(self.style.WARNING(f'Worker {pid} terminado ({status}), se relanza'))
+                    workers.pop(pid, None)
+                    self._spawn(server, workers, options['threads'])
+                if next_report and time.monotonic() >= next_report:
+                    self.report(workers)
+                    next_report = time.monotonic() + options['report_interval'] if options['report_interval'] else 0
+                time.sleep(0.5)
+        except KeyboardInterrupt:
+            pass
+        finally:
+            for pid in workers:
+                try:
+                    os.kill(pid, signal.SIGTERM)
+                except ProcessLookupError:
+                    pass
+            for pid in workers:
+                try:
+                    os.waitpid(pid, 0)
+                except ChildProcessError:
+                    pass
+            server.server_close()
+            self.stdout.write('Workers detenidos')
+
+    def _spawn(self, server, workers, threads):
+        pid = os.fork()
+        if pid:
+            workers[pid] = time.monotonic()
+            return
+        # Hijo: sirve peticiones del socket heredado hasta que lo paren
+        code = 0
+        try:
+            signal.signal(signal.SIGTERM, signal.SIG_DFL)
+            service.set_threads(threads)
+            service.recognize_batch(service.get_reader(), [_warmup_page()])
+            server.serve_forever()
+        except KeyboardInterrupt:
+            pass
+        except Exception:
+            traceback.print_exc()
+            code = 1
+        finally:
+            # os._exit no ejecuta atexit: vaciar antes la cola de logs del worker
+            logging.shutdown()
+            os._exit(code)
+
+    def report(self, workers):
+        rows = [('padre', os.getpid())] + [(f'worker {i + 1}', pid) for i, pid in enumerate(workers)]
+        self.stdout.write(f"{'proceso':<10} {'pid':>7} {'RSS MB':>8} {'PSS MB':>8} {'compartida':>11} {'privada':>8}")
+        total_rss = total_pss = 0.0
+        for label, pid in rows:
+            memory = shared_memory_mb(pid)
+            if memory is None:
+                self.stdout.write(f'{label:<10} {pid:>7} sin datos de /proc/{pid}/smaps_rollup')
+                continue
+            total_rss += memory['rss']
+            total_pss += memory['pss']
+            self.stdout.write(
+                f"{label:<10} {pid:>7} {memory['rss']:>8.0f} {memory['pss']:>8.0f} "
+                f"{memory['shared']:>11.0f} {memory['private']:>8.0f}"
+            )
+        # Sin compartir, la memoria real sería la suma de RSS; la PSS total es la que se usa de verdad
+        self.stdout.write(f'Total: RSS {total_rss:.0f}MB, PSS {total_pss:.0f}MB (compartido {total_rss - total_pss:.0f}MB)')
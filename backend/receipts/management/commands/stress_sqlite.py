@@ -0,0 +1,135 @@
+from django.core.management.base import BaseCommand
+from django.db import connections
+from django.test import Client
+from django.test.runner import DiscoverRunner
+from django.test.utils import override_settings, setup_test_environment, teardown_test_environment
+from backendgrocerylyzer.db.writequeue import run_write
+from receipts.datasets import ensure_users, generate_preset, clear, DEFAULT_END_DATE
+from receipts.views import save_parsed_receipt
+from datetime import datetime
+from pathlib import Path
+import statistics
+import tempfile
+import threading
+import time
+
+# (nombre, OPTIONS de la conexión, cola de escrituras)
+SCENARIOS = [
+    # Comportamiento de django.db.backends.sqlite3 sin configurar
+    ('sqlite_por_defecto', {'pragmas': {
+        'journal_mode': 'DELETE', 'synchronous': 'FULL', 'busy_timeout': 5000, 'cache_size': -2000, 'mmap_size': 0,
+        'temp_store': 'DEFAULT',
+    }}, False),
+    ('wal_sin_cola', None, False),
+    ('wal_con_cola', None, True),
+]
+
+class Command(BaseCommand):
+    help = 'Prueba de concurrencia SQLite: N subidas en paralelo con M lectores del dashboard'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--uploaders', type=int, default=4, help='Hilos que guardan recibos')
+        parser.add_argument('--readers', type=int, default=4, help='Hilos que consultan el dashboard')
+        parser.add_argument('--duration', type=float, default=5.0, help='Segundos por escenario')
+        parser.add_argument('--items', type=int, default=12, help='Productos por recibo subido')
+
+    def handle(self, *args, **options):
+        # Base de datos de test en fichero (la de memoria no tiene locks de fichero ni WAL)
+        tmpdir = tempfile.TemporaryDirectory()
+        settings_dict = connections.settings['default']
+        settings_dict.setdefault('TEST', {})['NAME'] = str(Path(tmpdir.name) / 'stress.sqlite3')
+        configured_options = dict(settings_dict['OPTIONS'])
+
+        setup_test_environment()
+        runner = DiscoverRunner(verbosity=0, interactive=False)
+        old_config = runner.setup_databases()
+        try:
+            user = ensure_users(1, prefix='benchmark')[0]
+
+            self.stdout.write(
+                f"{'escenario':<20}{'subidas/s':>11}{'p95 subida':>12}{'lecturas/s':>12}{'p95 lectura':>13}{'errores':>9}"
+            )
+            for name, scenario_options, write_queue in SCENARIOS:
+                settings_dict['OPTIONS'] = dict(scenario_options or configured_options)
+                connections.close_all()
+                # Mismo volumen de datos al empezar cada escenario
+                clear()
+                generate_preset('tiny', owners=[user])
+                with override_settings(SQLITE_WRITE_QUEUE=write_queue):
+                    stats = self._run(user, options)
+                self.stdout.write(
+                    f"{name:<20}{stats['uploads'] / options['duration']:>11.1f}{stats['upload_p95']:>10.1f}ms"
+                    f"{stats['reads'] / options['duration']:>12.1f}{stats['read_p95']:>11.1f}ms{stats['errors']:>9}"
+                )
+        finally:
+            settings_dict['OPTIONS'] = configured_options
+            connections.close_all()
+            runner.teardown_databases(old_config)
+            teardown_test_environment()
+            tmpdir.cleanup()
+
+    def _run(self, user, options):
+        deadline = time.monotonic() + options['duration']
+        lock = threading.Lock()
+        results = {'upload_ms': [], 'read_ms': [], 'errors': 0}
+        parsed = {
+            'supermarket': 'Mercadona',
+            'datetime': datetime.combine(DEFAULT_END_DATE, datetime.min.time()),
+            'total_amount': 12.34 * options['items'],
+            'items': [
+                {'name': f'Producto {i}', 'unit_price': 1.5 + i, 'quantity': 1} for i in range(options['items'])
+            ],
+        }
+
+        def record(key, start, ok):
+            # Solo las operaciones correctas cuentan para el throughput
+            with lock:
+                if ok:
+                    results[key].append((time.perf_counter() - start) * 1000)
+                else:
+                    results['errors'] += 1
+
+        def uploader():
+            try:
+                while time.monotonic() < deadline:
+                    start = time.perf_counter()
+                    try:
+                        run_write(save_parsed_receipt, user, parsed)
+                        record('upload_ms', start, True)
+                    except Exception:
+                        record('upload_ms', start, False)
+            finally:
+                connections.close_all()
+
+        def reader(client):
+            try:
+                while time.monotonic() < deadline:
+                    start = time.perf_counter()
+                    response = client.get('/api/analytics/dashboard-overview/')
+                    record('read_ms', start, response.status_code < 500)
+            finally:
+                connections.close_all()
+
+        clients = []
+        for _ in range(options['readers']):
+            client = Client(raise_request_exception=False)
+            client.force_login(user)
+            clients.append(client)
+
+        threads = [threading.Thread(target=uploader) for _ in range(options['uploaders'])]
+        threads += [threading.Thread(target=reader, args=(client,)) for client in clients]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        def p95(values):
+            return statistics.quantiles(values, n=20)[-1] if len(values) > 1 else (values[0] if values else 0.0)
+
+        return {
+            'uploads': len(results['upload_ms']),
+            'reads': len(results['read_ms']),
+            'upload_p95': p95(results['upload_ms']),
+            'read_p95': p95(results['read_ms']),
+            'errors': results['errors'],
+        }
@@ -0,0 +1,25 @@
+# Generated by Django 5.1.1 on 2026-10-19 19:13
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('receipts', '0003_alter_receipt_owner'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ReceiptChange',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('user_id', models.BigIntegerField(null=True)),
+                ('receipt_id', models.BigIntegerField(null=True)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+            ],
+            options={
+                'indexes': [models.Index(fields=['user_id', 'id'], name='receiptchange_user_seq_idx'), models.Index(fields=['created_at'], name='receiptchange_created_idx')],
+            },
+        ),
+    ]
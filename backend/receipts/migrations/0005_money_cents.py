@@ -0,0 +1,69 @@
+# Importes en céntimos enteros (backendgrocerylyzer/money.py)
+
+import backendgrocerylyzer.money
+from django.db import migrations, models
+from django.db.models import F
+from django.db.models.functions import Cast, Round
+
+
+def to_cents(apps, schema_editor):
+    alias = schema_editor.connection.alias
+    Receipt = apps.get_model('receipts', 'Receipt')
+    Product = apps.get_model('receipts', 'Product')
+    Receipt.objects.using(alias).update(
+        total_cents=Cast(Round(F('total_amount') * 100), models.BigIntegerField())
+    )
+    Product.objects.using(alias).update(
+        price_cents=Cast(Round(F('price') * 100), models.BigIntegerField())
+    )
+
+
+def to_decimal(apps, schema_editor):
+    alias = schema_editor.connection.alias
+    Receipt = apps.get_model('receipts', 'Receipt')
+    Product = apps.get_model('receipts', 'Product')
+    decimal = models.DecimalField(max_digits=10, decimal_places=2)
+    Receipt.objects.using(alias).update(total_amount=Cast(F('total_cents') / 100.0, decimal))
+    Product.objects.using(alias).update(price=Cast(F('price_cents') / 100.0, decimal))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('receipts', '0004_receiptchange'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='receipt',
+            name='total_cents',
+            field=backendgrocerylyzer.money.MoneyField(default=0),
+            preserve_default=False,
+        ),
+        migrations.AddField(
+            model_name='product',
+            name='price_cents',
+            field=backendgrocerylyzer.money.MoneyField(default=0),
+            preserve_default=False,
+        ),
+        # Nullables, para que al deshacer la migración se puedan volver a rellenar
+        migrations.AlterField(
+            model_name='receipt',
+            name='total_amount',
+            field=models.DecimalField(decimal_places=2, max_digits=10, null=True),
+        ),
+        migrations.AlterField(
+            model_name='product',
+            name='price',
+            field=models.DecimalField(decimal_places=2, max_digits=10, null=True),
+        ),
+        migrations.RunPython(to_cents, to_decimal),
+        migrations.RemoveField(
+            model_name='receipt',
+            name='total_amount',
+        ),
+        migrations.RemoveField(
+            model_name='product',
+            name='price',
+        ),
+    ]
@@ -0,0 +1,81 @@
+# Dimensión de supermercados: Receipt.supermarket (id entero) en lugar de agrupar por texto
+#
+# La dimensión solo vive en 'default': en una instalación con shards hay que
+# migrar 'default' antes que los shards.
+#
+# La normalización es una copia de catalog.supermarkets tal como estaba al
+# escribir la migración: si el módulo cambia, la migración no.
+
+import re
+import unicodedata
+
+import django.db.models.deletion
+from django.db import DEFAULT_DB_ALIAS, migrations, models
+
+UNKNOWN_SUPERMARKET = 'Desconocido'
+
+
+def normalize(name):
+    """Minúsculas, sin acentos y solo palabras alfanuméricas: 'DÍA  %' -> 'dia'"""
+    text = unicodedata.normalize('NFKD', name or '')
+    text = ''.join(c for c in text if not unicodedata.combining(c)).lower()
+    return ' '.join(re.findall(r'[a-z0-9]+', text))
+
+
+def match_alias(normalized, aliases):
+    """Id del alias más largo que coincide con las primeras palabras del texto, o None"""
+    words = normalized.split()
+    for size in range(len(words), 0, -1):
+        supermarket_id = aliases.get(' '.join(words[:size]))
+        if supermarket_id is not None:
+            return supermarket_id
+    return None
+
+
+def resolve_names(apps, schema_editor):
+    alias = schema_editor.connection.alias
+    Receipt = apps.get_model('receipts', 'Receipt')
+    Supermarket = apps.get_model('catalog', 'Supermarket')
+    SupermarketAlias = apps.get_model('catalog', 'SupermarketAlias')
+    aliases = dict(SupermarketAlias.objects.using(DEFAULT_DB_ALIAS).values_list('alias', 'supermarket_id'))
+
+    names = Receipt.objects.using(alias).order_by().values_list('supermarket_name', flat=True).distinct()
+    for raw in list(names):
+        text = normalize(raw) or normalize(UNKNOWN_SUPERMARKET)
+        supermarket_id = match_alias(text, aliases)
+        if supermarket_id is None:
+            name = ' '.join(raw.split())[:100] or UNKNOWN_SUPERMARKET
+            supermarket, _ = Supermarket.objects.using(DEFAULT_DB_ALIAS).get_or_create(name=name)
+            SupermarketAlias.objects.using(DEFAULT_DB_ALIAS).create(alias=text, supermarket=supermarket)
+            supermarket_id = aliases[text] = supermarket.id
+        Receipt.objects.using(alias).filter(supermarket_name=raw).update(supermarket_id=supermarket_id)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('catalog', '0002_seed_supermarkets'),
+        ('receipts', '0005_money_cents'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='receipt',
+            name='supermarket',
+            field=models.ForeignKey(db_constraint=False, null=True, on_delete=django.db.models.deletion.PROTECT, related_name='receipts', to='catalog.supermarket'),
+        ),
+        migrations.RunPython(resolve_names, migrations.RunPython.noop),
+        migrations.AlterField(
+            model_name='receipt',
+            name='supermarket',
+            field=models.ForeignKey(db_constraint=False, on_delete=django.db.models.deletion.PROTECT, related_name='receipts', to='catalog.supermarket'),
+        ),
+        migrations.RemoveIndex(
+            model_name='receipt',
+            name='receipt_owner_market_idx',
+        ),
+        migrations.AddIndex(
+            model_name='receipt',
+            index=models.Index(fields=['owner', 'supermarket'], name='receipt_owner_market_idx'),
+        ),
+    ]
@@ -0,0 +1,283 @@
+# Entidades de producto: Product.entity agrupa los nombres con errores de OCR
+#
+# Las entidades solo viven en 'default': en una instalación con shards hay que
+# migrar 'default' antes que los shards.
+#
+# La normalización y el índice son una copia de catalog.matching tal como
+# estaba al escribir la migración: si el módulo cambia, la migración tiene que
+# seguir dando las mismas entidades.
+
+import re
+import unicodedata
+from array import array
+
+import django.db.models.deletion
+from django.db import DEFAULT_DB_ALIAS, migrations, models
+
+THRESHOLD = 0.85
+# Correcciones que se prueban por palabra y nombres corregidos por consulta
+MAX_WORD_CANDIDATES = 3
+MAX_COMBINATIONS = 12
+
+_TOKEN = re.compile(r'[a-z0-9]+(?:[.,][0-9]+[a-z]*)*')
+_UNITS = r'(?:kg|gr|g|mg|lt|l|ml|cl|uds|ud|un|u)'
+_SIZE = re.compile(rf'^\d+(?:\.\d+)?(?:x\d+(?:\.\d+)?)?{_UNITS}$')
+_NUMBER = re.compile(r'^\d+(?:\.\d+)?$')
+# Espacio perdido junto a un número: "PACK12", "CEBOLLAS1KG", "500GSOS"
+_GLUED_TAIL = re.compile(rf'^([a-z]{{3,}})(\d+(?:\.\d+)?(?:x\d+(?:\.\d+)?)?{_UNITS}?)$')
+_GLUED_HEAD = re.compile(rf'^(\d{{2,}}(?:\.\d+)?{_UNITS})([a-z]{{3,}})$')  # "8LANCA" es "BLANCA"
+# Unidades mal leídas: "400RNL", "75C1"
+_UNIT_FIXES = [(re.compile(r'^(\d+(?:\.\d+)?)(?:rnl|rn1|m1)$'), r'\1ml'), (re.compile(r'^(\d+(?:\.\d+)?)c1$'), r'\1cl'),
+               (re.compile(r'^(\d+(?:\.\d+)?)k9$'), r'\1kg'), (re.compile(r'^(\d+(?:\.\d+)?)rng$'), r'\1mg')]
+# Dígitos que el OCR pone en lugar de letras dentro de una palabra
+_OCR_DIGITS = str.maketrans('0123456789', 'olzeasgtbg')
+_SKELETON = str.maketrans('vzykqwj', 'bsicaux')
+_DOUBLE = re.compile(r'(.)\1+')
+
+
+def normalize_product(name):
+    """Clave del nombre: minúsculas, sin acentos, dígitos de OCR corregidos en palabras
+
+    'LECHE ENTER4 1,5L' -> 'leche entera 1.5l'
+    """
+    text = unicodedata.normalize('NFKD', name or '').encode('ascii', 'ignore').decode().lower()
+    tokens = []
+    for token in _TOKEN.findall(text):
+        if token.isalpha() or token.isdigit():
+            tokens.append(token)
+        else:
+            tokens.extend(_split_token(token.replace(',', '.')))
+    return ' '.join(tokens)
+
+
+def _fix_unit(token):
+    for pattern, replacement in _UNIT_FIXES:
+        token = pattern.sub(replacement, token)
+    return token
+
+
+def _split_token(token):
+    token = _fix_unit(token)
+    if _SIZE.match(token) or _NUMBER.match(token):
+        return [token]
+    glued = _GLUED_TAIL.match(token)
+    if glued:
+        word, tail = glued.groups()
+        tail = _fix_unit(tail)
+        # "ENTER4" es una letra mal leída; "PACK8", "TRIGO1KG" o "PACK12", un espacio perdido
+        if _SIZE.match(tail) or len(tail) > 1 or word == 'pack':
+            return [word.translate(_OCR_DIGITS), tail]
+    glued = _GLUED_HEAD.match(token)
+    if glued:
+        return list(glued.groups())
+    return [token.translate(_OCR_DIGITS).replace('.', '')]
+
+
+def split_key(key):
+    """(palabras, números, tamaños) de una clave normalizada"""
+    words, numbers, sizes = [], [], []
+    for token in key.split():
+        if token.isalpha():
+            words.append(token)
+        elif _SIZE.match(token):
+            sizes.append(token)
+        elif _NUMBER.match(token):
+            numbers.append(token)
+        else:
+            words.append(token)
+    return tuple(words), tuple(numbers), tuple(sorted(sizes))
+
+
+def skeleton(word):
+    """Clave fonética/visual de una palabra: 'vaso' y 'baso', 'molde' y 'rnolde'..."""
+    word = word.replace('rn', 'm').replace('cl', 'd').replace('qu', 'k').replace('ll', 'y').replace('h', '')
+    return _DOUBLE.sub(r'\1', word.translate(_SKELETON))
+
+
+def max_word_edits(length):
+    """Errores admitidos en una palabra según su longitud ("eco" y "bio" no se confunden)"""
+    if length <= 2:
+        return 0
+    if length <= 5:
+        return 1
+    return 2
+
+
+def deletions(word, distance):
+    """Variantes de ``word`` con hasta ``distance`` letras borradas (incluida la propia palabra)"""
+    variants = {word}
+    frontier = {word}
+    for _ in range(distance):
+        frontier = {w[:i] + w[i + 1:] for w in frontier for i in range(len(w))}
+        variants |= frontier
+    return variants
+
+
+def bounded_distance(a, b, limit):
+    """Distancia de Levenshtein entre ``a`` y ``b``, o None si supera ``limit``"""
+    if a == b:
+        return 0
+    if abs(len(a) - len(b)) > limit:
+        return None
+    previous = list(range(len(b) + 1))
+    for i, ca in enumerate(a, 1):
+        current = [i]
+        for j, cb in enumerate(b, 1):
+            current.append(min(previous[j] + 1, current[j - 1] + 1, previous[j - 1] + (ca != cb)))
+        if min(current) > limit:
+            return None
+        previous = current
+    return previous[-1] if previous[-1] <= limit else None
+
+
+def _signature(words, numbers, sizes):
+    return ' '.join(words) + '|' + ' '.join(numbers) + '|' + ' '.join(sizes)
+
+
+class ProductIndex:
+    """Índice de bloqueo sobre claves normalizadas -> id de entidad (solo añade)"""
+
+    def __init__(self):
+        self.keys = []
+        self.entities = array('q')
+        self._exact = {}  # clave -> posición
+        self._signatures = {}  # palabras|números|tamaños -> posiciones
+        self._vocabulary = {}  # palabra -> nº de claves que la usan
+        self._deletions = {}  # variante con letras borradas -> palabras
+        self._skeletons = {}  # esqueleto -> palabras
+
+    def __len__(self):
+        return len(self.keys)
+
+    def __contains__(self, key):
+        return key in self._exact
+
+    def add(self, key, entity_id):
+        if key in self._exact:
+            return
+        position = len(self.keys)
+        words, numbers, sizes = split_key(key)
+        self.keys.append(key)
+        self.entities.append(entity_id)
+        self._exact[key] = position
+        self._signatures.setdefault(_signature(words, numbers, sizes), []).append(position)
+        for word in words:
+            if word in self._vocabulary:
+                self._vocabulary[word] += 1
+                continue
+            self._vocabulary[word] = 1
+            for variant in deletions(word, max_word_edits(len(word))):
+                self._deletions.setdefault(variant, []).append(word)
+            self._skeletons.setdefault(skeleton(word), []).append(word)
+
+    def match(self, key):
+        """(id de entidad, puntuación) del mejor alias para ``key``, o (None, 0.0)"""
+        position = self._exact.get(key)
+        if position is not None:
+            return self.entities[position], 1.0
+        words, numbers, sizes = split_key(key)
+        if not words:
+            return None, 0.0
+
+        length = sum(map(len, words))
+        for candidate, edits in self._corrected(words):
+            score = 1 - edits / length
+            if score < THRESHOLD:
+                break  # Ordenadas por coste: las siguientes son peores
+            positions = self._signatures.get(_signature(candidate, numbers, sizes))
+            if positions:
+                return self.entities[positions[0]], score
+        return None, 0.0
+
+    def _corrected(self, words):
+        """Nombres del vocabulario cercanos a ``words``: [(palabras, coste)] de menor a mayor coste"""
+        # Búsqueda en haz por posición: cada palabra se sustituye por una
+        # corrección, o junto con la siguiente por una palabra del vocabulario
+        # (espacio sobrante del OCR: "LECHE ENT ERA")
+        beams = {0: [((), 0)]}
+        for i, word in enumerate(words):
+            states = sorted(beams.pop(i, ()), key=lambda state: state[1])[:MAX_COMBINATIONS]
+            if not states:
+                continue
+            choices = self._word_choices(word)
+            if i + 1 < len(words) and word + words[i + 1] in self._vocabulary:
+                choices.append(((word + words[i + 1],), 0, 2))
+            for prefix, cost in states:
+                for replacement, edits, consumed in choices:
+                    beams.setdefault(i + consumed, []).append((prefix + replacement, cost + edits))
+        return sorted(beams.get(len(words), ()), key=lambda state: state[1])[:MAX_COMBINATIONS]
+
+    def _word_choices(self, word):
+        """[(palabras que la sustituyen, ediciones, palabras consumidas)] para una palabra"""
+        if word in self._vocabulary:
+            return [((word,), 0, 1)]
+        limit = max_word_edits(len(word))
+        candidates = set()
+        for variant in deletions(word, limit):
+            candidates.update(self._deletions.get(variant, ()))
+        # Mismo esqueleto ("rnolde" y "molde"): una sola confusión
+        word_skeleton = skeleton(word)
+        sounds_alike = self._skeletons.get(word_skeleton, ())
+        candidates.update(sounds_alike)
+        scored = []
+        for candidate in candidates:
+            distance = bounded_distance(word, candidate, limit)
+            if candidate in sounds_alike:
+                distance = 1 if distance is None else min(distance, 1)
+            if distance is not None:
+                scored.append((distance, -self._vocabulary[candidate], candidate))
+        scored.sort()
+        choices = [((candidate,), distance, 1) for distance, _, candidate in scored[:MAX_WORD_CANDIDATES]]
+        # Espacio perdido: "LECHEENTERA", "PAPELDE"
+        for cut in range(2, len(word) - 1):
+            if word[:cut] in self._vocabulary and word[cut:] in self._vocabulary:
+                choices.append(((word[:cut], word[cut:]), 0, 1))
+                break
+        return choices
+
+
+def resolve_names(apps, schema_editor):
+    alias = schema_editor.connection.alias
+    Product = apps.get_model('receipts', 'Product')
+    ProductEntity = apps.get_model('catalog', 'ProductEntity')
+    ProductAlias = apps.get_model('catalog', 'ProductAlias')
+
+    index = ProductIndex()
+    for key, entity_id in ProductAlias.objects.using(DEFAULT_DB_ALIAS).order_by('id').values_list('alias', 'entity_id'):
+        index.add(key, entity_id)
+
+    # En orden de aparición: el primer nombre visto da nombre a la entidad
+    names = Product.objects.using(alias).values('name').annotate(first=models.Min('id')).order_by('first')
+    for raw in [row['name'] for row in names]:
+        key = normalize_product(raw)[:255] or 'producto'
+        entity_id, _ = index.match(key)
+        if entity_id is None:
+            entity_id = ProductEntity.objects.using(DEFAULT_DB_ALIAS).create(
+                name=' '.join(raw.split())[:255] or 'Producto'
+            ).id
+        if key not in index:
+            ProductAlias.objects.using(DEFAULT_DB_ALIAS).create(alias=key, entity_id=entity_id)
+            index.add(key, entity_id)
+        Product.objects.using(alias).filter(name=raw).update(entity_id=entity_id)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('catalog', '0003_product_entities'),
+        ('receipts', '0006_receipt_supermarket'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='product',
+            name='entity',
+            field=models.ForeignKey(db_constraint=False, null=True, on_delete=django.db.models.deletion.PROTECT, related_name='products', to='catalog.productentity'),
+        ),
+        migrations.RunPython(resolve_names, migrations.RunPython.noop),
+        migrations.AlterField(
+            model_name='product',
+            name='entity',
+            field=models.ForeignKey(db_constraint=False, on_delete=django.db.models.deletion.PROTECT, related_name='products', to='catalog.productentity'),
+        ),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 5.1.1 on 2026-10-19 20:27
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('receipts', '0007_product_entity'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='product',
+            name='weighed',
+            field=models.BooleanField(default=False),
+        ),
+    ]
@@ -0,0 +1,66 @@
+# Receipt.owner obligatorio
+#
+# Los recibos anteriores a 0002_receipt_owner se quedaron con owner NULL y
+# ``for_user`` no los devuelve a nadie. Se asignan al usuario de
+# GROCERYLYZER_ORPHAN_RECEIPTS_OWNER (nombre de usuario) o, si no se indica,
+# al primer superusuario (o al primer usuario) y se suman a sus estadísticas.
+# Los usuarios solo están en 'default': con shards hay que migrar 'default'
+# antes que los shards.
+
+import os
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import DEFAULT_DB_ALIAS, migrations, models
+
+
+def _orphans_owner(User):
+    users = User.objects.using(DEFAULT_DB_ALIAS)
+    username = os.environ.get('GROCERYLYZER_ORPHAN_RECEIPTS_OWNER')
+    if username:
+        return users.get(username=username)
+    return users.filter(is_superuser=True).order_by('id').first() or users.order_by('id').first()
+
+
+def assign_orphans(apps, schema_editor):
+    alias = schema_editor.connection.alias
+    Receipt = apps.get_model('receipts', 'Receipt')
+    ReceiptChange = apps.get_model('receipts', 'ReceiptChange')
+    User = apps.get_model(*settings.AUTH_USER_MODEL.split('.'))
+    UserProfile = apps.get_model('users', 'UserProfile')
+
+    orphans = Receipt.objects.using(alias).filter(owner__isnull=True)
+    stats = orphans.aggregate(count=models.Count('id'), total=models.Sum('total_cents'))
+    if not stats['count']:
+        return
+    owner = _orphans_owner(User)
+    if owner is None:
+        raise RuntimeError(
+            f"Hay {stats['count']} recibos sin propietario y ningún usuario: crea uno "
+            "(createsuperuser) o indica GROCERYLYZER_ORPHAN_RECEIPTS_OWNER"
+        )
+    orphans.update(owner_id=owner.id)
+    # Sus snapshots de analytics se recargan enteros
+    ReceiptChange.objects.using(alias).create(user_id=owner.id, receipt_id=None)
+    UserProfile.objects.using(DEFAULT_DB_ALIAS).filter(user_id=owner.id).update(
+        total_receipts_processed=models.F('total_receipts_processed') + stats['count'],
+        total_spent_cents=models.F('total_spent_cents') + (stats['total'] or 0),
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('receipts', '0008_product_weighed'),
+        ('users', '0003_money_cents'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.RunPython(assign_orphans, migrations.RunPython.noop),
+        migrations.AlterField(
+            model_name='receipt',
+            name='owner',
+            field=models.ForeignKey(db_constraint=False, on_delete=django.db.models.deletion.CASCADE, related_name='receipts', to=settings.AUTH_USER_MODEL),
+        ),
+    ]
@@ -1,18 +1,107 @@
+from django.conf import settings
 from django.db import models
 
+from backendgrocerylyzer.db.sharding import read_db_for, shard_for_user_id
+from backendgrocerylyzer.money import MoneyField, to_euros
+from catalog.products import resolve_product
+from catalog.supermarkets import resolve_supermarket
+
+class ReceiptQuerySet(models.QuerySet):
+    def for_user(self, user):
+        """Recibos del usuario, en su shard (usa el índice owner+date)"""
+        return self.using(read_db_for(user)).filter(owner=user)
+
+    def create(self, **kwargs):
+        # Sin .using() explícito, al shard del propietario (el router no ve la instancia)
+        if self._db is None:
+            owner_id = kwargs.get('owner_id', getattr(kwargs.get('owner'), 'pk', None))
+            return super(ReceiptQuerySet, self.using(shard_for_user_id(owner_id, for_write=True))).create(**kwargs)
+        return super().create(**kwargs)
+
+class ProductQuerySet(models.QuerySet):
+    def for_user(self, user):
+        """Productos de los recibos del usuario, en su shard"""
+        return self.using(read_db_for(user)).filter(receipt__owner=user)
+
+    def create(self, **kwargs):
+        # Sin .using() explícito, al shard de su recibo
+        receipt = kwargs.get('receipt')
+        if self._db is None and receipt is not None and receipt._state.db:
+            return super(ProductQuerySet, self.using(receipt._state.db)).create(**kwargs)
+        return super().create(**kwargs)
+
 class Receipt(models.Model):
-    supermarket_name = models.CharField(max_length=255)
+    owner = models.ForeignKey(
+        settings.AUTH_USER_MODEL, related_name='receipts', on_delete=models.CASCADE,
+        db_constraint=False,  # Los usuarios solo están en 'default'; el recibo, en su shard
+    )
+    supermarket_name = models.CharField(max_length=255)  # Texto tal como llegó (OCR o usuario)
+    supermarket = models.ForeignKey(
+        'catalog.Supermarket', related_name='receipts', on_delete=models.PROTECT,
+        db_constraint=False,  # La dimensión solo está en 'default'
+    )
     date = models.DateField()
-    total_amount = models.DecimalField(max_digits=10, decimal_places=2)
+    total_cents = MoneyField()
+
+    objects = ReceiptQuerySet.as_manager()
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['owner', 'date'], name='receipt_owner_date_idx'),
+            models.Index(fields=['owner', 'supermarket'], name='receipt_owner_market_idx'),
+        ]
+
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        # Valores cargados, para que las señales apliquen solo la diferencia
+        instance._loaded_stats = (instance.__dict__.get('owner_id'), instance.__dict__.get('total_cents'))
+        return instance
+
+    def save(self, *args, **kwargs):
+        # Se resuelve una sola vez, al guardar; luego se agrupa por el id
+        if self.supermarket_id is None:
+            self.supermarket_id = resolve_supermarket(self.supermarket_name)
+        super().save(*args, **kwargs)
 
     def __str__(self):
         return f"Receipt from {self.supermarket_name} on {self.date}"
-    
+
 class Product(models.Model):
     name = models.CharField(max_length=255)
-    price = models.DecimalField(max_digits=10, decimal_places=2)
+    price_cents = MoneyField()  # Precio unitario
     quantity = models.IntegerField()
+    # A peso: quantity 1 y price_cents el importe de la línea, que no es un
+    # precio comparable entre compras (depende de lo que se pesó)
+    weighed = models.BooleanField(default=False)
     receipt = models.ForeignKey(Receipt, related_name='products', on_delete=models.CASCADE)
+    entity = models.ForeignKey(
+        'catalog.ProductEntity', related_name='products', on_delete=models.PROTECT,
+        db_constraint=False,  # Las entidades solo están en 'default'
+    )
+
+    objects = ProductQuerySet.as_manager()
+
+    def save(self, *args, **kwargs):
+        # Nombres con errores de OCR del mismo producto comparten entidad
+        if self.entity_id is None:
+            self.entity_id = resolve_product(self.name)
+        super().save(*args, **kwargs)
 
     def __str__(self):
-        return f"{self.name} - {self.price}"
\ No newline at end of file
+        return f"{self.name} - {to_euros(self.price_cents):.2f}"
+
+class ReceiptChange(models.Model):
+    """Registro de cambios de recibos: refresca los snapshots columnares de analytics
+
+    Sin receipt_id hay que recargar todo el usuario; sin user_id, todos los usuarios.
+    """
+    user_id = models.BigIntegerField(null=True)
+    receipt_id = models.BigIntegerField(null=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['user_id', 'id'], name='receiptchange_user_seq_idx'),
+            models.Index(fields=['created_at'], name='receiptchange_created_idx'),
+        ]
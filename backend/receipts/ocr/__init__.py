@@ -0,0 +1,6 @@
+# ocr - Reconocimiento de texto de los recibos escaneados
+#
+# service.py: proceso único con los modelos cargados (manage.py ocr_service)
+# que agrupa en micro-lotes las páginas de todos los workers, y su cliente.
+# engines.py: motores intercambiables (EasyOCR, Tesseract) y elección por modo
+# (fast, accurate, auto).
@@ -0,0 +1,71 @@
+# dpi.py - Resolución de rasterizado de cada página escaneada
+#
+# En lugar de probar 200, 150 y la resolución por defecto (rasterizando el
+# documento entero en cada intento), la resolución de cada página se decide
+# antes de rasterizar, con lo que pdfplumber ya sabe de ella:
+#
+#   - texto: la necesaria para que una línea de OCR_TEXT_LINE_PT puntos mida
+#     OCR_TARGET_TEXT_HEIGHT píxeles (la altura que busca el preprocesado);
+#   - escaneo: no más que la resolución nativa de la imagen que cubre la
+#     página (por encima solo se interpolan píxeles);
+#   - presupuesto: no más de OCR_MAX_PAGE_PIXELS píxeles por página;
+#   - y siempre entre OCR_MIN_DPI y OCR_MAX_DPI.
+#
+# ``plan_page`` devuelve también el límite que decidió, para ajustar los
+# parámetros con los logs.
+
+import math
+
+from django.conf import settings
+
+POINTS_PER_INCH = 72
+
+
+def native_dpi(page):
+    """Resolución de la imagen que más superficie cubre en la página, o None si no tiene imágenes"""
+    best_area, best_dpi = 0, None
+    for image in page.images:
+        height_pt = float(image['bottom'] - image['top'])
+        area = float(image['x1'] - image['x0']) * height_pt
+        if height_pt > 0 and area > best_area:
+            best_area = area
+            best_dpi = image['srcsize'][1] * POINTS_PER_INCH / height_pt
+    return best_dpi
+
+
+def plan_page(page, target_text_height=None, line_pt=None):
+    """{'page', 'dpi', 'width', 'height', 'pixels', 'limit'} para rasterizar una página de pdfplumber"""
+    target_text_height = target_text_height or settings.OCR_TARGET_TEXT_HEIGHT
+    line_pt = line_pt or settings.OCR_TEXT_LINE_PT
+    width_pt, height_pt = float(page.width), float(page.height)
+
+    candidates = [(target_text_height * POINTS_PER_INCH / line_pt, 'text')]
+    native = native_dpi(page)
+    if native:
+        candidates.append((native, 'native'))
+    candidates.append((POINTS_PER_INCH * math.sqrt(settings.OCR_MAX_PAGE_PIXELS / (width_pt * height_pt)), 'budget'))
+    dpi, limit = min(candidates)
+    if dpi < settings.OCR_MIN_DPI:
+        dpi, limit = settings.OCR_MIN_DPI, 'min'
+    elif dpi > settings.OCR_MAX_DPI:
+        dpi, limit = settings.OCR_MAX_DPI, 'max'
+
+    dpi = int(dpi)
+    width = math.ceil(width_pt * dpi / POINTS_PER_INCH)
+    height = math.ceil(height_pt * dpi / POINTS_PER_INCH)
+    return {'page': page.page_number, 'dpi': dpi, 'width': width, 'height': height, 'pixels': width * height,
+            'limit': limit}
+
+
+def plan_runs(plans):
+    """Agrupa páginas consecutivas con la misma resolución: [(primera, última, dpi)]
+
+    Cada grupo se rasteriza con una sola llamada a pdftoppm.
+    """
+    runs = []
+    for plan in plans:
+        if runs and runs[-1][2] == plan['dpi'] and runs[-1][1] == plan['page'] - 1:
+            runs[-1] = (runs[-1][0], plan['page'], plan['dpi'])
+        else:
+            runs.append((plan['page'], plan['page'], plan['dpi']))
+    return runs
@@ -0,0 +1,156 @@
+# engines.py - Motores OCR intercambiables y selección por modo
+#
+# Hay dos motores con la misma interfaz (``readtext(images, trace)`` devuelve
+# los resultados de cada página en el formato de readtext, [caja, texto,
+# confianza] con la confianza entre 0 y 1):
+#
+#   - easyocr: el de siempre, a través del servicio OCR de la máquina o del
+#     lector del proceso (receipts/ocr/service.py). Preciso pero lento en CPU.
+#   - tesseract: la CLI de Tesseract en un subproceso, una página por llamada.
+#     Varias veces más rápido con recibos limpios y de buen contraste, y sin
+#     modelos cargados en el worker.
+#
+# El modo decide qué motor se usa:
+#
+#   - fast: el rápido (OCR_FAST_ENGINE) o, si no está disponible, el preciso;
+#   - accurate: el preciso (OCR_ACCURATE_ENGINE);
+#   - auto: el rápido y, solo para las páginas cuya confianza media queda por
+#     debajo de OCR_ESCALATE_CONFIDENCE (o si el rápido no está disponible),
+#     el preciso.
+
+import logging
+import os
+import shutil
+import subprocess
+import time
+
+import numpy as np
+from django.conf import settings
+
+from backendgrocerylyzer import metrics
+from . import service
+
+logger = logging.getLogger(__name__)
+
+MODES = ('fast', 'accurate', 'auto')
+# Códigos de idioma de Tesseract de los de EasyOCR (OCR_LANGUAGES)
+TESSERACT_LANGUAGES = {'es': 'spa', 'en': 'eng'}
+# Segmentación de Tesseract: una columna de texto de tamaños variables (recibos)
+TESSERACT_PSM = '4'
+
+
+class OCREngineUnavailable(Exception):
+    """El motor no está instalado o ha fallado al reconocer"""
+
+
+class EasyOCREngine:
+    name = 'easyocr'
+
+    def available(self):
+        return True
+
+    def readtext(self, images, trace=None):
+        results, via = service.readtext(images, trace)
+        logger.debug('EasyOCR', extra={'via': via, 'pages': len(images)})
+        return results
+
+
+class TesseractEngine:
+    name = 'tesseract'
+
+    def __init__(self, command=None):
+        self.command = command or settings.OCR_TESSERACT_CMD
+
+    def available(self):
+        return shutil.which(self.command) is not None
+
+    def languages(self):
+        return '+'.join(TESSERACT_LANGUAGES.get(language, language) for language in settings.OCR_LANGUAGES)
+
+    def readtext(self, images, trace=None):
+        if not self.available():
+            raise OCREngineUnavailable(f'No se encuentra {self.command}')
+        return [self._page(image) for image in images]
+
+    def _page(self, image):
+        # PGM/PPM por stdin: sin comprimir ni pasar por disco
+        image = np.ascontiguousarray(image, dtype=np.uint8)
+        magic = b'P5' if image.ndim == 2 else b'P6'
+        data = b'%s\n%d %d\n255\n' % (magic, image.shape[1], image.shape[0]) + image.tobytes()
+        try:
+            completed = subprocess.run(
+                [self.command, 'stdin', 'stdout', '-l', self.languages(), '--psm', TESSERACT_PSM, 'tsv'],
+                input=data, capture_output=True, timeout=settings.OCR_SERVICE_TIMEOUT, check=True,
+                env={**os.environ, 'OMP_THREAD_LIMIT': str(settings.OCR_THREADS)},
+            )
+        except (OSError, subprocess.SubprocessError) as e:
+            raise OCREngineUnavailable(f'Tesseract ha fallado: {e}') from e
+        return parse_tsv(completed.stdout.decode('utf-8', 'replace'))
+
+
+def parse_tsv(tsv):
+    """Palabras de la salida TSV de Tesseract en el formato de readtext"""
+    results = []
+    lines = tsv.splitlines()
+    for line in lines[1:]:  # Cabecera
+        fields = line.split('\t')
+        if len(fields) < 12 or fields[0] != '5' or not fields[11].strip():
+            continue  # Solo el nivel palabra (5) con texto
+        left, top, width, height = (int(value) for value in fields[6:10])
+        confidence = float(fields[10])
+        if confidence < 0:
+            continue
+        box = [[left, top], [left + width, top], [left + width, top + height], [left, top + height]]
+        results.append([box, fields[11], confidence / 100])
+    return results
+
+
+ENGINES = {engine.name: engine for engine in (EasyOCREngine, TesseractEngine)}
+
+
+def get_engine(name):
+    try:
+        return ENGINES[name]()
+    except KeyError:
+        raise ValueError(f'Motor OCR desconocido: {name}')
+
+
+def mean_confidence(results):
+    return float(np.mean([confidence for _, _, confidence in results])) if results else 0.0
+
+
+def _run(engine, images, trace):
+    start = time.perf_counter()
+    results = engine.readtext(images, trace)
+    metrics.observe(f'ocr.engine.{engine.name}.page_ms', (time.perf_counter() - start) * 1000 / max(len(images), 1))
+    return results
+
+
+def readtext(images, mode=None, trace=None):
+    """(resultados de cada imagen, motor que dio cada página) según el modo"""
+    mode = mode or settings.OCR_MODE
+    if mode not in MODES:
+        raise ValueError(f'Modo OCR desconocido: {mode}')
+    fast, accurate = get_engine(settings.OCR_FAST_ENGINE), get_engine(settings.OCR_ACCURATE_ENGINE)
+    if mode == 'accurate':
+        return _run(accurate, images, trace), [accurate.name] * len(images)
+
+    # Sin el motor rápido, fast y auto usan el preciso: mejor lento que un recibo vacío
+    try:
+        results = _run(fast, images, trace)
+    except OCREngineUnavailable as e:
+        logger.warning('Motor rápido no disponible, se usa el preciso: %s', e)
+        return _run(accurate, images, trace), [accurate.name] * len(images)
+    names = [fast.name] * len(images)
+    if mode == 'fast':
+        return results, names
+    # Solo las páginas dudosas pasan por el motor preciso
+    escalate = [i for i, page in enumerate(results) if mean_confidence(page) < settings.OCR_ESCALATE_CONFIDENCE]
+    if escalate:
+        logger.info('Páginas con poca confianza, se repiten con el motor preciso', extra={
+            'pages': escalate, 'confidence': [round(mean_confidence(results[i]), 3) for i in escalate],
+        })
+        for i, page in zip(escalate, _run(accurate, [images[i] for i in escalate], trace)):
+            results[i], names[i] = page, accurate.name
+    metrics.observe('ocr.engine.escalated_fraction', len(escalate) / max(len(images), 1))
+    return results, names
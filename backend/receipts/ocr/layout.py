@@ -0,0 +1,62 @@
+# layout.py - Estructura de líneas a partir de las cajas del OCR
+#
+# Las cajas horizontales de EasyOCR son [x_min, x_max, y_min, y_max]. Dos
+# cajas están en la misma línea si sus líneas base (y_max) están a menos de
+# LINE_TOLERANCE veces la altura típica de una caja: en un recibo la
+# descripción, la cantidad y el precio de un producto comparten línea base
+# aunque tengan distinto tamaño o grosor de letra.
+#
+# ``assemble_lines`` reconstruye así las líneas del recibo a partir de los
+# resultados de readtext (ordenadas de izquierda a derecha y con la confianza
+# de cada token), que es lo que esperan las expresiones del parser.
+
+import numpy as np
+
+LINE_TOLERANCE = 0.5
+
+
+def cluster_lines(boxes):
+    """Número de línea (de arriba abajo) de cada caja [x_min, x_max, y_min, y_max]"""
+    boxes = np.asarray(boxes, dtype=np.float64).reshape(-1, 4)
+    if not len(boxes):
+        return np.empty(0, dtype=np.int64)
+    baselines = boxes[:, 3]
+    tolerance = LINE_TOLERANCE * np.median(boxes[:, 3] - boxes[:, 2])
+    order = np.argsort(baselines, kind='stable')
+    # Nueva línea donde el salto entre líneas base consecutivas supera la tolerancia
+    breaks = np.diff(baselines[order]) > tolerance
+    labels = np.empty(len(boxes), dtype=np.int64)
+    labels[order] = np.concatenate([[0], np.cumsum(breaks)])
+    return labels
+
+
+def line_heads(boxes, labels):
+    """Índice de la caja más a la izquierda de cada línea, por número de línea"""
+    boxes = np.asarray(boxes, dtype=np.float64).reshape(-1, 4)
+    order = np.lexsort((boxes[:, 0], labels))
+    first = np.concatenate([[True], labels[order][1:] != labels[order][:-1]]) if len(order) else order
+    return order[first]
+
+
+def boxes_from_results(results):
+    """[x_min, x_max, y_min, y_max] de cada resultado de readtext (cajas de 4 puntos)"""
+    points = np.array([box for box, _, _ in results], dtype=np.float64).reshape(-1, 4, 2)
+    return np.stack([
+        points[:, :, 0].min(axis=1), points[:, :, 0].max(axis=1),
+        points[:, :, 1].min(axis=1), points[:, :, 1].max(axis=1),
+    ], axis=1)
+
+
+def assemble_lines(results, min_confidence=0.0):
+    """Líneas de arriba abajo, cada una con sus tokens de izquierda a derecha: [[(texto, confianza), ...]]
+
+    Se descartan los tokens con confianza <= ``min_confidence``.
+    """
+    results = [result for result in results if result[2] > min_confidence]
+    if not results:
+        return []
+    boxes = boxes_from_results(results)
+    labels = cluster_lines(boxes)
+    order = np.lexsort((boxes[:, 0], labels))
+    starts = np.flatnonzero(np.diff(labels[order])) + 1
+    return [[(results[i][1], float(results[i][2])) for i in line] for line in np.split(order, starts)]
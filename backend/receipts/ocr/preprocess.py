@@ -0,0 +1,165 @@
+# preprocess.py - Preparación de las páginas antes del reconocimiento
+#
+# Los recibos son tiras estrechas casi en blanco y negro: una página
+# rasterizada a 200 DPI en RGB es sobre todo margen, y el detector de EasyOCR
+# la reduce igualmente si pasa de su canvas_size. ``preprocess`` entrega al
+# lector la imagen más pequeña que conserva el texto legible:
+#
+#   1. escala de grises (un canal en lugar de tres);
+#   2. umbral de Otsu para separar tinta y fondo, y recorte a la caja de la
+#      tinta con un pequeño margen;
+#   3. enderezado: el ángulo que maximiza la varianza del perfil horizontal
+#      de la tinta (las líneas de texto quedan horizontales);
+#   4. contraste: estiramiento lineal entre los percentiles de tinta y fondo
+#      (del mismo histograma muestreado que el umbral);
+#   5. reducción hasta que la altura típica de una línea de texto sea
+#      OCR_TARGET_TEXT_HEIGHT píxeles (nunca se amplía).
+#
+# Todo son operaciones vectorizadas de NumPy salvo la rotación y el
+# redimensionado, que hace PIL. Las cajas que devuelve el lector quedan en las
+# coordenadas de la imagen preprocesada.
+
+import numpy as np
+from django.conf import settings
+from PIL import Image
+
+# Margen (píxeles) alrededor de la tinta al recortar
+CROP_MARGIN = 8
+# Ángulos probados al enderezar (grados) y el mínimo que merece rotar
+MAX_SKEW = 4.0
+SKEW_STEP = 0.25
+MIN_SKEW = 0.2
+# Píxeles de tinta (muestreados) sobre los que se estima el ángulo
+SKEW_SAMPLE_POINTS = 20000
+# Líneas de texto más bajas que esto son ruido o separadores
+MIN_LINE_HEIGHT = 4
+
+
+def to_grayscale(image):
+    """Luminancia uint8 (ITU-R 601, en aritmética entera) de una imagen RGB; las grises pasan tal cual"""
+    if image.ndim == 2:
+        return image
+    gray = image[..., 0] * np.uint16(77)
+    gray += image[..., 1] * np.uint16(150)
+    gray += image[..., 2] * np.uint16(29)
+    return (gray >> 8).astype(np.uint8)
+
+
+def histogram(gray):
+    """Histograma de niveles de gris sobre una muestra (una de cada 2x2 píxeles basta)"""
+    return np.bincount(gray[::2, ::2].ravel(), minlength=256).astype(np.float64)
+
+
+def otsu_threshold(hist):
+    """Primer nivel de fondo del corte que mejor separa tinta y fondo (tinta: gris < umbral)
+
+    Con un solo nivel (página en blanco) no hay corte: 0, sin tinta.
+    """
+    levels = np.arange(256)
+    weight_dark = np.cumsum(hist)
+    weight_light = weight_dark[-1] - weight_dark
+    cumulative = np.cumsum(hist * levels)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        mean_dark = cumulative / weight_dark
+        mean_light = (cumulative[-1] - cumulative) / weight_light
+        between = weight_dark * weight_light * (mean_dark - mean_light) ** 2
+    if np.isnan(between).all():
+        return 0
+    return int(np.nanargmax(between)) + 1
+
+
+def _percentile(hist, fraction):
+    """Nivel de gris por debajo del cual queda ``fraction`` del histograma"""
+    cumulative = np.cumsum(hist)
+    return int(np.searchsorted(cumulative, fraction * cumulative[-1]))
+
+
+def content_box(mask, margin=CROP_MARGIN):
+    """(arriba, abajo, izquierda, derecha) de la tinta con margen, o None si no hay"""
+    rows = np.flatnonzero(mask.any(axis=1))
+    if not len(rows):
+        return None
+    columns = np.flatnonzero(mask.any(axis=0))
+    height, width = mask.shape
+    return (
+        max(rows[0] - margin, 0), min(rows[-1] + margin + 1, height),
+        max(columns[0] - margin, 0), min(columns[-1] + margin + 1, width),
+    )
+
+
+def estimate_skew(mask):
+    """Ángulo (grados) de las líneas de texto respecto a la horizontal
+
+    Para ángulos pequeños rotar es desplazar cada columna x·tan(a) filas: se
+    proyecta la tinta con cada ángulo candidato (un bincount por ángulo) y
+    gana el perfil más "picudo".
+    """
+    ys, xs = np.nonzero(mask)
+    if len(ys) < 100:
+        return 0.0
+    step = max(1, len(ys) // SKEW_SAMPLE_POINTS)
+    ys, xs = ys[::step], xs[::step]
+    angles = np.arange(-MAX_SKEW, MAX_SKEW + SKEW_STEP / 2, SKEW_STEP)
+    shifts = np.round(np.outer(np.tan(np.radians(angles)), xs)).astype(np.int64)
+    rows = ys[np.newaxis, :] - shifts
+    rows -= rows.min()
+    length = int(rows.max()) + 1
+    scores = [np.square(np.bincount(r, minlength=length)).sum() for r in rows]
+    return float(angles[int(np.argmax(scores))])
+
+
+def stretch_contrast(gray, hist, threshold):
+    """Tinta al negro y fondo al blanco: estiramiento lineal entre percentiles"""
+    ink, background = hist[:threshold], hist[threshold:]
+    if not ink.sum() or not background.sum():
+        return gray
+    low = _percentile(ink, 0.05)
+    high = threshold + _percentile(background, 0.5)
+    if high - low < 1:
+        return gray
+    lut = np.clip((np.arange(256) - low) * 255.0 / (high - low), 0, 255).astype(np.uint8)
+    return lut[gray]
+
+
+def line_height(mask):
+    """Altura mediana (píxeles) de las líneas de texto según el perfil horizontal"""
+    inked = np.concatenate([[False], mask.any(axis=1), [False]])
+    edges = np.flatnonzero(inked[1:] != inked[:-1])
+    heights = edges[1::2] - edges[::2]
+    heights = heights[heights >= MIN_LINE_HEIGHT]
+    return float(np.median(heights)) if len(heights) else None
+
+
+def preprocess(image, target_text_height=None):
+    """(imagen gris lista para el lector, datos del preprocesado para la traza)"""
+    target_text_height = target_text_height or settings.OCR_TARGET_TEXT_HEIGHT
+    gray = to_grayscale(np.asarray(image))
+    info = {'input_pixels': int(gray.size)}
+    hist = histogram(gray)
+    threshold = otsu_threshold(hist)
+    mask = gray < threshold
+    box = content_box(mask)
+    if box is None:
+        info['output_pixels'] = int(gray.size)
+        return gray, info  # Página en blanco
+    top, bottom, left, right = box
+    gray, mask = gray[top:bottom, left:right], mask[top:bottom, left:right]
+
+    angle = estimate_skew(mask)
+    if abs(angle) >= MIN_SKEW:
+        # Con y hacia abajo, un ángulo positivo baja a la derecha: PIL gira
+        # en sentido antihorario con ángulos positivos
+        gray = np.asarray(Image.fromarray(gray).rotate(angle, resample=Image.BILINEAR, expand=True, fillcolor=255))
+        mask = gray < threshold
+    info['skew'] = angle
+
+    gray = stretch_contrast(gray, hist, threshold)
+
+    height = line_height(mask)
+    if height and height > target_text_height:
+        scale = target_text_height / height
+        size = (max(1, round(gray.shape[1] * scale)), max(1, round(gray.shape[0] * scale)))
+        gray = np.asarray(Image.fromarray(gray).resize(size, Image.BILINEAR))
+        info['scale'] = round(scale, 3)
+    info.update(line_height=height, output_pixels=int(gray.size))
+    return np.ascontiguousarray(gray), info
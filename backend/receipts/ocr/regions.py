@@ -0,0 +1,147 @@
+# regions.py - OCR de solo las zonas del recibo que usa el parser
+#
+# La mayor parte del tiempo de OCR se iba en reconocer pies legales, desglose
+# de IVA, datos de la operación y publicidad que parse_receipt_text descarta.
+# En este modo la detección de texto corre una vez sobre toda la página y el
+# reconocimiento (la parte cara) solo sobre:
+#
+#   1. la primera caja de cada línea, por tandas de arriba abajo, para
+#      encontrar las anclas: las cabeceras de sección empiezan la línea
+#      ("DESCRIPCIÓN", "Total venta"). Tras "Total venta" no se sigue;
+#   2. el resto de cajas de la cabecera (supermercado, fecha y "Total a
+#      pagar") y de la tabla de productos, desde "Productos vendidos" /
+#      "DESCRIPCIÓN" hasta "Total venta" incluida.
+#
+# Sin anclas de la tabla (otro formato de recibo) se reconocen todas las
+# cajas: el resultado es el de la página completa sin repetir trabajo. El
+# formato de salida es el de ``reader.readtext``.
+
+import logging
+import unicodedata
+
+import numpy as np
+
+from backendgrocerylyzer import metrics
+from catalog.matching import bounded_distance
+
+from .layout import cluster_lines, line_heads
+
+logger = logging.getLogger(__name__)
+
+ITEMS_START = ('PRODUCTOS VENDIDOS', 'DESCRIPCION')
+ITEMS_END = ('TOTAL VENTA',)
+HEADER_END = ('TOTAL A PAGAR',)
+# Sin "Total a pagar", la cabecera son las primeras líneas
+HEADER_LINES = 8
+# Líneas cuya primera caja se reconoce en cada tanda al buscar las anclas
+HEAD_CHUNK = 12
+# Errores de OCR admitidos al comparar el principio de una línea con un ancla
+ANCHOR_EDITS = 2
+
+
+def _normalize(text):
+    text = unicodedata.normalize('NFKD', text).encode('ascii', 'ignore').decode()
+    return ' '.join(text.upper().split())
+
+
+def matches_anchor(text, anchors):
+    """True si ``text`` empieza por alguna de las anclas (con hasta ANCHOR_EDITS errores)"""
+    text = _normalize(text)
+    return any(bounded_distance(text[:len(anchor)], anchor, ANCHOR_EDITS) is not None for anchor in anchors)
+
+
+def _first_line(head_texts, anchors, start=0):
+    for line in range(start, len(head_texts)):
+        if matches_anchor(head_texts[line], anchors):
+            return line
+    return None
+
+
+def select_lines(head_texts):
+    """Líneas que hay que reconocer enteras, o None si no se encuentra la tabla de productos"""
+    items_start = _first_line(head_texts, ITEMS_START)
+    if items_start is None:
+        return None
+    items_end = _first_line(head_texts, ITEMS_END, items_start + 1)
+    if items_end is None:
+        return None
+    header_end = _first_line(head_texts, HEADER_END)
+    if header_end is None or header_end > items_start:
+        header_end = min(HEADER_LINES, items_start) - 1
+    return set(range(header_end + 1)) | set(range(items_start, items_end + 1))
+
+
+def _key(box, shape):
+    """Clave de una caja tal como la devuelve recognize (recortada a la imagen)"""
+    height, width = shape
+    return (max(0, box[0]), max(0, box[2]), min(box[1], width), min(box[3], height))
+
+
+def _recognize(reader, grey, boxes, batch_size=1):
+    """{clave de caja: (caja, texto, confianza)} de las cajas horizontales ``boxes``"""
+    if not boxes:
+        return {}
+    results = reader.recognize(grey, horizontal_list=boxes, free_list=[], batch_size=batch_size, reformat=False)
+    return {
+        (box[0][0], box[0][1], box[2][0], box[2][1]): (box, text, confidence)
+        for box, text, confidence in results
+    }
+
+
+def recognize_page(reader, grey, horizontal, free, batch_size=1):
+    """Resultados de una página ya detectada reconociendo solo las zonas del parser
+
+    ``batch_size`` es el número de cajas que pasan a la vez por la red de reconocimiento.
+    """
+    if not horizontal:
+        if not free:
+            return []
+        return reader.recognize(grey, horizontal_list=[], free_list=free, batch_size=batch_size, reformat=False)
+    labels = cluster_lines(horizontal)
+    heads = line_heads(horizontal, labels)
+    # Primeras cajas por tandas de arriba abajo, hasta encontrar el final de la tabla
+    recognized = {}
+    head_texts = []
+    lines = None
+    for start in range(0, len(heads), HEAD_CHUNK):
+        chunk = heads[start:start + HEAD_CHUNK]
+        recognized.update(_recognize(reader, grey, [horizontal[i] for i in chunk], batch_size))
+        for i in chunk:
+            result = recognized.get(_key(horizontal[i], grey.shape))
+            head_texts.append(result[1] if result else '')
+        lines = select_lines(head_texts)
+        if lines is not None:
+            break
+
+    if lines is None:
+        logger.debug('Anclas de la tabla no encontradas: OCR de la página completa')
+        wanted = np.ones(len(horizontal), dtype=bool)
+    else:
+        wanted = np.isin(labels, list(lines))
+    wanted[heads[:len(head_texts)]] = False  # Ya reconocidas
+    recognized.update(_recognize(reader, grey, [box for box, keep in zip(horizontal, wanted) if keep], batch_size))
+
+    # Las cajas giradas (free_list) solo fuera del modo por zonas
+    extra = []
+    if lines is None and free:
+        extra = reader.recognize(grey, horizontal_list=[], free_list=free, batch_size=batch_size, reformat=False)
+    metrics.observe('ocr.regions.recognized_fraction', len(recognized) / len(horizontal))
+
+    keys = [_key(box, grey.shape) for box in horizontal]
+    order = np.lexsort((np.array([box[0] for box in horizontal]), labels))
+    if lines is not None:
+        # Fuera de las zonas solo se reconocieron las primeras cajas (para buscar las anclas)
+        order = [i for i in order if labels[i] in lines]
+    results = [recognized[keys[i]] for i in order if keys[i] in recognized]
+    return results + list(extra)
+
+
+def readtext(reader, images, batch_size=1):
+    """Como ``reader.readtext`` para varias imágenes del mismo tamaño, con detección en lote"""
+    from easyocr.utils import reformat_input_batched
+    color, grey = reformat_input_batched(list(images))
+    horizontal_agg, free_agg = reader.detect(color, reformat=False)
+    return [
+        recognize_page(reader, page_grey, horizontal, free, batch_size)
+        for page_grey, horizontal, free in zip(grey, horizontal_agg, free_agg)
+    ]
@@ -0,0 +1,378 @@
+# service.py - Servicio OCR de la máquina y su cliente
+#
+# Cada worker web que cargaba su propio easyocr.Reader ocupaba gigas de RAM y
+# reconocía las páginas de una en una. El servicio (manage.py ocr_service) es
+# un único proceso que carga los modelos una vez y escucha en un socket UNIX
+# local: las páginas que llegan de todos los workers se juntan en micro-lotes
+# (hasta OCR_SERVICE_BATCH_SIZE páginas, esperando como mucho
+# OCR_SERVICE_MAX_WAIT_MS desde la primera) y la detección corre en una sola
+# pasada con ``readtext_batched``. readtext_batched exige páginas del mismo
+# tamaño: las de tamaño parecido se rellenan en blanco hasta el mayor (las
+# cajas no cambian porque el relleno va a la derecha y abajo).
+#
+# Protocolo (un documento por conexión): cabecera JSON precedida de su
+# longitud (4 bytes) y a continuación los píxeles uint8 de cada página. La
+# respuesta es una cabecera JSON con los resultados de cada página
+# [[caja, texto, confianza], ...] o {'error': ...}.
+#
+# ``readtext`` es lo que usa la ingesta: pide las páginas al servicio con
+# timeouts. Si el servicio no está arrancado (no hay socket o rechaza la
+# conexión) reconoce en el propio proceso, salvo con OCR_LOCAL_FALLBACK
+# desactivado (para no cargar los modelos en cada worker cuando el servicio
+# siempre está arrancado). Un servicio lento o que responde con error no
+# provoca el fallback.
+
+import json
+import logging
+import os
+import queue
+import socket
+import socketserver
+import struct
+import threading
+import time
+from concurrent.futures import Future, TimeoutError as FutureTimeout
+
+import numpy as np
+from django.conf import settings
+
+from backendgrocerylyzer import metrics
+from ..pipeline import STAGE_OCR_INIT
+from . import regions
+
+logger = logging.getLogger(__name__)
+
+_HEADER = struct.Struct('>I')
+# Relleno admitido al juntar páginas de distinto tamaño en un lote
+PAD_TOLERANCE = 0.25
+# Tras un fallo de conexión no se vuelve a intentar hasta pasado este tiempo
+RETRY_AFTER_SECONDS = 5
+
+
+class OCRServiceError(Exception):
+    """El servicio OCR no ha respondido a tiempo o ha devuelto un error"""
+
+
+class OCRServiceUnavailable(OCRServiceError):
+    """No hay servicio OCR escuchando en el socket (no existe o rechaza la conexión)"""
+
+
+# Lector del proceso
+
+_reader = None
+_reader_lock = threading.Lock()
+
+
+def set_threads(threads):
+    """Hilos de torch para la inferencia (intra-op); los inter-op se quedan en 1
+
+    Por defecto torch abre un hilo por núcleo en cada proceso: con varios
+    workers haciendo OCR a la vez la máquina se sobresuscribe.
+    """
+    import torch
+    torch.set_num_threads(threads)
+    try:
+        torch.set_num_interop_threads(1)
+    except RuntimeError:
+        pass  # Solo se puede fijar antes del primer trabajo en paralelo
+
+
+def load_reader(quantize=None, recog_network=None):
+    """easyocr.Reader nuevo en CPU con las opciones de inferencia (por defecto las de settings)"""
+    import easyocr
+    return easyocr.Reader(
+        settings.OCR_LANGUAGES, gpu=False,
+        quantize=settings.OCR_QUANTIZE if quantize is None else quantize,
+        recog_network=recog_network or settings.OCR_RECOG_NETWORK,
+    )
+
+
+def get_reader(threads=None):
+    """easyocr.Reader del proceso, cargado la primera vez que se pide
+
+    ``threads`` (por defecto OCR_THREADS) fija los hilos de torch del proceso al cargarlo.
+    """
+    global _reader
+    if _reader is None:
+        with _reader_lock:
+            if _reader is None:
+                set_threads(threads or settings.OCR_THREADS)
+                start = time.perf_counter()
+                _reader = load_reader()
+                metrics.observe('ocr.reader.load_ms', (time.perf_counter() - start) * 1000)
+                logger.info('Modelos OCR cargados', extra={
+                    'languages': settings.OCR_LANGUAGES, 'threads': threads or settings.OCR_THREADS,
+                    'quantize': settings.OCR_QUANTIZE, 'recog_network': settings.OCR_RECOG_NETWORK,
+                })
+    return _reader
+
+
+def reader_loaded():
+    return _reader is not None
+
+
+def recognize_batch(reader, images, batch_size=None):
+    """Resultados (formato readtext) de imágenes del mismo tamaño, con la detección en lote
+
+    Con OCR_ITEM_REGIONS solo se reconocen la cabecera y la tabla de productos.
+    ``batch_size`` (por defecto OCR_RECOG_BATCH_SIZE) son las cajas por pasada
+    de la red de reconocimiento.
+    """
+    batch_size = batch_size or settings.OCR_RECOG_BATCH_SIZE
+    if settings.OCR_ITEM_REGIONS:
+        return regions.readtext(reader, images, batch_size)
+    if len(images) == 1:
+        return [reader.readtext(images[0], batch_size=batch_size)]
+    # Como lista: reformat_input_batched solo trata como lote los arrays 4-D, y
+    # las páginas preprocesadas son grises (un array (N, H, W) lo rompe)
+    return reader.readtext_batched(list(images), batch_size=batch_size)
+
+
+def _serialize(results):
+    return [
+        [[[float(x), float(y)] for x, y in box], text, float(confidence)]
+        for box, text, confidence in results
+    ]
+
+
+# Framing
+
+def _recv_exactly(sock, size):
+    buffer = bytearray(size)
+    view = memoryview(buffer)
+    received = 0
+    while received < size:
+        count = sock.recv_into(view[received:], size - received)
+        if not count:
+            raise ConnectionError('Conexión cerrada a mitad de mensaje')
+        received += count
+    return buffer
+
+
+def _send_message(sock, header, payloads=()):
+    encoded = json.dumps(header).encode()
+    sock.sendall(_HEADER.pack(len(encoded)) + encoded)
+    for payload in payloads:
+        sock.sendall(payload)
+
+
+def _recv_header(sock):
+    (size,) = _HEADER.unpack(_recv_exactly(sock, _HEADER.size))
+    return json.loads(bytes(_recv_exactly(sock, size)))
+
+
+def _encode_pages(images):
+    pages, payloads = [], []
+    for image in images:
+        image = np.ascontiguousarray(image, dtype=np.uint8)
+        pages.append({'shape': list(image.shape)})
+        payloads.append(memoryview(image).cast('B'))
+    return pages, payloads
+
+
+def _decode_pages(sock, pages):
+    images = []
+    for page in pages:
+        shape = tuple(page['shape'])
+        data = _recv_exactly(sock, int(np.prod(shape)))
+        images.append(np.frombuffer(data, dtype=np.uint8).reshape(shape))
+    return images
+
+
+# Servidor
+
+class _Page:
+    __slots__ = ('image', 'future', 'enqueued')
+
+    def __init__(self, image):
+        self.image = image
+        self.future = Future()
+        self.enqueued = time.perf_counter()
+
+
+def _pad(images):
+    """Rellena en blanco (abajo y a la derecha) hasta el tamaño del mayor"""
+    height = max(image.shape[0] for image in images)
+    width = max(image.shape[1] for image in images)
+    batch = np.full((len(images), height, width) + images[0].shape[2:], 255, dtype=np.uint8)
+    for i, image in enumerate(images):
+        batch[i, :image.shape[0], :image.shape[1]] = image
+    return batch
+
+
+def group_by_size(pages, tolerance=PAD_TOLERANCE):
+    """Grupos de páginas que se pueden rellenar al mismo tamaño sin desperdiciar más de ``tolerance``"""
+    groups = []
+    for page in sorted(pages, key=lambda p: (p.image.ndim, p.image.shape[:2])):
+        group = groups[-1] if groups else None
+        if group and group[0].image.ndim == page.image.ndim:
+            candidate = group + [page]
+            area = sum(p.image.shape[0] * p.image.shape[1] for p in candidate)
+            padded = (
+                len(candidate)
+                * max(p.image.shape[0] for p in candidate)
+                * max(p.image.shape[1] for p in candidate)
+            )
+            if padded <= (1 + tolerance) * area:
+                group.append(page)
+                continue
+        groups.append([page])
+    return groups
+
+
+class Batcher:
+    """Hilo que junta las páginas pendientes en micro-lotes para el lector"""
+
+    def __init__(self, reader, batch_size, max_wait_ms):
+        self.reader = reader
+        self.batch_size = batch_size
+        self.max_wait = max_wait_ms / 1000
+        self._queue = queue.Queue()
+        self._thread = threading.Thread(target=self._run, name='ocr-batcher', daemon=True)
+        self._thread.start()
+
+    def submit(self, images):
+        pages = [_Page(image) for image in images]
+        for page in pages:
+            self._queue.put(page)
+        return [page.future for page in pages]
+
+    def _run(self):
+        while True:
+            batch = [self._queue.get()]
+            # La primera página espera como mucho max_wait a que lleguen más
+            deadline = batch[0].enqueued + self.max_wait
+            while len(batch) < self.batch_size:
+                remaining = deadline - time.perf_counter()
+                try:
+                    batch.append(self._queue.get(timeout=remaining) if remaining > 0 else self._queue.get_nowait())
+                except queue.Empty:
+                    break
+            # Las páginas de peticiones abandonadas (timeout) no se reconocen
+            batch = [page for page in batch if page.future.set_running_or_notify_cancel()]
+            if not batch:
+                continue
+            started = time.perf_counter()
+            for page in batch:
+                metrics.observe('ocr.service.queue_wait_ms', (started - page.enqueued) * 1000)
+            for group in group_by_size(batch):
+                self._recognize(group)
+            metrics.observe('ocr.service.batch_pages', len(batch))
+            metrics.observe('ocr.service.batch_ms', (time.perf_counter() - started) * 1000)
+
+    def _recognize(self, group):
+        try:
+            results = recognize_batch(self.reader, _pad([page.image for page in group]))
+        except Exception as e:
+            logger.exception('Error en el lote OCR', extra={'pages': len(group)})
+            for page in group:
+                page.future.set_exception(e)
+            return
+        for page, page_results in zip(group, results):
+            page.future.set_result(_serialize(page_results))
+
+
+class _Handler(socketserver.BaseRequestHandler):
+    def handle(self):
+        sock = self.request
+        sock.settimeout(self.server.timeout_seconds)
+        try:
+            header = _recv_header(sock)
+        except ConnectionError:
+            return  # Sondeo de service_running: conecta y cierra sin enviar nada
+        try:
+            futures = []
+            images = _decode_pages(sock, header['pages'])
+            futures = self.server.batcher.submit(images)
+            deadline = time.monotonic() + self.server.timeout_seconds
+            pages = [future.result(timeout=max(0, deadline - time.monotonic())) for future in futures]
+            _send_message(sock, {'pages': pages})
+        except (ConnectionError, socket.timeout, FutureTimeout) as e:
+            logger.warning('Petición OCR abandonada: %s', e)
+            for future in futures:
+                future.cancel()  # Las que aún no han entrado en un lote se descartan
+        except Exception as e:
+            logger.exception('Error atendiendo petición OCR')
+            try:
+                _send_message(sock, {'error': str(e)})
+            except OSError:
+                pass
+
+
+class OCRServer(socketserver.ThreadingUnixStreamServer):
+    """Servidor del socket UNIX: un hilo por conexión, un único lector compartido"""
+
+    daemon_threads = True
+
+    def __init__(self, path, reader, batch_size, max_wait_ms, timeout_seconds):
+        self.batcher = Batcher(reader, batch_size, max_wait_ms)
+        self.timeout_seconds = timeout_seconds
+        super().__init__(path, _Handler)
+        os.chmod(path, 0o660)
+
+
+def service_running(path):
+    """True si hay un servicio aceptando conexiones en ``path``"""
+    try:
+        with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as sock:
+            sock.settimeout(settings.OCR_SERVICE_CONNECT_TIMEOUT)
+            sock.connect(path)
+        return True
+    except OSError:
+        return False
+
+
+# Cliente
+
+_down_until = 0.0
+
+
+def request_pages(images, path=None, timeout=None):
+    """Resultados del servicio para cada imagen
+
+    OCRServiceUnavailable si no hay servicio escuchando; OCRServiceError si no
+    responde a tiempo o responde con un error (el servicio sigue ahí).
+    """
+    global _down_until
+    path = path or settings.OCR_SERVICE_SOCKET
+    if time.monotonic() < _down_until:
+        raise OCRServiceUnavailable('Servicio OCR marcado como caído')
+    pages, payloads = _encode_pages(images)
+    with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as sock:
+        sock.settimeout(settings.OCR_SERVICE_CONNECT_TIMEOUT)
+        try:
+            sock.connect(path)
+        except (FileNotFoundError, ConnectionRefusedError) as e:
+            _down_until = time.monotonic() + RETRY_AFTER_SECONDS
+            raise OCRServiceUnavailable(str(e)) from e
+        except OSError as e:
+            raise OCRServiceError(str(e)) from e  # Cola de conexiones llena: ocupado, no caído
+        try:
+            sock.settimeout(timeout or settings.OCR_SERVICE_TIMEOUT)
+            _send_message(sock, {'pages': pages}, payloads)
+            response = _recv_header(sock)
+        except (OSError, ValueError) as e:
+            raise OCRServiceError(str(e)) from e
+    if 'error' in response:
+        raise OCRServiceError(response['error'])
+    return response['pages']
+
+
+def readtext(images, trace=None):
+    """(resultados de cada imagen, 'service' | 'local')
+
+    Sin servicio arrancado reconoce en el propio proceso (salvo con
+    OCR_LOCAL_FALLBACK desactivado). Los timeouts y errores del servicio se propagan (OCRServiceError).
+    """
+    if settings.OCR_SERVICE_ENABLED:
+        try:
+            return request_pages(images), 'service'
+        except OCRServiceUnavailable as e:
+            if not settings.OCR_LOCAL_FALLBACK:
+                raise
+            logger.warning('Servicio OCR no disponible, OCR en el proceso: %s', e)
+    if trace is not None and not reader_loaded():
+        with trace.span(STAGE_OCR_INIT):
+            get_reader()
+    reader = get_reader()
+    return [_serialize(recognize_batch(reader, [image])[0]) for image in images], 'local'
@@ -0,0 +1,75 @@
+# pipeline.py - Trazas por etapa del procesamiento de recibos
+#
+# Cada subida crea un IngestionTrace y cada etapa (escritura temporal,
+# pdfplumber, rasterizado, preprocesado, OCR, parseo, escritura en BD) se mide con
+# ``trace.span(...)``. Los spans se registran en el log, se exportan a
+# backendgrocerylyzer.metrics y pueden adjuntarse a la respuesta del upload.
+
+import logging
+import time
+from contextlib import contextmanager
+
+from backendgrocerylyzer import metrics
+
+logger = logging.getLogger(__name__)
+
+# Nombres de etapa del pipeline de ingesta
+STAGE_TEMP_WRITE = 'temp_write'
+STAGE_PDFPLUMBER = 'pdfplumber'
+STAGE_RASTERIZE = 'rasterize'
+STAGE_PREPROCESS = 'preprocess'
+STAGE_OCR_INIT = 'ocr_init'
+STAGE_OCR = 'ocr'
+STAGE_PARSE = 'parse'
+STAGE_DB_WRITE = 'db_write'
+
+
+class IngestionTrace:
+    """Spans con tiempos de cada etapa de una subida"""
+
+    def __init__(self):
+        self.spans = []
+        self._started = time.perf_counter()
+
+    @contextmanager
+    def span(self, stage, **fields):
+        """Mide una etapa; el bloque puede añadir campos al dict devuelto"""
+        start = time.perf_counter()
+        try:
+            yield fields
+        finally:
+            duration_ms = round((time.perf_counter() - start) * 1000, 2)
+            record = {'stage': stage, 'duration_ms': duration_ms, **fields}
+            self.spans.append(record)
+            metrics.observe('ingestion.stage.duration_ms', duration_ms, stage=stage)
+            logger.debug('stage %s', stage, extra=record)
+
+    def total_ms(self):
+        return round((time.perf_counter() - self._started) * 1000, 2)
+
+    def as_dict(self):
+        return {
+            'total_ms': self.total_ms(),
+            'stages': self.spans,
+        }
+
+    def finish(self, **fields):
+        """Cierra la traza: exporta el total y lo registra a nivel INFO"""
+        total_ms = self.total_ms()
+        metrics.observe('ingestion.total.duration_ms', total_ms)
+        logger.info(
+            'Ingesta completada',
+            extra={'total_ms': total_ms, 'stages': {s['stage']: s['duration_ms'] for s in self.spans}, **fields}
+        )
+
+
+def confidence_stats(confidences, threshold=0.5):
+    """Estadísticas de confianza del OCR para adjuntar a un span"""
+    if not confidences:
+        return {'boxes': 0}
+    return {
+        'boxes': len(confidences),
+        'confidence_mean': round(sum(confidences) / len(confidences), 3),
+        'confidence_min': round(min(confidences), 3),
+        'low_confidence_boxes': sum(1 for c in confidences if c <= threshold),
+    }
@@ -1,3 +1,302 @@
-from django.test import TestCase
+import json
+import random
+from datetime import date, datetime
+from types import SimpleNamespace
+from unittest import mock
+
+import numpy as np
+from django.contrib.auth.models import User
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.test import SimpleTestCase, TestCase, override_settings
+from django.urls import reverse
+
+from receipts.ingestion import OCR_MIN_CONFIDENCE, page_needs_ocr, parse_receipt_text
+from receipts.management.commands.benchmark_imports import HEAVY_MODULES, STARTUP, _importtime
+from receipts.models import Product, Receipt
+from receipts.ocr import engines
+from receipts.ocr.dpi import plan_page, plan_runs
+from receipts.ocr.preprocess import preprocess
+from receipts.ocr.regions import ITEMS_END, ITEMS_START, matches_anchor, recognize_page, select_lines
+from receipts.ocr.layout import assemble_lines
+
+# Recibo de DIA por líneas, cada una con sus tokens tal como los separa el OCR
+DIA_LINES = [
+    ['Compra en AV RAMON Y CAJAL 12'],
+    ['23/06/2025 20:17', 'Nº de Tienda 2344'],
+    ['Total a pagar', '13,55 €'],
+    ['Productos vendidos por Dia'],
+    ['DESCRIPCIÓN', 'CANTIDAD', 'PRECIO KG', 'TOTAL'],
+    ['BURGER MEAT VAC/CERD', '1 ud', '7,79 €', 'B'],
+    ['PECHUGA ENTERA', '0,690 kg', '6,99 €', '4,82 €', 'B'],
+    ['TOMATE FRITO 0% AZU.', '2 ud', '0,79 €', '1,58 €', 'A'],
+    ['TORTILLA INTEGR. DIA', '-1,20 €'],
+    ['Total venta Dia', '13,55 €'],
+    ['Desglose de IVA'],
+]
+
+
+def readtext_results(lines, seed=1):
+    """Resultados sintéticos de readtext: cajas con algo de ruido y en orden aleatorio"""
+    rng = random.Random(seed)
+    results = []
+    for row, tokens in enumerate(lines):
+        for column, text in enumerate(tokens):
+            x, y, height = 20 + column * 300, 100 * row + rng.randint(-4, 4), 30 + rng.randint(-3, 6)
+            box = [[x, y], [x + len(text) * 10, y], [x + len(text) * 10, y + height], [x, y + height]]
+            results.append([box, text, 0.6 + 0.4 * rng.random()])
+    rng.shuffle(results)
+    return results
+
+
+class AssembleLinesTests(SimpleTestCase):
+    def test_rebuilds_lines_left_to_right(self):
+        lines = assemble_lines(readtext_results(DIA_LINES), OCR_MIN_CONFIDENCE)
+        self.assertEqual([[text for text, _ in line] for line in lines], DIA_LINES)
+
+    def test_drops_low_confidence_tokens(self):
+        results = readtext_results(DIA_LINES)
+        results.append([[[900, 500], [950, 500], [950, 530], [900, 530]], 'ruido', 0.2])
+        tokens = [text for line in assemble_lines(results, OCR_MIN_CONFIDENCE) for text, _ in line]
+        self.assertNotIn('ruido', tokens)
+
+
+class ParseReceiptTextTests(SimpleTestCase):
+    def parse(self, lines):
+        return parse_receipt_text('\n'.join(' '.join(tokens) for tokens in lines))
+
+    def test_dia_receipt(self):
+        data = self.parse(DIA_LINES)
+        self.assertEqual(data['supermarket'], 'Dia')
+        self.assertEqual(data['datetime'], datetime(2025, 6, 23, 20, 17))
+        self.assertEqual(data['total_amount'], 13.55)
+        self.assertEqual([item['name'] for item in data['items']], [
+            'BURGER MEAT VAC/CERD', 'PECHUGA ENTERA', 'TOMATE FRITO 0% AZU.',
+        ])
+
+    def test_trailing_vat_letter_and_missing_total(self):
+        burger, _, tomate = self.parse(DIA_LINES)['items']
+        self.assertEqual((burger['quantity'], burger['unit_price'], burger['total_price']), (1, 7.79, 7.79))
+        self.assertEqual((tomate['quantity'], tomate['unit_price'], tomate['total_price']), (2, 0.79, 1.58))
+        self.assertFalse(burger['weighed'])
+
+    def test_weighed_item(self):
+        pechuga = self.parse(DIA_LINES)['items'][1]
+        # Una unidad de su importe, marcada para no compararla como precio unitario
+        self.assertEqual((pechuga['quantity'], pechuga['unit_price'], pechuga['total_price']), (1, 4.82, 4.82))
+        self.assertTrue(pechuga['weighed'])
+
+    def test_ocr_lines(self):
+        lines = assemble_lines(readtext_results(DIA_LINES, seed=7), OCR_MIN_CONFIDENCE)
+        data = parse_receipt_text('\n'.join(' '.join(text for text, _ in line) for line in lines))
+        self.assertEqual(data['items'], self.parse(DIA_LINES)['items'])
+
+
+@override_settings(OCR_FAST_ENGINE='tesseract', OCR_ACCURATE_ENGINE='easyocr',
+                   OCR_TESSERACT_CMD='/nonexistent/tesseract')
+def fake_page(number=1, width=595, height=842, images=()):
+    """Página con los atributos de pdfplumber que usan el enrutado y el plan de DPI"""
+    return SimpleNamespace(page_number=number, width=width, height=height, images=list(images))
+
+
+def page_image(x0, top, x1, bottom, srcsize=(1000, 1000)):
+    return {'x0': x0, 'top': top, 'x1': x1, 'bottom': bottom, 'srcsize': srcsize}
+
+
+class PageNeedsOCRTests(SimpleTestCase):
+    def test_text_layer_page(self):
+        text = 'Compra en AV RAMON Y CAJAL 12\nTotal a pagar 13,55 €'
+        self.assertFalse(page_needs_ocr(fake_page(), text))
+        # Un logo pequeño no convierte la página en escaneo
+        self.assertFalse(page_needs_ocr(fake_page(images=[page_image(0, 0, 100, 50)]), 'Dia'))
+        self.assertFalse(page_needs_ocr(fake_page(), 'Dia'))
+
+    def test_scanned_page(self):
+        self.assertTrue(page_needs_ocr(fake_page(), ''))
+        self.assertTrue(page_needs_ocr(fake_page(), '  \n '))
+        # Escaneo con un sello o cabecera con capa de texto
+        self.assertTrue(page_needs_ocr(fake_page(images=[page_image(0, 0, 595, 842)]), 'Copia'))
+
+
+def striped_page(line_height, lines=10, gap=30, ink=0):
+    """Página RGB de 1200x900 con ``lines`` franjas de tinta de 400 px de ancho"""
+    page = np.full((1200, 900, 3), 255, dtype=np.uint8)
+    for i in range(lines):
+        top = 100 + i * (line_height + gap)
+        page[top:top + line_height, 200:600] = ink
+    return page
+
+
+@override_settings(OCR_TARGET_TEXT_HEIGHT=28, OCR_TEXT_LINE_PT=10, OCR_MIN_DPI=100, OCR_MAX_DPI=300,
+                   OCR_MAX_PAGE_PIXELS=12_000_000)
+class PlanPageTests(SimpleTestCase):
+    def test_limits(self):
+        # Texto: 28 px por línea de 10 pt -> 201 DPI
+        self.assertEqual((plan_page(fake_page())['dpi'], plan_page(fake_page())['limit']), (201, 'text'))
+        # Escaneo de 1200 px de alto sobre 842 pt -> 102 DPI nativos
+        scanned = fake_page(images=[page_image(0, 0, 595, 842, srcsize=(850, 1200))])
+        self.assertEqual(plan_page(scanned)['limit'], 'native')
+        self.assertEqual(plan_page(scanned)['dpi'], 102)
+        # 12 Mpx sobre 1500x1500 pt -> 166 DPI
+        self.assertEqual(plan_page(fake_page(width=1500, height=1500))['limit'], 'budget')
+        low = fake_page(images=[page_image(0, 0, 595, 842, srcsize=(425, 600))])
+        self.assertEqual((plan_page(low)['dpi'], plan_page(low)['limit']), (100, 'min'))
+        high = plan_page(fake_page(width=298, height=420), target_text_height=60)
+        self.assertEqual((high['dpi'], high['limit']), (300, 'max'))
+        self.assertEqual((high['width'], high['height'], high['pixels']), (1242, 1750, 1242 * 1750))
+
+    def test_runs_group_consecutive_pages_with_the_same_dpi(self):
+        plans = [{'page': page, 'dpi': dpi} for page, dpi in ((1, 200), (2, 200), (3, 150), (4, 200), (5, 200), (7, 200))]
+        self.assertEqual(plan_runs(plans), [(1, 2, 200), (3, 3, 150), (4, 5, 200), (7, 7, 200)])
+        self.assertEqual(plan_runs([]), [])
+
+
+class PreprocessTests(SimpleTestCase):
+    def test_crops_and_downscales_to_target_line_height(self):
+        # Tinta: 830 x 400 px más 8 px de margen; líneas de 56 px -> 28 px (escala 0,5)
+        gray, info = preprocess(striped_page(56), target_text_height=28)
+        self.assertEqual(gray.ndim, 2)
+        self.assertEqual(gray.shape, (423, 208))
+        self.assertEqual((info['scale'], info['output_pixels']), (0.5, 423 * 208))
+
+    def test_small_text_is_only_cropped(self):
+        gray, info = preprocess(striped_page(20), target_text_height=28)
+        self.assertEqual(gray.shape, (470 + 16, 416))
+        self.assertNotIn('scale', info)
+
+    def test_grey_ink_and_blank_page(self):
+        self.assertEqual(preprocess(striped_page(56, ink=60), target_text_height=28)[0].shape, (423, 208))
+        blank = np.full((300, 200), 255, dtype=np.uint8)
+        gray, info = preprocess(blank)
+        self.assertEqual(gray.shape, (300, 200))
+        self.assertEqual(info['output_pixels'], info['input_pixels'])
+
+
+class FakeRecognizer:
+    """Lector de EasyOCR que solo reconoce: cajas horizontales con el texto de ``texts``"""
+
+    def __init__(self, texts):
+        self.texts = texts
+        self.recognized = []
+
+    def recognize(self, grey, horizontal_list, free_list, batch_size=1, reformat=False):
+        results = []
+        for x_min, x_max, y_min, y_max in horizontal_list:
+            self.recognized.append(self.texts[(x_min, x_max, y_min, y_max)])
+            box = [[x_min, y_min], [x_max, y_min], [x_max, y_max], [x_min, y_max]]
+            results.append((box, self.texts[(x_min, x_max, y_min, y_max)], 0.9))
+        return results
+
+
+def detected_page(lines):
+    """(cajas horizontales, lector falso) de una página con ``lines`` de palabras"""
+    boxes, texts = [], {}
+    for row, words in enumerate(lines):
+        for column, word in enumerate(words):
+            box = (10 + column * 200, 160 + column * 200, 10 + row * 40, 40 + row * 40)
+            boxes.append(list(box))
+            texts[box] = word
+    return boxes, FakeRecognizer(texts)
+
+
+class RegionsTests(SimpleTestCase):
+    def test_anchor_matching_tolerates_ocr_typos(self):
+        self.assertTrue(matches_anchor('DESCRIPCI0N', ITEMS_START))
+        self.assertTrue(matches_anchor('Descripción', ITEMS_START))
+        self.assertTrue(matches_anchor('Pr0ductos vendid0s por Dia', ITEMS_START))
+        self.assertTrue(matches_anchor('T0tal venta', ITEMS_END))
+        self.assertFalse(matches_anchor('LECHE ENTERA', ITEMS_START))
+        self.assertFalse(matches_anchor('Total a pagar', ITEMS_END))
+
+    def test_select_lines(self):
+        heads = ['Compra en', '23/06/2025', 'Total a pagar', 'Productos vendidos', 'DESCRIPCIÓN',
+                 'LECHE', 'Total venta', 'IVA', 'Gracias']
+        self.assertEqual(select_lines(heads), {0, 1, 2, 3, 4, 5, 6})
+        self.assertIsNone(select_lines(heads[:6]))  # Sin "Total venta"
+        self.assertIsNone(select_lines(['Factura simplificada', 'LECHE', 'Total venta']))
+
+    def test_only_header_and_items_are_recognized(self):
+        lines = [['Compra en', 'DIA'], ['Total a pagar', '1,00 €'], ['DESCRIPCIÓN', 'TOTAL'],
+                 ['LECHE', '1,00 €'], ['Total venta', '1,00 €'], ['IVA 10%', '0,09 €'], ['Gracias', 'por su compra']]
+        boxes, reader = detected_page(lines)
+        results = recognize_page(reader, np.zeros((400, 600), dtype=np.uint8), boxes, [])
+        self.assertEqual([text for _, text, _ in results], [word for line in lines[:5] for word in line])
+        # Del pie solo la primera caja de cada línea (para buscar las anclas), una vez cada una
+        self.assertNotIn('0,09 €', reader.recognized)
+        wanted = [word for line in lines[:5] for word in line]
+        self.assertEqual(sorted(reader.recognized), sorted(wanted + ['IVA 10%', 'Gracias']))
+
+    def test_full_page_without_anchors(self):
+        lines = [['Factura simplificada', 'Nº 12'], ['Pan', '0,80 €'], ['Huevos', '2,10 €'], ['Gracias', 'por su compra']]
+        boxes, reader = detected_page(lines)
+        results = recognize_page(reader, np.zeros((400, 600), dtype=np.uint8), boxes, [])
+        words = [word for line in lines for word in line]
+        self.assertEqual([text for _, text, _ in results], words)
+        self.assertEqual(sorted(reader.recognized), sorted(words))
+
+
+class OCRModeTests(SimpleTestCase):
+    def test_fast_without_tesseract_uses_accurate(self):
+        results = readtext_results(DIA_LINES)
+        with mock.patch.object(engines.EasyOCREngine, 'readtext', return_value=[results]) as readtext:
+            for mode in ('fast', 'auto'):
+                with self.subTest(mode=mode):
+                    self.assertEqual(engines.readtext(['page'], mode), ([results], ['easyocr']))
+        self.assertEqual(readtext.call_count, 2)
+
+
+class StartupImportsTests(SimpleTestCase):
+    def test_startup_does_not_import_ocr_chain(self):
+        # Proceso nuevo con -X importtime: en este ya están cargados por los tests
+        modules = _importtime(STARTUP)
+        self.assertIn('django', modules)
+        self.assertEqual(sorted({name.split('.')[0] for name in modules} & set(HEAVY_MODULES)), [])
+
+
+class OwnerIsolationTests(TestCase):
+    def setUp(self):
+        self.alice = User.objects.create_user('alice', password='x')
+        self.bob = User.objects.create_user('bob', password='x')
+        self.receipt = Receipt.objects.create(
+            owner=self.bob, supermarket_name='Dia', date=date(2025, 6, 1), total_cents=799,
+        )
+        self.product = Product.objects.create(name='Leche Entera 1L', price_cents=799, quantity=1, receipt=self.receipt)
+        self.client.force_login(self.alice)
+
+    def test_cannot_list_or_read(self):
+        self.assertEqual(self.client.get(reverse('api_receipt_list')).json()['receipts'], [])
+        self.assertEqual(self.client.get(reverse('api_products_list')).json()['products'], [])
+        self.assertEqual(self.client.get(reverse('api_receipt_detail', args=[self.receipt.id])).status_code, 404)
+
+    def test_cannot_update_or_delete(self):
+        response = self.client.put(reverse('api_receipt_update', args=[self.receipt.id]),
+                                   json.dumps({'total_amount': 1}), content_type='application/json')
+        self.assertEqual(response.status_code, 404)
+        self.assertEqual(self.client.delete(reverse('api_receipt_delete', args=[self.receipt.id])).status_code, 404)
+        self.assertEqual(self.client.delete(reverse('api_product_delete', args=[self.product.id])).status_code, 404)
+        self.receipt.refresh_from_db()
+        self.assertEqual(self.receipt.total_cents, 799)
+        self.assertTrue(Product.objects.filter(id=self.product.id).exists())
+
+    def test_not_in_analytics(self):
+        overview = self.client.get(reverse('api_dashboard_overview')).json()['overview']
+        self.assertEqual((overview['total_receipts'], overview['total_spent']), (0, 0))
+        prices = self.client.get(reverse('api_compare_prices'), {'product_name': 'Leche'}).json()
+        self.assertEqual(prices['comparisons'], [])
+        self.assertEqual(self.client.get(reverse('api_supermarket_ranking')).json()['ranking'], [])
+        # Bob sí los ve
+        self.client.force_login(self.bob)
+        overview = self.client.get(reverse('api_dashboard_overview')).json()['overview']
+        self.assertEqual(overview['total_receipts'], 1)
+
+
+class EmptyUploadTests(TestCase):
+    def test_receipt_without_items_is_not_saved(self):
+        user = User.objects.create_user('alice', password='x')
+        self.client.force_login(user)
+        empty = {'supermarket': 'Desconocido', 'datetime': datetime.now(), 'total_amount': 0.0, 'items': []}
+        upload = SimpleUploadedFile('ticket.pdf', b'%PDF-1.4', content_type='application/pdf')
+        with mock.patch('receipts.ingestion.parse_receipt_pdf_ocr', return_value=empty):
+            response = self.client.post(reverse('api_receipt_upload'), {'receipt': upload})
+        self.assertEqual(response.status_code, 422)
+        self.assertFalse(Receipt.objects.exists())
 
-# Create your tests here.
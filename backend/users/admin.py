@@ -1,9 +1,17 @@
 from django.contrib import admin
 from django.contrib.auth.admin import UserAdmin
 from django.contrib.auth.models import User
+from backendgrocerylyzer.money import to_euros
 from .models import UserProfile
 
-class UserProfileInline(admin.StackedInline):
+class ProfileStatsMixin:
+    """Muestra el gasto total en euros (se guarda en céntimos)"""
+
+    @admin.display(description='Total amount spent', ordering='total_spent_cents')
+    def total_amount_spent(self, obj):
+        return f'{to_euros(obj.total_spent_cents):.2f} €'
+
+class UserProfileInline(ProfileStatsMixin, admin.StackedInline):
     """Inline para mostrar el perfil del usuario en la página de edición del usuario"""
     model = UserProfile
     can_delete = False
@@ -28,7 +36,7 @@ class CustomUserAdmin(UserAdmin):
         return super(CustomUserAdmin, self).get_inline_instances(request, obj)
 
 @admin.register(UserProfile)
-class UserProfileAdmin(admin.ModelAdmin):
+class UserProfileAdmin(ProfileStatsMixin, admin.ModelAdmin):
     """Admin para gestionar los perfiles de usuario directamente"""
     list_display = (
         'user', 
@@ -44,7 +52,7 @@ class UserProfileAdmin(admin.ModelAdmin):
         'created_at'
     )
     search_fields = ('user__username', 'user__email', 'phone_number')
-    readonly_fields = ('created_at', 'updated_at')
+    readonly_fields = ('created_at', 'updated_at', 'total_amount_spent')
     
     fieldsets = (
         ('Usuario', {
@@ -70,7 +78,7 @@ class UserProfileAdmin(admin.ModelAdmin):
         """Hacer campos de solo lectura según el contexto"""
         readonly = list(self.readonly_fields)
         if obj:  # Editando un objeto existente
-            readonly.extend(['total_receipts_processed', 'total_amount_spent'])
+            readonly.append('total_receipts_processed')
         return readonly
 
 # Desregistrar el UserAdmin por defecto y registrar el personalizado
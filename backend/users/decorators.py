@@ -0,0 +1,11 @@
+from functools import wraps
+from django.http import JsonResponse
+
+def api_login_required(view_func):
+    """Devuelve 401 en JSON (en lugar de redirigir al login) si no hay usuario autenticado"""
+    @wraps(view_func)
+    def wrapper(request, *args, **kwargs):
+        if not request.user.is_authenticated:
+            return JsonResponse({'error': 'Usuario no autenticado'}, status=401)
+        return view_func(request, *args, **kwargs)
+    return wrapper
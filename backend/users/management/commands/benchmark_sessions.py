@@ -0,0 +1,87 @@
+from django.conf import settings
+from django.core.cache import caches
+from django.core.management.base import BaseCommand
+from django.db import connection
+from django.test import Client
+from django.test.runner import DiscoverRunner
+from django.test.utils import override_settings, setup_test_environment, teardown_test_environment
+from backendgrocerylyzer import sessions
+from receipts.datasets import ensure_users
+import os
+import statistics
+import tempfile
+import time
+
+# (nombre, settings a sobrescribir)
+SCENARIOS = [
+    ('legacy', {
+        'SESSION_ENGINE': 'django.contrib.sessions.backends.db',
+        'SESSION_SAVE_EVERY_REQUEST': True,
+        'MIDDLEWARE': [m for m in settings.MIDDLEWARE if m != 'backendgrocerylyzer.sessions.SessionRenewalMiddleware'],
+    }),
+    ('low_write', {}),
+    # Peor caso: cada petición renueva (toda la carga pasa por el write-behind)
+    ('low_write_renew_all', {'SESSION_RENEW_FRACTION': 0}),
+]
+
+PATHS = ['/api/users/profile/', '/api/analytics/dashboard-overview/', '/api/receipts/api/list/']
+
+
+def _isolated_caches(directory):
+    """CACHES con las cachés en disco movidas a ``directory`` (no toca las del servidor)"""
+    caches_setting = {}
+    for alias, config in settings.CACHES.items():
+        config = dict(config)
+        if config['BACKEND'].endswith('FileBasedCache'):
+            config['LOCATION'] = os.path.join(directory, alias)
+        caches_setting[alias] = config
+    return caches_setting
+
+class Command(BaseCommand):
+    help = 'Comparar escrituras en django_session por petición: sesiones clásicas frente a las de pocas escrituras'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--requests', type=int, default=300, help='Peticiones autenticadas por escenario')
+
+    def handle(self, *args, **options):
+        setup_test_environment()
+        runner = DiscoverRunner(verbosity=0, interactive=False)
+        old_config = runner.setup_databases()
+        try:
+            user = ensure_users(1, prefix='benchmark')[0]
+            self.stdout.write(f"{'escenario':<22}{'escrituras/pet':>16}{'lecturas/pet':>14}{'p50 ms':>10}")
+            for name, overrides in SCENARIOS:
+                # Cada escenario empieza con cachés vacías en un directorio temporal
+                with tempfile.TemporaryDirectory() as directory, \
+                        override_settings(CACHES=_isolated_caches(directory), **overrides):
+                    stats = self._run(user, options['requests'])
+                self.stdout.write(
+                    f"{name:<22}{stats['writes'] / stats['requests']:>16.3f}"
+                    f"{stats['reads'] / stats['requests']:>14.3f}{stats['p50_ms']:>10.2f}"
+                )
+        finally:
+            runner.teardown_databases(old_config)
+            teardown_test_environment()
+
+    def _run(self, user, requests):
+        caches['default'].clear()
+        client = Client()
+        client.force_login(user)
+
+        counts = {'writes': 0, 'reads': 0}
+
+        def count_session_queries(execute, sql, params, many, context):
+            if 'django_session' in sql:
+                counts['reads' if sql.lstrip().upper().startswith('SELECT') else 'writes'] += 1
+            return execute(sql, params, many, context)
+
+        latencies = []
+        with connection.execute_wrapper(count_session_queries):
+            for i in range(requests):
+                start = time.perf_counter()
+                client.get(PATHS[i % len(PATHS)])
+                latencies.append((time.perf_counter() - start) * 1000)
+            # Las renovaciones aún pendientes también cuentan
+            sessions.flush_pending(force=True)
+
+        return {'requests': requests, 'p50_ms': statistics.median(latencies), **counts}
@@ -0,0 +1,14 @@
+from django.core.management.base import BaseCommand
+from django.conf import settings
+from backendgrocerylyzer.profiling import make_token
+
+class Command(BaseCommand):
+    help = 'Generar un token firmado para perfilar peticiones con la cabecera X-Profile-Token'
+
+    def handle(self, *args, **options):
+        if not settings.PROFILER_ENABLED:
+            self.stdout.write(self.style.WARNING('PROFILER_ENABLED está desactivado: exporta GROCERYLYZER_PROFILER=1'))
+        
+        self.stdout.write(make_token())
+        self.stdout.write(f'Válido durante {settings.PROFILER_TOKEN_MAX_AGE} segundos. Ejemplo:')
+        self.stdout.write('  curl -H "X-Profile-Token: <token>" http://localhost:8000/api/analytics/...')
@@ -0,0 +1,34 @@
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand, CommandError
+from backendgrocerylyzer.money import to_euros
+from users.stats import reconcile
+
+class Command(BaseCommand):
+    help = 'Recalcular las estadísticas de UserProfile desde los recibos y corregir desviaciones'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--username', action='append', help='Limitar a este usuario (se puede repetir)')
+        parser.add_argument('--dry-run', action='store_true', help='Solo informar de las desviaciones')
+
+    def handle(self, *args, **options):
+        user_ids = None
+        if options['username']:
+            users = dict(User.objects.filter(username__in=options['username']).values_list('username', 'id'))
+            missing = set(options['username']) - set(users)
+            if missing:
+                raise CommandError(f"Usuarios inexistentes: {', '.join(sorted(missing))}")
+            user_ids = list(users.values())
+
+        drifts = reconcile(user_ids=user_ids, dry_run=options['dry_run'])
+        for user_id, (count, total), (expected_count, expected_total) in drifts:
+            self.stdout.write(
+                f'  usuario {user_id}: {count} recibos / {to_euros(total):.2f}€ -> '
+                f'{expected_count} recibos / {to_euros(expected_total):.2f}€'
+            )
+
+        if not drifts:
+            self.stdout.write(self.style.SUCCESS('✅ Estadísticas consistentes'))
+        elif options['dry_run']:
+            self.stdout.write(self.style.WARNING(f'{len(drifts)} perfiles desviados (sin cambios: --dry-run)'))
+        else:
+            self.stdout.write(self.style.SUCCESS(f'✅ {len(drifts)} perfiles corregidos'))
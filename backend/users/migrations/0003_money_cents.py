@@ -0,0 +1,40 @@
+# Importes en céntimos enteros (backendgrocerylyzer/money.py)
+
+import backendgrocerylyzer.money
+from django.db import migrations, models
+from django.db.models import F
+from django.db.models.functions import Cast, Round
+
+
+def to_cents(apps, schema_editor):
+    UserProfile = apps.get_model('users', 'UserProfile')
+    UserProfile.objects.using(schema_editor.connection.alias).update(
+        total_spent_cents=Cast(Round(F('total_amount_spent') * 100), models.BigIntegerField())
+    )
+
+
+def to_decimal(apps, schema_editor):
+    UserProfile = apps.get_model('users', 'UserProfile')
+    UserProfile.objects.using(schema_editor.connection.alias).update(
+        total_amount_spent=Cast(F('total_spent_cents') / 100.0, models.DecimalField(max_digits=10, decimal_places=2))
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('users', '0002_shardassignment'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='userprofile',
+            name='total_spent_cents',
+            field=backendgrocerylyzer.money.MoneyField(default=0),
+        ),
+        migrations.RunPython(to_cents, to_decimal),
+        migrations.RemoveField(
+            model_name='userprofile',
+            name='total_amount_spent',
+        ),
+    ]
@@ -1,5 +1,6 @@
 from django.db import models
 from django.contrib.auth.models import User
+from backendgrocerylyzer.money import MoneyField
 
 class UserProfile(models.Model):
     """Extended user profile with additional fields for GroceryLyzer"""
@@ -16,7 +17,7 @@ class UserProfile(models.Model):
     
     # Statistics
     total_receipts_processed = models.IntegerField(default=0)
-    total_amount_spent = models.DecimalField(max_digits=10, decimal_places=2, default=0.00)
+    total_spent_cents = MoneyField(default=0)
     
     # Timestamps
     created_at = models.DateTimeField(auto_now_add=True)
@@ -28,3 +29,16 @@ class UserProfile(models.Model):
     class Meta:
         verbose_name = "User Profile"
         verbose_name_plural = "User Profiles"
+
+
+class ShardAssignment(models.Model):
+    """Shard de recibos de un usuario cuando no es el que da el hash (ver backendgrocerylyzer/db/sharding.py)"""
+    
+    user = models.OneToOneField(User, on_delete=models.CASCADE, related_name='shard_assignment')
+    shard = models.CharField(max_length=64)
+    # Escrituras congeladas mientras se mueve de shard
+    frozen = models.BooleanField(default=False)
+    updated_at = models.DateTimeField(auto_now=True)
+    
+    def __str__(self):
+        return f"{self.user_id} -> {self.shard}"
@@ -0,0 +1,47 @@
+# signals.py - Mantener las estadísticas de UserProfile al crear/editar/borrar recibos
+#
+# El perfil está en 'default' y el recibo en su shard: los deltas se aplican
+# cuando se confirma la transacción del shard (on_commit), para no contar un
+# recibo cuya escritura acaba deshaciéndose.
+
+from functools import partial
+
+from django.db import transaction
+from django.db.models.signals import post_save, post_delete
+from django.dispatch import receiver
+
+from receipts.models import Receipt
+from .stats import apply_receipt_delta, is_suspended
+
+
+def _on_commit(using, *args, **kwargs):
+    transaction.on_commit(partial(apply_receipt_delta, *args, **kwargs), using=using)
+
+
+@receiver(post_save, sender=Receipt)
+def receipt_saved(sender, instance, created, raw=False, using=None, **kwargs):
+    if raw or is_suspended():  # loaddata / borrados masivos
+        return
+
+    total = instance.total_cents
+    if created:
+        _on_commit(using, instance.owner_id, 1, total)
+    else:
+        old_owner_id, old_total = getattr(instance, '_loaded_stats', (instance.owner_id, None))
+        if old_total is None:
+            # Importe no cargado (campo diferido): save() no lo ha cambiado
+            old_total = total
+        if old_owner_id != instance.owner_id:
+            _on_commit(using, old_owner_id, -1, -old_total, create=False)
+            _on_commit(using, instance.owner_id, 1, total)
+        else:
+            _on_commit(using, instance.owner_id, 0, total - old_total)
+
+    instance._loaded_stats = (instance.owner_id, total)
+
+
+@receiver(post_delete, sender=Receipt)
+def receipt_deleted(sender, instance, using=None, **kwargs):
+    if is_suspended():
+        return
+    _on_commit(using, instance.owner_id, -1, -instance.total_cents, create=False)
@@ -0,0 +1,106 @@
+# stats.py - Estadísticas de UserProfile mantenidas de forma incremental
+#
+# Las señales de receipts.Receipt (ver users/signals.py) aplican deltas con
+# expresiones F() en un único UPDATE, así que la lectura del perfil no
+# recalcula nada. ``reconcile`` recalcula desde los recibos para corregir
+# desviaciones (bulk_create, cambios hechos fuera del ORM...).
+
+from contextlib import contextmanager
+from contextvars import ContextVar
+from django.db import IntegrityError, models, transaction
+from django.db.models import F
+
+from backendgrocerylyzer.db.sharding import shard_for_user_id, shards
+
+from .models import UserProfile
+
+_suspended = ContextVar('user_stats_suspended', default=False)
+
+
+@contextmanager
+def suspended():
+    """Desactiva los deltas por recibo (borrados masivos); hay que llamar a ``reconcile`` después"""
+    token = _suspended.set(True)
+    try:
+        yield
+    finally:
+        _suspended.reset(token)
+
+
+def is_suspended():
+    return _suspended.get()
+
+
+def apply_receipt_delta(user_id, count_delta, amount_delta, create=True):
+    """Suma ``count_delta`` recibos y ``amount_delta`` céntimos al perfil del usuario
+
+    Con ``create=False`` no se crea el perfil si falta (borrados: puede que el
+    usuario se esté eliminando en cascada; el perfil se calculará al leerlo).
+    """
+    if user_id is None or (not count_delta and not amount_delta):
+        return
+
+    updated = UserProfile.objects.filter(user_id=user_id).update(
+        total_receipts_processed=F('total_receipts_processed') + count_delta,
+        total_spent_cents=F('total_spent_cents') + amount_delta,
+    )
+    if updated or not create:
+        return
+
+    # Sin perfil todavía: se crea con los totales reales (ya incluyen este cambio)
+    try:
+        with transaction.atomic():
+            UserProfile.objects.create(user_id=user_id, **compute_stats(user_id))
+    except IntegrityError:
+        # Otro proceso lo creó entre medias: aplicar el delta sobre el suyo
+        apply_receipt_delta(user_id, count_delta, amount_delta, create=False)
+
+
+def compute_stats(user_id):
+    """Recalcula las estadísticas del usuario desde sus recibos"""
+    from receipts.models import Receipt
+
+    stats = Receipt.objects.using(shard_for_user_id(user_id)).filter(owner_id=user_id).aggregate(
+        count=models.Count('id'),
+        total=models.Sum('total_cents')
+    )
+    return {
+        'total_receipts_processed': stats['count'],
+        'total_spent_cents': stats['total'] or 0,
+    }
+
+
+def reconcile(user_ids=None, dry_run=False):
+    """Corrige las estadísticas desviadas y devuelve la lista de correcciones
+
+    Cada corrección es (user_id, (recibos, céntimos) guardados, (recibos, céntimos) reales).
+    """
+    from receipts.models import Receipt
+
+    profiles = UserProfile.objects.all()
+    if user_ids is not None:
+        profiles = profiles.filter(user_id__in=user_ids)
+
+    # Con sharding, cada usuario solo tiene recibos en su shard
+    actual = {}
+    for alias in shards():
+        receipts = Receipt.objects.using(alias).exclude(owner=None)
+        if user_ids is not None:
+            receipts = receipts.filter(owner_id__in=user_ids)
+        for row in receipts.values('owner').annotate(count=models.Count('id'), total=models.Sum('total_cents')):
+            actual[row['owner']] = (row['count'], row['total'] or 0)
+
+    drifts = []
+    for profile in profiles.only('user_id', 'total_receipts_processed', 'total_spent_cents'):
+        stored = (profile.total_receipts_processed, profile.total_spent_cents)
+        expected = actual.get(profile.user_id, (0, 0))
+        if stored != expected:
+            drifts.append((profile.user_id, stored, expected))
+
+    if not dry_run:
+        for user_id, _, (count, total) in drifts:
+            UserProfile.objects.filter(user_id=user_id).update(
+                total_receipts_processed=count,
+                total_spent_cents=total,
+            )
+    return drifts
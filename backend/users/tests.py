@@ -1,3 +1,325 @@
-from django.test import TestCase
+import io
+import json
+import logging
+import os
+import tempfile
+import time
+import threading
+import unittest
+from collections import Counter
+from datetime import date, timedelta
+from unittest import mock
+
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.contrib.sessions.models import Session
+from django.core import signing
+from django.db import connection, transaction
+from django.http import HttpResponse
+from django.test import RequestFactory, TestCase, TransactionTestCase, override_settings
+from django.urls import reverse
+from django.utils import timezone
+
+from backendgrocerylyzer import profiling, sessions
+from backendgrocerylyzer.db import sharding
+from backendgrocerylyzer.db.sharding import ShardMigrationInProgress, jump_hash, move_user, user_write
+from backendgrocerylyzer.db.writequeue import WriteQueue, _Job, run_write
+from backendgrocerylyzer.log import QueueListenerHandler, SamplingFilter, StructuredFormatter
+from backendgrocerylyzer.sessions import RENEWED_KEY, SessionStore
+from catalog.models import Supermarket
+from receipts.models import Product, Receipt
+
+from .models import ShardAssignment, UserProfile
+
+
+class SessionStoreTests(TestCase):
+    def setUp(self):
+        self.session = SessionStore()
+        self.session['user'] = 1
+        self.session.save()
+        self.addCleanup(self.session.delete)
+
+    def test_flush_invalidates_other_copies(self):
+        # Otro worker con la sesión ya en caché
+        other = SessionStore(self.session.session_key)
+        self.assertEqual(other['user'], 1)
+        self.session.flush()
+        self.assertEqual(dict(SessionStore(self.session.session_key).items()), {})
+
+    def test_renewal_time_derived_from_db_expiry(self):
+        # Renovación que solo llegó a la caché y a expire_date (write-behind ya volcado)
+        stored = Session.objects.get(session_key=self.session.session_key)
+        stored.session_data = self.session.encode({'user': 1, RENEWED_KEY: int(time.time()) - 80000})
+        stored.expire_date = timezone.now() + timedelta(seconds=settings.SESSION_COOKIE_AGE)
+        stored.save()
+        self.session._cache.delete(self.session.cache_key)
+
+        reloaded = SessionStore(self.session.session_key)
+        self.assertAlmostEqual(reloaded[RENEWED_KEY], time.time(), delta=5)
+        self.assertFalse(reloaded.needs_renewal())
+
+    def test_renewal_only_save_is_written_behind(self):
+        session = SessionStore(self.session.session_key)
+        session.load()
+        session.renew()
+        session.save()
+        self.assertEqual(sessions.pending_count(), 1)
+        self.assertEqual(sessions.flush_pending(force=True), 1)
+        self.assertEqual(sessions.pending_count(), 0)
+
+
+# jump_hash(0..7, 4) del algoritmo de Lamping y Veach
+EXPECTED_JUMP_HASH = [0, 0, 3, 3, 1, 1, 2, 0]
+
+
+class JumpHashTests(unittest.TestCase):
+    def test_stable_values(self):
+        # Cambiarlos movería a los usuarios de shard sin copiar sus datos
+        self.assertEqual([jump_hash(key, 4) for key in range(8)], EXPECTED_JUMP_HASH)
+        self.assertEqual(jump_hash(2 ** 64 + 5, 10), jump_hash(5, 10))
+
+    def test_adding_a_shard_only_moves_to_it(self):
+        for buckets in (1, 2, 5, 9):
+            before = [jump_hash(key, buckets) for key in range(20000)]
+            after = [jump_hash(key, buckets + 1) for key in range(20000)]
+            moved = Counter(b for a, b in zip(before, after) if a != b)
+            self.assertEqual(set(moved), {buckets})
+            self.assertAlmostEqual(moved[buckets] / 20000, 1 / (buckets + 1), delta=0.02)
+
+
+class ProfileStatsTests(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user('stats', password='x')
+        UserProfile.objects.get_or_create(user=self.user)
+
+    def create_receipt(self, cents):
+        return Receipt.objects.create(owner=self.user, supermarket_name='Dia', date=date(2025, 6, 1), total_cents=cents)
+
+    def test_delta_applied_on_commit(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            self.create_receipt(1234)
+        profile = UserProfile.objects.get(user=self.user)
+        self.assertEqual((profile.total_receipts_processed, profile.total_spent_cents), (1, 1234))
+
+    def test_rolled_back_receipt_not_counted(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            with self.assertRaises(RuntimeError), transaction.atomic():
+                self.create_receipt(1234)
+                raise RuntimeError
+        profile = UserProfile.objects.get(user=self.user)
+        self.assertEqual((profile.total_receipts_processed, profile.total_spent_cents), (0, 0))
+
+
+@unittest.skipUnless(len(settings.RECEIPT_SHARDS) > 1, 'Necesita GROCERYLYZER_RECEIPT_SHARDS=2 o más')
+class MoveUserTests(TransactionTestCase):
+    databases = '__all__'
+
+    def setUp(self):
+        self.user = User.objects.create_user('mover', password='x')
+        self.source = sharding.shard_for_user_id(self.user.pk)
+        self.target = next(alias for alias in settings.RECEIPT_SHARDS if alias != self.source)
+        self.receipt = Receipt.objects.create(
+            owner=self.user, supermarket_name='Dia', date=date(2025, 6, 1), total_cents=500,
+        )
+        self.product = Product.objects.create(
+            name='Pechuga Entera', price_cents=482, quantity=1, weighed=True, receipt=self.receipt,
+        )
+
+    def test_move_copies_switches_and_cleans_source(self):
+        source, copied = move_user(self.user.pk, self.target)
+        self.assertEqual((source, copied), (self.source, (1, 1)))
+        self.assertEqual(sharding.shard_for_user_id(self.user.pk), self.target)
+        self.assertFalse(ShardAssignment.objects.get(user=self.user).frozen)
+        self.assertFalse(Receipt.objects.using(self.source).filter(owner=self.user).exists())
+        moved = Receipt.objects.using(self.target).get(owner=self.user)
+        self.assertEqual(moved.id, self.receipt.id)
+        self.assertEqual(moved.products.count(), 1)
+        # Repetirla no hace nada
+        self.assertEqual(move_user(self.user.pk, self.target), (self.target, (0, 0)))
+
+    def test_move_overwrites_stale_copies(self):
+        # Restos de un movimiento interrumpido en el destino: se sobrescriben todos los campos
+        stale = Receipt.objects.using(self.target).create(
+            id=self.receipt.id, owner=self.user, supermarket_name='Dia', date=date(2025, 6, 1), total_cents=1,
+        )
+        Product.objects.using(self.target).create(
+            id=self.product.id, name='Pechuga Entera', price_cents=1, quantity=1, weighed=False, receipt_id=stale.id,
+        )
+        move_user(self.user.pk, self.target)
+        moved = Product.objects.using(self.target).get(id=self.product.id)
+        self.assertEqual((moved.price_cents, moved.weighed), (482, True))
+
+    def test_frozen_user_rejects_writes(self):
+        ShardAssignment.objects.create(user=self.user, shard=self.source, frozen=True)
+        with self.assertRaises(ShardMigrationInProgress), user_write(self.user.pk):
+            pass
+        self.receipt.total_cents = 600
+        with self.assertRaises(ShardMigrationInProgress):
+            self.receipt.save()
+
+    def test_write_loaded_before_move_is_rejected(self):
+        # Cargado del origen antes de la conmutación: no puede escribir ahí después
+        stale = Receipt.objects.using(self.source).get(id=self.receipt.id)
+        move_user(self.user.pk, self.target)
+        stale.total_cents = 999
+        with self.assertRaises(ShardMigrationInProgress), user_write(self.user.pk):
+            stale.save()
+        self.assertEqual(Receipt.objects.using(self.target).get(id=self.receipt.id).total_cents, 500)
+
+
+class WriteQueueTests(TransactionTestCase):
+    def _create(self, name, fail=False):
+        Supermarket.objects.create(name=name)
+        if fail:
+            raise ValueError(name)
+        return len(connection.savepoint_ids)
+
+    def test_batch_commits_once_with_a_savepoint_per_job(self):
+        jobs = [_Job(self._create, (name,), {}) for name in ('A', 'B', 'C')]
+        with mock.patch.object(connection, 'commit', wraps=connection.commit) as commit:
+            WriteQueue()._run_batch(jobs)
+        self.assertEqual(commit.call_count, 1)
+        self.assertEqual([job.future.result() for job in jobs], [1, 1, 1])
+        self.assertEqual(list(Supermarket.objects.filter(name__in='ABC').values_list('name', flat=True)), ['A', 'B', 'C'])
+
+    def test_failing_job_does_not_roll_back_the_others(self):
+        jobs = [_Job(self._create, ('A',), {}), _Job(self._create, ('B',), {'fail': True}), _Job(self._create, ('C',), {})]
+        WriteQueue()._run_batch(jobs)
+        self.assertEqual(jobs[0].future.result(), 1)
+        with self.assertRaisesMessage(ValueError, 'B'):
+            jobs[1].future.result()
+        self.assertEqual(list(Supermarket.objects.filter(name__in='ABC').values_list('name', flat=True)), ['A', 'C'])
+
+    @override_settings(SQLITE_WRITE_QUEUE=True)
+    def test_run_write_batches_waiting_jobs_and_reraises(self):
+        write_queue = WriteQueue()
+        started, release = threading.Event(), threading.Event()
+        batches = []
+        write_queue._run_batch = lambda batch, run=write_queue._run_batch: (batches.append(len(batch)), run(batch))
+        # Mientras el escritor está ocupado se acumulan tres escrituras: un solo lote
+        blocker = write_queue.submit(lambda: started.set() or release.wait())
+        self.assertTrue(started.wait(5))
+        futures = [write_queue.submit(self._create, name, fail=name == 'B') for name in ('A', 'B', 'C')]
+        release.set()
+        self.assertTrue(blocker.result(timeout=5))
+        self.assertEqual(futures[0].result(timeout=5), 1)
+        with self.assertRaisesMessage(ValueError, 'B'):
+            futures[1].result(timeout=5)
+        self.assertEqual(batches, [1, 3])
+        with mock.patch('backendgrocerylyzer.db.writequeue.get_queue', return_value=write_queue):
+            with self.assertRaisesMessage(ValueError, 'D'):
+                run_write(self._create, 'D', fail=True)
+            self.assertEqual(run_write(self._create, 'E'), 1)
+        self.assertEqual(list(Supermarket.objects.filter(name__in='ABCDE').values_list('name', flat=True)), ['A', 'C', 'E'])
+
+
+class StructuredLogTests(unittest.TestCase):
+    def test_exception_goes_through_the_queue_in_exc(self):
+        stream = io.StringIO()
+        console = logging.StreamHandler(stream)
+        console.setFormatter(StructuredFormatter())
+        handler = QueueListenerHandler([console])
+        logger = logging.Logger('test.log')
+        logger.addHandler(handler)
+        try:
+            1 / 0
+        except ZeroDivisionError:
+            logger.exception('Fallo %s', 'x', extra={'receipt_id': 7})
+        handler.close()
+
+        payload = json.loads(stream.getvalue())
+        self.assertEqual((payload['msg'], payload['receipt_id']), ('Fallo x', 7))
+        self.assertIn('ZeroDivisionError', payload['exc'])
+
+    @unittest.skipUnless(hasattr(os, 'fork'), 'Sin os.fork')
+    def test_listener_restarts_in_forked_child(self):
+        with tempfile.NamedTemporaryFile('r', suffix='.log') as output:
+            console = logging.FileHandler(output.name)
+            console.setFormatter(StructuredFormatter())
+            handler = QueueListenerHandler([console])
+            self.addCleanup(handler.close)
+            logger = logging.Logger('test.fork')
+            logger.addHandler(handler)
+
+            pid = os.fork()
+            if pid == 0:
+                status = 1
+                try:
+                    if handler.started:
+                        logger.warning('Desde el hijo', extra={'pid': os.getpid()})
+                        handler.close()  # Vacía la cola antes de salir
+                        status = 0
+                finally:
+                    os._exit(status)
+            _, status = os.waitpid(pid, 0)
+            self.assertEqual(os.waitstatus_to_exitcode(status), 0)
+            self.assertTrue(handler.started)
+            logger.warning('Desde el padre')
+            handler.close()
+
+            payloads = [json.loads(line) for line in output.read().splitlines()]
+        self.assertEqual([payload['msg'] for payload in payloads], ['Desde el hijo', 'Desde el padre'])
+        self.assertEqual(payloads[0]['pid'], pid)
+
+    def test_sampling_filter_levels(self):
+        self.assertEqual(SamplingFilter(0, 'INFO').min_level, logging.INFO)
+        self.assertEqual(SamplingFilter(0, logging.WARNING).min_level, logging.WARNING)
+        with self.assertRaises(ValueError):
+            SamplingFilter(0, 'NOPE')
+        self.assertFalse(SamplingFilter(0).filter(logging.makeLogRecord({'levelno': logging.DEBUG})))
+
+
+class ProfilerTests(TestCase):
+    def setUp(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        override = override_settings(
+            PROFILER_ENABLED=True, PROFILER_SAMPLE_RATE=0, PROFILER_DIR=directory.name, PROFILER_MAX_FILES=2,
+        )
+        override.enable()
+        self.addCleanup(override.disable)
+        self.middleware = profiling.ProfilerMiddleware(lambda request: HttpResponse('ok'))
+
+    def _get(self, path='/api/analytics/overview/', token=None):
+        request = RequestFactory().get(path, HTTP_X_PROFILE_TOKEN=token or profiling.make_token())
+        return self.middleware(request)
+
+    def test_token_validation(self):
+        token = profiling.make_token()
+        self.assertTrue(profiling._valid_token(token))
+        self.assertFalse(profiling._valid_token(token[:-1] + ('A' if token[-1] != 'A' else 'B')))
+        self.assertFalse(profiling._valid_token(signing.TimestampSigner(salt='otra').sign('profile')))
+        with mock.patch('django.core.signing.time.time', return_value=time.time() - 2 * settings.PROFILER_TOKEN_MAX_AGE):
+            expired = profiling.make_token()
+        self.assertFalse(profiling._valid_token(expired))
+        self.assertNotIn('X-Profile-Id', self._get(token=expired))
+        self.assertNotIn('X-Profile-Id', self._get('/api/auth/login/'))
+
+    def test_ring_keeps_latest_profiles(self):
+        now = time.time()
+        names = []
+        for age, path in ((200, '/api/analytics/a/'), (100, '/api/analytics/b/'), (0, '/api/analytics/c/')):
+            names.append(self._get(path)['X-Profile-Id'])
+            os.utime(profiling._profile_dir() / names[-1], (now - age, now - age))
+        self.assertEqual([path.name for path in profiling._list_profiles()], names[:0:-1])
+
+    def test_busy_profiler_serves_without_profiling(self):
+        with profiling._profiling:
+            response = self._get()
+        self.assertEqual(response.content, b'ok')
+        self.assertNotIn('X-Profile-Id', response)
+        self.assertIn('X-Profile-Id', self._get())
+
+    def test_views_staff_only(self):
+        name = self._get()['X-Profile-Id']
+        self.client.force_login(User.objects.create_user('alice', password='x'))
+        self.assertEqual(self.client.get(reverse('admin_profiles')).status_code, 302)
+        self.assertEqual(self.client.get(reverse('admin_profile_detail', args=[name])).status_code, 302)
+
+        self.client.force_login(User.objects.create_user('staff', password='x', is_staff=True))
+        listing = self.client.get(reverse('admin_profiles')).json()
+        self.assertEqual([profile['name'] for profile in listing['profiles']], [name])
+        text = self.client.get(reverse('admin_profile_detail', args=[name]), {'format': 'text'})
+        self.assertIn('function calls', text.content.decode())
+        self.assertEqual(self.client.get(reverse('admin_profile_detail', args=['no-existe.prof'])).status_code, 404)
 
-# Create your tests here.
@@ -5,7 +5,9 @@ from django.views.decorators.http import require_http_methods
 from django.contrib.auth.models import User
 from django.contrib.auth.decorators import login_required
 from django.db import models
+from backendgrocerylyzer.money import to_euros
 from .models import UserProfile
+from .stats import compute_stats
 import json
 @csrf_exempt
 @require_http_methods(["POST"])
@@ -130,17 +132,11 @@ def user_profile(request):
         
         user = request.user
         
-        # Obtener o crear el perfil del usuario
-        profile, created = UserProfile.objects.get_or_create(user=user)
-        
-        # Obtener estadísticas del usuario (recibos asociados)
-        from receipts.models import Receipt
-        user_receipts = Receipt.objects.filter()  # Aquí podrías filtrar por usuario si tienes esa relación
-        
-        # Actualizar estadísticas en el perfil
-        profile.total_receipts_processed = user_receipts.count()
-        profile.total_amount_spent = sum(receipt.total_amount for receipt in user_receipts)
-        profile.save()
+        # Las estadísticas se mantienen al crear/editar/borrar recibos (users/signals.py):
+        # aquí solo se leen. El perfil se crea con los totales reales si aún no existe.
+        profile = UserProfile.objects.filter(user=user).first()
+        if profile is None:
+            profile, created = UserProfile.objects.get_or_create(user=user, defaults=compute_stats(user.id))
         
         return JsonResponse({
             'success': True,
@@ -165,8 +161,8 @@ def user_profile(request):
             },
             'statistics': {
                 'total_receipts': profile.total_receipts_processed,
-                'total_spent': float(profile.total_amount_spent),
-                'average_per_receipt': float(profile.total_amount_spent / profile.total_receipts_processed) if profile.total_receipts_processed > 0 else 0
+                'total_spent': to_euros(profile.total_spent_cents),
+                'average_per_receipt': to_euros(profile.total_spent_cents) / profile.total_receipts_processed if profile.total_receipts_processed > 0 else 0
             }
         })
         
@@ -220,9 +216,9 @@ def update_profile(request):
         if 'price_alerts' in data:
             profile.price_alerts = bool(data['price_alerts'])
         
-        # Guardar cambios
+        # Guardar cambios (sin tocar las estadísticas, que se actualizan con F())
         user.save()
-        profile.save()
+        profile.save(update_fields=['phone_number', 'birth_date', 'email_notifications', 'price_alerts', 'updated_at'])
         
         return JsonResponse({
             'success': True,
@@ -101,6 +101,7 @@ export interface SupermarketSavings {
 })
 export class AnalyticsService {
   private baseUrl = 'http://localhost:8000/api/analytics';
+  // Las vistas de analytics requieren sesión: todas las peticiones envían la cookie
 
   constructor(private http: HttpClient) { }
 
@@ -110,14 +111,14 @@ export class AnalyticsService {
     if (month) params = params.set('month', month);
     if (week) params = params.set('week', week);
 
-    return this.http.get<DashboardOverview>(`${this.baseUrl}/dashboard-overview/`, { params });
+    return this.http.get<DashboardOverview>(`${this.baseUrl}/dashboard-overview/`, { params, withCredentials: true });
   }
 
   getMonthlyComparison(year?: string): Observable<MonthlyComparison> {
     let params = new HttpParams();
     if (year) params = params.set('year', year);
 
-    return this.http.get<MonthlyComparison>(`${this.baseUrl}/monthly-comparison/`, { params });
+    return this.http.get<MonthlyComparison>(`${this.baseUrl}/monthly-comparison/`, { params, withCredentials: true });
   }
 
   getPriceTrends(year?: string, month?: string): Observable<PriceTrends> {
@@ -125,7 +126,7 @@ export class AnalyticsService {
     if (year) params = params.set('year', year);
     if (month) params = params.set('month', month);
 
-    return this.http.get<PriceTrends>(`${this.baseUrl}/price-trends/`, { params });
+    return this.http.get<PriceTrends>(`${this.baseUrl}/price-trends/`, { params, withCredentials: true });
   }
 
   getSupermarketSavings(year?: string, month?: string): Observable<SupermarketSavings> {
@@ -133,19 +134,19 @@ export class AnalyticsService {
     if (year) params = params.set('year', year);
     if (month) params = params.set('month', month);
 
-    return this.http.get<SupermarketSavings>(`${this.baseUrl}/supermarket-savings/`, { params });
+    return this.http.get<SupermarketSavings>(`${this.baseUrl}/supermarket-savings/`, { params, withCredentials: true });
   }
 
   getSpendingTrend(period: 'monthly' | 'weekly' | 'yearly' = 'monthly'): Observable<any> {
     const params = new HttpParams().set('period', period);
-    return this.http.get(`${this.baseUrl}/spending-trend/`, { params });
+    return this.http.get(`${this.baseUrl}/spending-trend/`, { params, withCredentials: true });
   }
 
   getTopProducts(): Observable<any> {
-    return this.http.get(`${this.baseUrl}/top-products/`);
+    return this.http.get(`${this.baseUrl}/top-products/`, { withCredentials: true });
   }
 
   getSupermarketRanking(): Observable<any> {
-    return this.http.get(`${this.baseUrl}/supermarket-ranking/`);
+    return this.http.get(`${this.baseUrl}/supermarket-ranking/`, { withCredentials: true });
   }
 }